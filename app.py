@@ -14,99 +14,13 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from datetime import datetime
-
 import aws_cdk as cdk
-import yaml
 from cdk_nag import AwsSolutionsChecks, NagPackSuppression, NagSuppressions
-from cerberus import Validator
 
 from cdk.ci_log_based_dashboard_stack import ContainerInsightsLogBasedDashboardStack
+from cdk.dashboard_configuration import load_dashboard_configuration
 
-
-def _load_dashboard_configuration():
-    """
-    Validate the "dashboard_configuration.yaml" schema
-    """
-
-    dashboard_conf_filename = "dashboard_configuration.yaml"
-    coerce_date = lambda d: datetime.strptime(d, "%Y-%m-%dT%H:%M:%S")
-    with open(dashboard_conf_filename, "r", encoding="utf8") as dashboard_conf_yaml:
-        schema = {
-            "name": {"type": "string", "regex": "[A-Za-z0-9-_]+"},
-            "clusterName": {"type": "string", "regex": "^[0-9A-Za-z][A-Za-z0-9\-_]+$"},
-            "timeToLiveInMinutes": {"min": 1, "max": 43800},
-            "investigationWindow": {
-                "type": "dict",
-                "schema": {
-                    "from": {
-                        "type": "datetime",
-                        "coerce": coerce_date,
-                    },
-                    "to": {
-                        "type": "datetime",
-                        "coerce": coerce_date,
-                    },
-                },
-            },
-            "contents": {
-                "type": "dict",
-                "schema": {
-                    "node": {
-                        "type": "dict",
-                        "schema": {
-                            "enabled": {"type": "boolean"},
-                            "metrics": {
-                                "type": "list",
-                                "schema": {
-                                    "type": "string",
-                                    "regex": "^node_.*",
-                                },
-                            },
-                        },
-                    },
-                    "pod": {
-                        "type": "dict",
-                        "schema": {
-                            "enabled": {"type": "boolean"},
-                            "namespaces": {"type": "list"},
-                            "metrics": {
-                                "type": "list",
-                                "schema": {
-                                    "type": "string",
-                                    "regex": "^pod_.*",
-                                },
-                            },
-                        },
-                    },
-                    "container": {
-                        "type": "dict",
-                        "schema": {
-                            "enabled": {"type": "boolean"},
-                            "namespaces": {"type": "list"},
-                            "metrics": {
-                                "type": "list",
-                                "schema": {
-                                    "type": "string",
-                                    "regex": "^[container_|number_of_container_restarts].*",
-                                },
-                            },
-                        },
-                    },
-                },
-            },
-        }
-        dashboard_conf = yaml.safe_load(dashboard_conf_yaml)
-        validator = Validator(schema)
-        if not validator.validate(dashboard_conf):
-            raise Exception(
-                f'Dashboards configuration file "{dashboard_conf_filename}" is invalid: {validator.errors}'
-            )
-
-    return dashboard_conf
-
-
-dashboard_conf = _load_dashboard_configuration()
+dashboard_conf = load_dashboard_configuration()
 
 app = cdk.App(context={"dashboardConfiguration": dashboard_conf})
 stack = ContainerInsightsLogBasedDashboardStack(
@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import logging
+import os
+from functools import lru_cache
+
+import boto3
+from botocore.exceptions import ClientError
+from container_insights.query_store import get_query_store, resolve_query_handles
+from crhelper import CfnResource
+
+LOGGER = logging.getLogger(__name__)
+
+helper = CfnResource(
+    log_level="INFO",
+    boto_level="CRITICAL",
+)
+
+QUERY_STORE = get_query_store(os.environ.get("QUERY_STORE_URI", ""))
+
+
+@lru_cache(maxsize=None)
+def get_cloudwatch_client():
+    """CloudWatch client, created on first use"""
+    return boto3.client("cloudwatch")
+
+
+@helper.create
+@helper.update
+def put_dashboard(event, context):
+    """
+    Put the dashboard during CloudFormation Create and Update events, the query handles
+    of its widgets being resolved into the stored metric queries.
+    The dashboard name is the physical resource ID, so that renaming a dashboard
+    deletes the former one.
+    """
+
+    properties = event["ResourceProperties"]
+    response = get_cloudwatch_client().put_dashboard(
+        DashboardName=properties["iDashboardName"],
+        DashboardBody=resolve_query_handles(properties["iDashboardBody"], QUERY_STORE),
+    )
+    for message in response.get("DashboardValidationMessages", []):
+        LOGGER.warning(
+            f'Dashboard "{properties["iDashboardName"]}" validation message: {message}'
+        )
+
+    LOGGER.info(f'Dashboard "{properties["iDashboardName"]}" put')
+    return properties["iDashboardName"]
+
+
+@helper.delete
+def delete_dashboard(event, _):
+    """Delete the dashboard during CloudFormation Delete events, if it was ever put"""
+
+    try:
+        get_cloudwatch_client().delete_dashboards(
+            DashboardNames=[event["PhysicalResourceId"]]
+        )
+    except ClientError as ex:
+        if ex.response["Error"]["Code"] != "ResourceNotFound":
+            raise
+        LOGGER.info(f'Dashboard "{event["PhysicalResourceId"]}" not found')
+
+
+def handler(event, context):
+    helper(event, context)
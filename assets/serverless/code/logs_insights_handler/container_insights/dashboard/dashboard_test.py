@@ -0,0 +1,121 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import json
+
+import container_insights.dashboard
+import pytest
+from botocore.stub import Stubber
+from container_insights.dashboard import delete_dashboard, put_dashboard
+from container_insights.query_store import LocalQueryStore, get_query_handle
+
+METRIC_QUERY = (
+    'fields {metric} | filter Type = \\"Pod\\" | stats max({metric}) by bin(1m)'
+)
+
+
+def get_dashboard_body(query: str) -> str:
+    """Dashboard body of a single log widget, as synthesized by the stack"""
+
+    return (
+        '{"widgets":[{"type":"log","width":8,"height":8,"x":0,"y":0,"properties":'
+        f'{{"view":"timeSeries","query":"SOURCE \'log-group\' | {query}"}}}}]}}'
+    )
+
+
+@pytest.mark.parametrize("query_handle", [False, True])
+def test_put_dashboard(mocker, tmp_path, query_handle):
+    query_store = LocalQueryStore(str(tmp_path))
+    query_store.put("PodMetricQuery/digest/oQuery", METRIC_QUERY)
+    mocker.patch.object(container_insights.dashboard, "QUERY_STORE", query_store)
+    query = (
+        get_query_handle("PodMetricQuery/digest/oQuery", "pod_cpu_utilization")
+        if query_handle
+        else METRIC_QUERY
+    )
+    event = {
+        "RequestType": "Create",
+        "ResourceProperties": {
+            "iDashboardName": "Incident_DEMO_1234-PodMetrics-kube-system",
+            "iDashboardBody": get_dashboard_body(
+                "pod_cpu_utilization".join(query.split("{metric}"))
+            ),
+        },
+    }
+    expected_body = get_dashboard_body(
+        "pod_cpu_utilization".join(METRIC_QUERY.split("{metric}"))
+    )
+
+    cloudwatch_stubber = Stubber(container_insights.dashboard.get_cloudwatch_client())
+    cloudwatch_stubber.add_response(
+        "put_dashboard",
+        {"DashboardValidationMessages": []},
+        {
+            "DashboardName": "Incident_DEMO_1234-PodMetrics-kube-system",
+            "DashboardBody": expected_body,
+        },
+    )
+    with cloudwatch_stubber:
+        assert put_dashboard(event, {}) == "Incident_DEMO_1234-PodMetrics-kube-system"
+
+    cloudwatch_stubber.assert_no_pending_responses()
+    # Resolved queries keep the JSON escaping of the generic metric queries
+    assert json.loads(expected_body)["widgets"][0]["properties"]["query"] == (
+        "SOURCE 'log-group' | fields pod_cpu_utilization "
+        '| filter Type = "Pod" | stats max(pod_cpu_utilization) by bin(1m)'
+    )
+
+
+@pytest.mark.parametrize("not_found", [False, True])
+def test_delete_dashboard(not_found):
+    event = {
+        "RequestType": "Delete",
+        "PhysicalResourceId": "Incident_DEMO_1234-PodMetrics-kube-system",
+        "ResourceProperties": {},
+    }
+
+    cloudwatch_stubber = Stubber(container_insights.dashboard.get_cloudwatch_client())
+    if not_found:
+        # Dashboards failing to be created are deleted on rollback all the same
+        cloudwatch_stubber.add_client_error(
+            "delete_dashboards", service_error_code="ResourceNotFound"
+        )
+    else:
+        cloudwatch_stubber.add_response(
+            "delete_dashboards",
+            {},
+            {"DashboardNames": ["Incident_DEMO_1234-PodMetrics-kube-system"]},
+        )
+    with cloudwatch_stubber:
+        delete_dashboard(event, {})
+
+    cloudwatch_stubber.assert_no_pending_responses()
+
+
+def test_delete_dashboard_error():
+    event = {
+        "RequestType": "Delete",
+        "PhysicalResourceId": "Incident_DEMO_1234-PodMetrics-kube-system",
+        "ResourceProperties": {},
+    }
+
+    cloudwatch_stubber = Stubber(container_insights.dashboard.get_cloudwatch_client())
+    cloudwatch_stubber.add_client_error(
+        "delete_dashboards", service_error_code="AccessDenied"
+    )
+    with cloudwatch_stubber, pytest.raises(Exception):
+        delete_dashboard(event, {})
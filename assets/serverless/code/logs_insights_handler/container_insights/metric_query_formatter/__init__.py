@@ -15,20 +15,39 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import logging
+from functools import lru_cache
+from typing import Tuple
 
-import boto3
 from crhelper import CfnResource
 
 LOGGER = logging.getLogger(__name__)
 
-LOGS_CLIENT = boto3.client("logs")
-
 helper = CfnResource(
     log_level="DEBUG",
     boto_level="CRITICAL",
 )
 
 
+METRIC_PLACEHOLDER = "{metric}"
+
+
+@lru_cache(maxsize=128)
+def tokenize_query(query: str) -> Tuple[str, ...]:
+    """
+    Split a generic metric query on its metric placeholders once, so that formatting it
+    for every metric is a mere join, immune to any other brace found in the query (eg.
+    in pod names).
+    """
+
+    return tuple(query.split(METRIC_PLACEHOLDER))
+
+
+def format_tokenized_query(tokens: Tuple[str, ...], metric: str) -> str:
+    """Format a tokenized generic metric query with a specific metric name"""
+
+    return metric.join(tokens)
+
+
 @helper.create
 @helper.update
 def format_query(event, context):
@@ -36,16 +55,16 @@ def format_query(event, context):
     Format the query with a specific metric name during CloudFormation Create and Update
     events.
     """
-    helper.Data["oFormattedQuery"] = str(event["ResourceProperties"]["iQuery"]).format(
-        metric=event["ResourceProperties"]["iMetric"]
-    )
 
+    properties = event["ResourceProperties"]
+    helper.Data["oFormattedQuery"] = format_tokenized_query(
+        tokenize_query(str(properties["iQuery"])), properties["iMetric"]
+    )
     LOGGER.info(f'Formatted query: {helper.Data["oFormattedQuery"]}')
 
     return True
 
 
-@helper.update
 @helper.delete
 def no_op(_, __):
     return True
@@ -35,3 +35,19 @@ def test_format_query(mocker):
 | filter Type = "Pod" and Namespace = "eks-baseline-services"
 | stats max(pod_network_total_bytes * pod1) as `cert-manager-webhook`, max(pod_network_total_bytes * pod2) as `cluster-autoscaler-aws-cluster-autoscaler`, max(pod_network_total_bytes * pod3) as `coredns`, max(pod_network_total_bytes * pod4) as `kube-proxy`, max(pod_network_total_bytes * pod5) as `opentelemetry-operator-controller-manager`, max(pod_network_total_bytes * pod6) as `gatekeeper-controller-manager`, max(pod_network_total_bytes * pod7) as `aws-load-balancer-controller`, max(pod_network_total_bytes * pod8) as `cert-manager`, max(pod_network_total_bytes * pod9) as `aws-for-fluent-bit`, max(pod_network_total_bytes * pod10) as `container-insights-metrics-opentelemetry-collector-agent`, max(pod_network_total_bytes * pod11) as `cert-manager-cainjector`, max(pod_network_total_bytes * pod12) as `metrics-server`, max(pod_network_total_bytes * pod13) as `csi-secrets-store-provider-aws`, max(pod_network_total_bytes * pod14) as `csi-secrets-store-provider-aws-secrets-store-csi-driver`, max(pod_network_total_bytes * pod15) as `aws-node`, max(pod_network_total_bytes * pod16) as `gatekeeper-audit` by bin(1m)"""
     )
+
+
+def test_format_query_stray_braces(mocker):
+    event = {
+        "RequestType": "Create",
+        "ResourceProperties": {
+            "iQuery": 'fields {metric}, (PodName = \\"web-{a}\\") as pod1 | stats sum({metric} * pod1) as `web-{a}` by bin(1m)',
+            "iMetric": "pod_cpu_utilization",
+        },
+    }
+
+    assert format_query(event, {}) == True
+    assert (
+        helper.Data["oFormattedQuery"]
+        == 'fields pod_cpu_utilization, (PodName = \\"web-{a}\\") as pod1 | stats sum(pod_cpu_utilization * pod1) as `web-{a}` by bin(1m)'
+    )
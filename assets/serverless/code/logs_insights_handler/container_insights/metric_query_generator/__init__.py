@@ -14,37 +14,474 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import json
 import logging
+import math
+import os
+import re
+import time
 from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
 
-import boto3
+from container_insights.metric_query_generator.lookup_cache import (
+    LOOKUP_CACHE_SETTLING_TIME,
+    LOOKUP_RESULTS_EXCLUDED_PROPERTIES,
+    get_lookup_cache,
+    get_lookup_cache_key,
+    get_lookup_results_cache_key,
+    is_cacheable,
+)
+from container_insights.metric_query_generator.namespace_selector import (
+    match_namespace,
+)
+from container_insights.metric_query_generator.query_results import QueryResults
+from container_insights.metric_query_generator.query_scheduler import (
+    QueryScheduler,
+    get_logs_client,
+)
+from container_insights.metric_query_generator.template_registry import (
+    QUERY_TEMPLATE_REGISTRY,
+)
+from container_insights.query_store import (
+    QUERY_KEY_PREFIX_ATTRIBUTE,
+    get_query_key_prefix,
+    get_query_store,
+)
 from crhelper import CfnResource
+from jinja2 import Template
 
 LOGGER = logging.getLogger(__name__)
 
-LOGS_CLIENT = boto3.client("logs")
+# Physical resource ID of the lookup queries deferred by the concurrency cap
+DEFERRED_QUERY_ID = "deferred"
+# Separator of the query IDs of time sliced lookup queries
+QUERY_ID_SEPARATOR = ","
+
+# Attributes of the resources sharing their lookup query with other resources
+# ("iSharedLookup"): the query IDs of the lookup query and the start of the time range it
+# scanned, read back by the other resources ("iLookupQueryId", "iLookupStartTime")
+SHARED_LOOKUP_ATTRIBUTES = ["oLookupQueryId", "oLookupStartTime"]
+
+COUNT_FIELD = "count()"
+RANK_FIELD = "rank"
+
+LOOKUP_CACHE = get_lookup_cache(os.environ.get("LOOKUP_CACHE_URI", ""))
+
+QUERY_STORE = get_query_store(os.environ.get("QUERY_STORE_URI", ""))
+
+# CloudFormation caps custom resource responses at 4 KB, the status, reason and IDs
+# included, responses exceeding this budget are rejected (see _store_metric_queries)
+MAX_RESPONSE_DATA_SIZE = 3072
+
+
+class InvocationPollingCfnResource(CfnResource):
+    """
+    CfnResource answering CloudFormation right away when a request handler flags the
+    request as complete, instead of going through the crhelper poll cycle which sets up
+    an EventBridge rule and only checks the request every few minutes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._completed = False
+
+    def complete(self):
+        """Flag the current request as complete, skipping the crhelper poll cycle"""
+        self._completed = True
+
+    def update_poll_data(self):
+        """
+        Hand the current data over to the next polls, the crhelper poll cycle otherwise
+        replaying the data of the request which set it up. The EventBridge rule target
+        triggering the polls is updated with it.
+        """
+
+        self._event["CrHelperData"] = self.Data
+        self._put_targets(self._context.function_name)
+
+    def _crhelper_init(self, event, context):
+        self._completed = False
+        return super()._crhelper_init(event, context)
+
+    def _poll_enabled(self):
+        return not self._completed and super()._poll_enabled()
+
 
-helper = CfnResource(
+helper = InvocationPollingCfnResource(
     log_level="INFO",
     boto_level="CRITICAL",
 )
 
 METRIC_QUERY_GENERATOR = None
 
+# In-invocation lookup query polling, with an exponential backoff between the
+# get_query_results calls
+LOOKUP_POLLING_BUDGET = float(os.environ.get("LOOKUP_POLLING_BUDGET_SECONDS", "30"))
+# Time kept to assemble the metric queries and answer CloudFormation
+LOOKUP_POLLING_SAFETY_MARGIN = 10
+
+# Logs Insights query string length limit
+DEFAULT_MAX_QUERY_LENGTH = 10000
+
+# Logs Insights results limit, lookup queries returning as many results are truncated
+MAX_LOOKUP_RESULTS = 10000
+
+METRIC_PLACEHOLDER = "{metric}"
+
+# Container Insights agents write the performance logs of a node to a log stream named
+# after the node (see calculator/adot_conf.yaml.j2)
+LOG_STREAM_NAME_FIELD = "NodeName"
+
+# Restricts a metric query to the log streams holding the logs of its series
+LOG_STREAM_FILTER_TEMPLATE = (
+    "{% if log_streams %}"
+    'filter @logStream in [{% for log_stream in log_streams %}\\"{{ log_stream }}\\"{{ ", " if not loop.last }}{% endfor %}] | '
+    "{% endif %}"
+)
+
+# Number of bins a metric query aims at over the investigation window, the bin period
+# growing with the window length so that the widgets stay within the Logs Insights
+# results limit and quick to render
+DEFAULT_TARGET_POINT_COUNT = 1440
+
+# Bin periods to choose from, in seconds, Container Insights emitting performance logs
+# every minute
+BIN_PERIODS = {
+    60: "1m",
+    120: "2m",
+    300: "5m",
+    600: "10m",
+    900: "15m",
+    1800: "30m",
+    3600: "1h",
+    7200: "2h",
+    10800: "3h",
+    21600: "6h",
+    43200: "12h",
+    86400: "1d",
+}
+
+# Placeholder query for shards left without any series, which never matches any log
+# event, and thus any bin
+EMPTY_SHARD_QUERY = (
+    "fields {metric} "
+    '| filter Type = \\"EmptyShard\\" and ispresent({metric}) '
+    "| stats count() as `no series` "
+    "by bin(1m)"
+)
+
 
 class MetricQueryGenerator(ABC):
-    """Abstract Metric Query Generator class"""
+    """
+    Abstract Metric Query Generator class.
+
+    Concrete generators combine the mixins matching what they do: LookupQueryMixin when
+    their series are collected via a lookup query, LogStreamTargetingMixin when their
+    metric queries can be restricted to the log streams of their series, and
+    MetricQueryRenderingMixin when they render their metric queries out of their own
+    QUERY_TEMPLATE.
+    """
+
+    QUERY_TEMPLATE: str = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.QUERY_TEMPLATE is not None:
+            QUERY_TEMPLATE_REGISTRY.register(cls.__name__, cls.QUERY_TEMPLATE)
+
+    @property
+    def query_template(self) -> Template:
+        """The compiled QUERY_TEMPLATE, shared by every instance within the process"""
+        return QUERY_TEMPLATE_REGISTRY.get_template(type(self).__name__)
+
+    @property
+    def template_fingerprint(self) -> str:
+        """
+        Fingerprint of the templates the metric queries are rendered with, keying the
+        lookup cache entries
+        """
+        return QUERY_TEMPLATE_REGISTRY.get_fingerprint([type(self).__name__])
+
+    def has_lookup_query(self, event) -> bool:
+        """Whether the series are collected via a lookup query, rather than known upfront"""
+        return False
+
+    @abstractmethod
+    def get_series(self, event, response) -> Any:
+        """Extract the series to be plotted from the lookup query results"""
+        pass
+
+    def get_log_streams(self, event, response) -> Optional[Dict[Any, Set[str]]]:
+        """
+        The log streams holding the logs of every series, None when the metric queries
+        are not restricted to log streams.
+        """
+        return None
+
+    def select_top_k_results(
+        self, event, results: List[List[Dict[str, str]]]
+    ) -> List[List[Dict[str, str]]]:
+        """
+        The lookup query results of the "iTopK" heaviest series, ranked by descending
+        rank, every result being a distinct series.
+        """
+        return results[: int(event["ResourceProperties"]["iTopK"])]
+
+    @abstractmethod
+    def set_metric_queries(self, event, response, attribute_name: str = "oQuery"):
+        """Expose the generic metric queries as custom resource attributes"""
+        pass
+
+
+class LookupQueryMixin(MetricQueryGenerator):
+    """Metric Query Generator whose series are collected via a lookup query"""
+
+    def has_lookup_query(self, event) -> bool:
+        """The series are collected via the lookup query"""
+        return True
 
     @abstractmethod
     def generate_lookup_query(self, event) -> str:
         """Generate the lookup query"""
         pass
 
+    def generate_top_k_stats(
+        self, event, group_by: str, distinct_series: bool = True
+    ) -> str:
+        """
+        Generate the lookup query stats command ranking the series by a given statistic of
+        the "iTopKMetric" metric, and keeping only the "iTopK" heaviest ones.
+        A multi-namespace lookup keeps every ranked series, the "iTopK" heaviest ones are
+        selected per namespace selector afterwards. So does a lookup whose results are not
+        distinct series ("distinct_series"), eg. a pod reported once per log stream, the
+        "iTopK" heaviest series spanning more than "iTopK" results.
+        """
+
+        properties = event["ResourceProperties"]
+        metric = properties["iTopKMetric"]
+        statistic = properties.get("iTopKStatistic", "max")
+        if percentile := re.fullmatch(r"p([0-9]{1,2})", statistic):
+            aggregation = f"pct({metric}, {percentile.group(1)})"
+        else:
+            aggregation = f"{statistic}({metric})"
+
+        stats = f"stats {aggregation} as rank by {group_by} | sort rank desc"
+        if "iNamespaces" in properties or not distinct_series:
+            return stats
+        return f"{stats} | limit {int(properties['iTopK'])}"
+
+
+class LogStreamTargetingMixin(MetricQueryGenerator):
+    """
+    Metric Query Generator attributing the lookup query results to its series, so that
+    its metric queries can be restricted to the log streams, named after the nodes, of
+    their series ("iTargetLogStreams")
+    """
+
+    @abstractmethod
+    def get_result_series(self, event, results: QueryResults) -> List[Any]:
+        """
+        The series of every lookup query result, a same series being reported by several
+        results when its logs span several log streams (eg. a pod rescheduled on another
+        node)
+        """
+        pass
+
+    def get_log_streams(self, event, response) -> Optional[Dict[Any, Set[str]]]:
+        """
+        The log streams holding the logs of every series, None when the metric queries
+        are not restricted to log streams ("iTargetLogStreams").
+        """
+
+        if not is_log_stream_targeted(event):
+            return None
+
+        results = QueryResults.from_response(response)
+        log_streams = dict()
+        for series, log_stream in zip(
+            self.get_result_series(event, results),
+            results.column(LOG_STREAM_NAME_FIELD),
+        ):
+            if log_stream is not None:
+                log_streams.setdefault(series, set()).add(log_stream)
+        return log_streams
+
+    def select_top_k_results(
+        self, event, results: List[List[Dict[str, str]]]
+    ) -> List[List[Dict[str, str]]]:
+        """
+        The lookup query results of the "iTopK" heaviest series, every series being ranked
+        by its highest rank. A series reported by several results (eg. a pod whose logs
+        span several log streams) counts once, and keeps all of its results.
+        """
+
+        query_results = QueryResults(results)
+        result_series = self.get_result_series(event, query_results)
+        ranks = dict()
+        for series, rank in zip(result_series, query_results.column(RANK_FIELD, "0")):
+            ranks[series] = max(ranks.get(series, float(rank)), float(rank))
+        top_k_series = set(
+            sorted(ranks, key=ranks.get, reverse=True)[
+                : int(event["ResourceProperties"]["iTopK"])
+            ]
+        )
+        return [
+            result
+            for result, series in zip(results, result_series)
+            if series in top_k_series
+        ]
+
+
+class MetricQueryRenderingMixin(MetricQueryGenerator):
+    """Metric Query Generator rendering its metric queries out of its QUERY_TEMPLATE"""
+
     @abstractmethod
+    def render_metric_query(
+        self, event, series: List[Any], log_streams: Optional[List[str]] = None
+    ) -> str:
+        """
+        Render the metric query for a given list of series, restricted to the given log
+        streams if any
+        """
+        pass
+
     def generate_metric_query(self, event, response) -> str:
         """Generate the metric query"""
-        pass
+
+        series = self.get_series(event, response)
+        return self.render_metric_query(
+            event,
+            series,
+            select_log_streams(self.get_log_streams(event, response), series),
+        )
+
+    def generate_metric_queries(self, event, response) -> List[str]:
+        """
+        Generate "iShardCount" metric queries, the series being evenly split across them.
+        Every shard query must fit within the Logs Insights query length budget once
+        formatted with the longest metric name.
+        """
+
+        shard_count = int(event["ResourceProperties"].get("iShardCount", 1))
+        series = self.get_series(event, response)
+        log_streams = self.get_log_streams(event, response)
+        shard_size, remainder = divmod(len(series), shard_count)
+
+        queries = []
+        start = 0
+        for shard in range(shard_count):
+            end = start + shard_size + (1 if shard < remainder else 0)
+            if start == end:
+                queries.append(EMPTY_SHARD_QUERY)
+                continue
+
+            query = self.render_metric_query(
+                event,
+                series[start:end],
+                select_log_streams(log_streams, series[start:end]),
+            )
+            check_metric_query_length(
+                event, query, f"Metric query shard {shard + 1}/{shard_count}"
+            )
+            queries.append(query)
+            start = end
+
+        return queries
+
+    def set_metric_queries(self, event, response, attribute_name: str = "oQuery"):
+        """
+        Expose the generated metric query, or its shards, as custom resource attributes.
+        When the lookup spans several namespace selectors ("iNamespaces"), the lookup
+        results are fanned out and one generic metric query is exposed per selector as
+        "<attribute_name>Namespace<N>".
+        Top K lookups keep the results of the "iTopK" heaviest series, per namespace
+        selector if any.
+        """
+
+        properties = event["ResourceProperties"]
+        if (namespace_selectors := properties.get("iNamespaces", None)) is None:
+            if "iTopK" in properties:
+                response = {
+                    **response,
+                    "results": self.select_top_k_results(event, response["results"]),
+                }
+            self._set_metric_query_shards(event, response, attribute_name)
+            return
+
+        query_id = event["CrHelperData"]["PhysicalResourceId"]
+        namespaces = QueryResults.from_response(response).column("Namespace", "")
+        for index, namespace_selector in enumerate(namespace_selectors, start=1):
+            results = [
+                result
+                for result, namespace in zip(response["results"], namespaces)
+                if match_namespace(namespace_selector, namespace)
+            ]
+            if not results:
+                raise Exception(
+                    f'Query ID "{query_id}" didnt return any result for namespace "{namespace_selector}", please double check the correctness of the provided investigation window'
+                )
+            if "iTopK" in properties:
+                results = self.select_top_k_results(event, results)
+
+            self._set_metric_query_shards(
+                event,
+                {**response, "results": results},
+                f"{attribute_name}Namespace{index}",
+            )
+
+    def _set_metric_query_shards(self, event, response, attribute_name: str):
+        if int(event["ResourceProperties"].get("iShardCount", 1)) > 1:
+            for shard, query in enumerate(
+                self.generate_metric_queries(event, response), start=1
+            ):
+                helper.Data[f"{attribute_name}Shard{shard}"] = query
+        else:
+            query = self.generate_metric_query(event, response)
+            check_metric_query_length(event, query)
+            helper.Data[attribute_name] = query
+
+
+def is_log_stream_targeted(event) -> bool:
+    """Whether the metric queries are restricted to the log streams of their series"""
+    return event.get("ResourceProperties", {}).get("iTargetLogStreams", "") == "true"
+
+
+def select_log_streams(
+    log_streams: Optional[Dict[Any, Set[str]]], series: List[Any]
+) -> Optional[List[str]]:
+    """The log streams holding the logs of any of the given series, if targeted"""
+
+    if log_streams is None:
+        return None
+    return sorted(set().union(*(log_streams.get(key, set()) for key in series)))
+
+
+def get_formatted_query_length(query: str, max_metric_name_length: int) -> int:
+    """Length of a generic metric query once formatted with a given metric name length"""
+    return len(query) + query.count(METRIC_PLACEHOLDER) * (
+        max_metric_name_length - len(METRIC_PLACEHOLDER)
+    )
+
+
+def check_metric_query_length(event, query: str, description: str = "Metric query"):
+    """
+    Fail when a generic metric query, once formatted with the longest metric name
+    ("iMaxMetricNameLength"), exceeds the Logs Insights query length budget
+    ("iMaxQueryLength"), rather than letting every widget of the query fail to render
+    """
+
+    properties = event["ResourceProperties"]
+    max_query_length = int(properties.get("iMaxQueryLength", DEFAULT_MAX_QUERY_LENGTH))
+    max_metric_name_length = int(
+        properties.get("iMaxMetricNameLength", len(METRIC_PLACEHOLDER))
+    )
+    if (
+        query_length := get_formatted_query_length(query, max_metric_name_length)
+    ) > max_query_length:
+        raise Exception(
+            f"{description} is {query_length} characters long, exceeding the {max_query_length} characters budget, please increase the number of shards"
+        )
 
 
 @helper.create
@@ -55,31 +492,94 @@ def create_query(event, context):
         1. Custom::ContainerInsights-NodeMetricQuery
         2. Custom::ContainerInsights-PodMetricQuery
         3. Custom::ContainerInsights-ContainerMetricQuery
+        4. Custom::ContainerInsights-DiscoveryMetricQuery
+        5. Custom::ContainerInsights-ClusterMetricQuery
+        6. Custom::ContainerInsights-NamespaceMetricQuery
+        7. Custom::ContainerInsights-ServiceMetricQuery
 
-    The lookup query is started against the given LogGroup.
+    The lookup query is started against the given LogGroup, and its results are polled
+    within the invocation for up to LOOKUP_POLLING_BUDGET seconds. Lookup queries
+    completing within that budget are answered right away, the longer ones are left to
+    the crhelper poll cycle.
+    When the Logs Insights concurrency cap is reached, the lookup query is deferred to
+    the crhelper poll cycle as well.
+    Metric queries found in the lookup cache are answered right away, without running
+    the lookup query at all.
+    Long investigation windows can be split into "iTimeSlices" sub-windows, scanned by
+    concurrent lookup queries whose query IDs are all kept in the physical resource ID.
+    Updates only extending the investigation window end reuse the cached lookup results
+    of the former window, and only scan the added time range.
+    Rollup metric queries, whose series are known upfront, are answered right away
+    without any lookup query.
+    A lookup query can be shared with other resources ("iSharedLookup"), which read its
+    results back ("iLookupQueryId") rather than scanning the log group again, so that
+    several resources, each answering its own metric queries within the custom resource
+    response budget, pay for a single scan.
+    Metric queries are stored in the query store, if any, and answered as the single
+    key prefix they are stored under.
     """
 
-    logs_insights_query = METRIC_QUERY_GENERATOR.generate_lookup_query(event)
+    if not METRIC_QUERY_GENERATOR.has_lookup_query(event):
+        METRIC_QUERY_GENERATOR.set_metric_queries(event, None)
+        _store_metric_queries(event)
+        helper.complete()
+        LOGGER.info("Rollup metric query, skipping the lookup query")
+        return True
+
+    if (metric_queries := _get_cached_metric_queries(event)) is not None:
+        helper.Data.update(metric_queries)
+        # Without any lookup query to share, the other resources run their own lookup
+        # query, unless they hit the lookup cache as well
+        if "iSharedLookup" in event["ResourceProperties"]:
+            helper.Data.update({name: "" for name in SHARED_LOOKUP_ATTRIBUTES})
+        _store_metric_queries(event)
+        helper.complete()
+        LOGGER.info("Lookup cache hit, skipping the lookup query")
+        return True
+
+    prior_lookup_results = _get_prior_lookup_results(event)
+    if _read_shared_lookup(event, prior_lookup_results):
+        helper.complete()
+        return True
 
-    try:
-        return LOGS_CLIENT.start_query(
-            logGroupName=event["ResourceProperties"]["iLogGroupName"],
-            startTime=int(
-                datetime.strptime(
-                    event["ResourceProperties"]["iStartTime"], "%Y-%m-%dT%H:%M:%S"
-                ).timestamp()
-            ),
-            endTime=int(
-                datetime.strptime(
-                    event["ResourceProperties"]["iEndTime"], "%Y-%m-%dT%H:%M:%S"
-                ).timestamp()
-            ),
-            queryString=logs_insights_query,
-        )["queryId"]
-    except Exception as ex:
-        error_msg = f'Could not start query "{logs_insights_query}", against log group "{event["ResourceProperties"]["iLogGroupName"]}"'
-        LOGGER.exception(error_msg)
-        raise Exception(error_msg) from ex
+    start_time = time.monotonic()
+    query_scheduler = QueryScheduler(get_logs_client())
+    start_query_parameters = _get_start_query_parameters(event, prior_lookup_results)
+    for time_slice, parameters in enumerate(start_query_parameters):
+        query_scheduler.submit(time_slice, **parameters)
+    responses = query_scheduler.run(_get_polling_budget(context))
+    polling_end_time = time.monotonic()
+
+    query_id = QUERY_ID_SEPARATOR.join(
+        query_scheduler.query_ids.get(time_slice, DEFERRED_QUERY_ID)
+        for time_slice in range(len(start_query_parameters))
+    )
+    if len(query_scheduler.query_ids) < len(start_query_parameters):
+        LOGGER.info(
+            "Logs Insights concurrency cap reached, deferring the lookup query to the crhelper poll cycle"
+        )
+        return query_id
+
+    if len(responses) < len(start_query_parameters):
+        LOGGER.info(
+            f'Lookup query "{query_id}" still running after {(polling_end_time - start_time) * 1000:.0f} ms and {query_scheduler.poll_count} get_query_results calls, falling back to the crhelper poll cycle'
+        )
+        return query_id
+
+    _set_metric_queries(
+        event,
+        query_id,
+        [responses[time_slice] for time_slice in range(len(start_query_parameters))],
+        prior_lookup_results,
+    )
+    helper.complete()
+
+    LOGGER.info(
+        f'Lookup query "{query_id}" completed within the invocation: '
+        f"start and polling {(polling_end_time - start_time) * 1000:.0f} ms over {query_scheduler.poll_count} get_query_results calls, "
+        f"metric queries generation {(time.monotonic() - polling_end_time) * 1000:.0f} ms"
+    )
+    return True
 
 
 @helper.poll_create
@@ -90,40 +590,444 @@ def poll_create_query(event, context):
         1. Custom::ContainerInsights-NodeMetricQuery
         2. Custom::ContainerInsights-PodMetricQuery
         3. Custom::ContainerInsights-ContainerMetricQuery
+        4. Custom::ContainerInsights-DiscoveryMetricQuery
 
     The lookup query resuls are collected and the final generic metric query is assembled.
+    When the lookup spans several namespace selectors ("iNamespaces"), one generic metric
+    query is assembled per selector and exposed as "oQueryNamespace<N>".
+    Deferred lookup queries are started and polled within the invocation. The query IDs
+    of those still running are handed over to the next polls, which resume them.
     """
 
-    query_id = event["CrHelperData"]["PhysicalResourceId"]
+    query_ids = event["CrHelperData"]["PhysicalResourceId"].split(QUERY_ID_SEPARATOR)
+    query_scheduler = QueryScheduler(get_logs_client())
 
-    try:
-        response = LOGS_CLIENT.get_query_results(queryId=query_id)
-    except Exception as ex:
-        error_msg = f'Could not get query results for query ID "{query_id}"'
-        LOGGER.exception(error_msg)
-        raise Exception(error_msg) from ex
+    prior_lookup_results = _get_prior_lookup_results(event)
+    start_query_parameters = _get_start_query_parameters(event, prior_lookup_results)
+    for time_slice, query_id in enumerate(query_ids):
+        if query_id == DEFERRED_QUERY_ID:
+            query_scheduler.submit(time_slice, **start_query_parameters[time_slice])
+        else:
+            query_scheduler.track(time_slice, query_id)
 
-    if (query_status := response.get("status", None)) not in ["Running", "Complete"]:
-        raise Exception(
-            f'Unexpected query status "{query_status}" for query ID "{query_id}"'
+    if DEFERRED_QUERY_ID in query_ids:
+        query_scheduler.run(
+            context.get_remaining_time_in_millis() / 1000 - LOOKUP_POLLING_SAFETY_MARGIN
+        )
+    else:
+        query_scheduler.poll_queries()
+
+    if len(query_scheduler.completed) < len(query_ids):
+        started_query_ids = QUERY_ID_SEPARATOR.join(
+            query_scheduler.query_ids.get(time_slice, DEFERRED_QUERY_ID)
+            for time_slice in range(len(query_ids))
+        )
+        if started_query_ids != event["CrHelperData"]["PhysicalResourceId"]:
+            helper.Data["PhysicalResourceId"] = started_query_ids
+            helper.update_poll_data()
+            LOGGER.info(
+                f'Lookup query IDs "{started_query_ids}" handed over to the next polls'
+            )
+        return False  # Continue polling
+
+    _set_metric_queries(
+        event,
+        QUERY_ID_SEPARATOR.join(
+            query_scheduler.query_ids[time_slice]
+            for time_slice in range(len(query_ids))
+        ),
+        [query_scheduler.completed[time_slice] for time_slice in range(len(query_ids))],
+        prior_lookup_results,
+    )
+    return True
+
+
+def _read_shared_lookup(event, prior_lookup_results: Optional[Dict[str, Any]]) -> bool:
+    """
+    Assemble the metric queries out of the results of the lookup query shared by another
+    resource ("iLookupQueryId"), if any. When the shared lookup query only scanned the
+    time range past a former window ("iLookupStartTime"), the lookup results of that
+    window must be found in the lookup cache. Returns False when the resource has to run
+    its own lookup query instead.
+    """
+
+    properties = event["ResourceProperties"]
+    if not (query_id := properties.get("iLookupQueryId", "")):
+        return False
+
+    lookup_start_time = int(properties["iLookupStartTime"])
+    if lookup_start_time <= _get_timestamp(properties["iStartTime"]):
+        prior_lookup_results = None
+    elif (
+        prior_lookup_results is None
+        or prior_lookup_results["settledTime"] < lookup_start_time
+    ):
+        LOGGER.info(
+            f'Shared lookup query "{query_id}" only scanned the extended window, running the lookup query of the whole window'
         )
-    elif query_status == "Complete" and not response.get("results", None):
+        return False
+
+    query_scheduler = QueryScheduler(get_logs_client())
+    query_ids = query_id.split(QUERY_ID_SEPARATOR)
+    for time_slice, slice_query_id in enumerate(query_ids):
+        query_scheduler.track(time_slice, slice_query_id)
+    query_scheduler.poll_queries()
+    if query_scheduler.running:
+        raise Exception(f'Shared lookup query "{query_id}" is still running')
+
+    _set_metric_queries(
+        event,
+        query_id,
+        [query_scheduler.completed[time_slice] for time_slice in range(len(query_ids))],
+        prior_lookup_results,
+    )
+    LOGGER.info(f'Metric queries assembled from the shared lookup query "{query_id}"')
+    return True
+
+
+def get_lookup_event(event) -> Dict[str, Any]:
+    """
+    The event the lookup query is generated with, the properties of the lookup query
+    shared with other resources ("iSharedLookup") taking precedence over the resource
+    properties (eg. every namespace selector, or every discovered content).
+    """
+
+    properties = event["ResourceProperties"]
+    if "iSharedLookup" not in properties:
+        return event
+
+    return {
+        **event,
+        "ResourceProperties": {
+            name: value
+            for name, value in {**properties, **properties["iSharedLookup"]}.items()
+            if name != "iSharedLookup"
+        },
+    }
+
+
+def _get_lookup_start_time(
+    event, prior_lookup_results: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Start of the time range scanned by the lookup query: the investigation window start,
+    or the settled time of the lookup results of a former window
+    """
+
+    start_time = _get_timestamp(event["ResourceProperties"]["iStartTime"])
+    if prior_lookup_results is None:
+        return start_time
+    return max(start_time, prior_lookup_results["settledTime"])
+
+
+def _get_start_query_parameters(
+    event, prior_lookup_results: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    StartQuery API parameters of the lookup query, one per time slice.
+    Given the lookup results of a former window, only the time range past their settled
+    time is scanned, split into as many slices as its share of the window.
+    """
+
+    start_time = _get_lookup_start_time(event, prior_lookup_results)
+    end_time = _get_timestamp(event["ResourceProperties"]["iEndTime"])
+    slice_count = int(event["ResourceProperties"].get("iTimeSlices", 1))
+    if prior_lookup_results is not None:
+        window_length = end_time - _get_timestamp(
+            event["ResourceProperties"]["iStartTime"]
+        )
+        slice_count = max(
+            1, math.ceil(slice_count * (end_time - start_time) / window_length)
+        )
+        LOGGER.info(
+            f"Investigation window extended, only scanning the {end_time - start_time} seconds past the former window"
+        )
+    logs_insights_query = METRIC_QUERY_GENERATOR.generate_lookup_query(
+        get_lookup_event(event)
+    )
+
+    return [
+        {
+            "logGroupName": event["ResourceProperties"]["iLogGroupName"],
+            "startTime": slice_start_time,
+            "endTime": slice_end_time,
+            "queryString": logs_insights_query,
+        }
+        for slice_start_time, slice_end_time in get_time_slices(
+            start_time, end_time, slice_count
+        )
+    ]
+
+
+def _get_timestamp(value: str) -> int:
+    return int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").timestamp())
+
+
+def get_bin_period(event) -> str:
+    """
+    Bin period of the metric queries: the "iPeriod" override if any, otherwise the
+    shortest period keeping the investigation window within the target point count.
+    """
+
+    properties = event.get("ResourceProperties", {})
+    if period := properties.get("iPeriod", None):
+        return period
+    if "iStartTime" not in properties or "iEndTime" not in properties:
+        return BIN_PERIODS[min(BIN_PERIODS)]
+
+    window_length = _get_timestamp(properties["iEndTime"]) - _get_timestamp(
+        properties["iStartTime"]
+    )
+    target_period = window_length / DEFAULT_TARGET_POINT_COUNT
+    for seconds, period in BIN_PERIODS.items():
+        if seconds >= target_period:
+            return period
+    return f"{math.ceil(target_period / 86400)}d"
+
+
+def get_time_slices(start_time: int, end_time: int, slice_count: int):
+    """Split a time window into "slice_count" contiguous sub-windows of even length"""
+
+    boundaries = [
+        start_time + (end_time - start_time) * index // slice_count
+        for index in range(slice_count + 1)
+    ]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def merge_lookup_responses(event, responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the responses of the time sliced lookup queries into a single response made
+    of the distinct series across the slices.
+    Top K lookup queries rank the series per slice, the slice ranks are merged with the
+    ranking statistic when it allows it (max), or approximated otherwise: avg by the
+    mean of the slice averages, percentiles by the highest slice percentile. Every
+    ranked result is kept, sorted by descending rank, the "iTopK" heaviest series being
+    selected along with the metric queries, as a series may span several results.
+    """
+
+    if len(responses) == 1:
+        return responses[0]
+
+    series = dict()
+    for response in responses:
+        for result in response["results"]:
+            key = tuple(
+                (field["field"], field["value"])
+                for field in result
+                if field["field"] not in [COUNT_FIELD, RANK_FIELD]
+            )
+            ranks = series.setdefault(key, [])
+            ranks.extend(
+                float(field["value"])
+                for field in result
+                if field["field"] == RANK_FIELD
+            )
+
+    properties = event["ResourceProperties"]
+    results = []
+    for key, ranks in series.items():
+        result = [{"field": field, "value": value} for field, value in key]
+        if ranks:
+            rank = (
+                sum(ranks) / len(ranks)
+                if properties.get("iTopKStatistic", "max") == "avg"
+                else max(ranks)
+            )
+            result.append({"field": RANK_FIELD, "value": str(rank)})
+        results.append(result)
+
+    if "iTopK" in properties:
+        results.sort(key=lambda result: float(result[-1]["value"]), reverse=True)
+
+    statistics = dict()
+    for response in responses:
+        for name, value in response.get("statistics", {}).items():
+            statistics[name] = statistics.get(name, 0) + value
+
+    return {"results": results, "statistics": statistics, "status": "Complete"}
+
+
+def _get_polling_budget(context) -> float:
+    """In-invocation polling budget, keeping enough time to answer CloudFormation"""
+
+    if LOOKUP_POLLING_BUDGET <= 0:
+        return 0
+
+    return min(
+        LOOKUP_POLLING_BUDGET,
+        context.get_remaining_time_in_millis() / 1000 - LOOKUP_POLLING_SAFETY_MARGIN,
+    )
+
+
+def _set_metric_queries(
+    event,
+    query_id: str,
+    responses: List[Dict[str, Any]],
+    prior_lookup_results: Optional[Dict[str, Any]] = None,
+):
+    """
+    Check the lookup query responses, merged with the lookup results of the former
+    window if any, and assemble the generic metric queries.
+    Lookup query responses reaching the Logs Insights results limit are rejected, as the
+    series past the limit would silently be missing from the dashboards (eg. a lookup
+    query serving many namespace selectors, or the discovery lookup query).
+    """
+
+    for slice_query_id, response in zip(query_id.split(QUERY_ID_SEPARATOR), responses):
+        if (query_status := response.get("status", None)) != "Complete":
+            raise Exception(
+                f'Unexpected query status "{query_status}" for query ID "{slice_query_id}"'
+            )
+        if (result_count := len(response.get("results", []))) >= MAX_LOOKUP_RESULTS:
+            raise Exception(
+                f'Query ID "{slice_query_id}" returned {result_count} results, reaching the Logs Insights results limit, please spread the namespaces over several contents or dashboards'
+            )
+
+    if prior_lookup_results is not None:
+        responses = [prior_lookup_results["response"], *responses]
+    response = merge_lookup_responses(event, responses)
+    if not response.get("results", None):
         raise Exception(
             f'Query ID "{query_id}" didnt return any result, please double check the correctness of the provided investigation window'
         )
 
-    if query_status == "Running":
-        return False  # Continue polling
+    METRIC_QUERY_GENERATOR.set_metric_queries(
+        {**event, "CrHelperData": {"PhysicalResourceId": query_id}}, response
+    )
+
+    if LOOKUP_CACHE is not None:
+        _cache_lookup_results(event, response)
+
+    if "iSharedLookup" in event["ResourceProperties"]:
+        helper.Data.update(
+            zip(
+                SHARED_LOOKUP_ATTRIBUTES,
+                [
+                    query_id,
+                    str(_get_lookup_start_time(event, prior_lookup_results)),
+                ],
+            )
+        )
+    _store_metric_queries(event)
+
+
+def _cache_lookup_results(event, response: Dict[str, Any]):
+    """Cache the metric queries, along with the lookup results they derive from"""
+
+    if is_cacheable(event):
+        LOOKUP_CACHE.put(
+            get_lookup_cache_key(event, METRIC_QUERY_GENERATOR.template_fingerprint),
+            {
+                name: value
+                for name, value in helper.Data.items()
+                if name.startswith("o") and name not in SHARED_LOOKUP_ATTRIBUTES
+            },
+        )
 
-    helper.Data["oQuery"] = METRIC_QUERY_GENERATOR.generate_metric_query(
-        event, response
+    # Lookup results of the window, up to the time past which late logs may still change
+    # them
+    end_time = _get_timestamp(event["ResourceProperties"]["iEndTime"])
+    LOOKUP_CACHE.put(
+        get_lookup_results_cache_key(
+            event, METRIC_QUERY_GENERATOR.template_fingerprint
+        ),
+        {
+            "endTime": end_time,
+            "settledTime": min(end_time, int(time.time()) - LOOKUP_CACHE_SETTLING_TIME),
+            "response": response,
+        },
     )
 
-    return True
+
+def _get_cached_metric_queries(event) -> Optional[Dict[str, str]]:
+    """The metric queries cached for the lookup query, None on cache miss"""
+
+    if LOOKUP_CACHE is None or not is_cacheable(event):
+        return None
+
+    return LOOKUP_CACHE.get(
+        get_lookup_cache_key(event, METRIC_QUERY_GENERATOR.template_fingerprint)
+    )
+
+
+def _get_prior_lookup_results(event) -> Optional[Dict[str, Any]]:
+    """
+    The cached lookup results of the former investigation window when an update only
+    extends the window end, None otherwise
+    """
+
+    if LOOKUP_CACHE is None or event.get("RequestType", None) != "Update":
+        return None
+
+    properties = event["ResourceProperties"]
+    old_properties = event.get("OldResourceProperties", {})
+    if any(
+        properties.get(name, None) != old_properties.get(name, None)
+        for name in set(properties) | set(old_properties)
+        if name not in LOOKUP_RESULTS_EXCLUDED_PROPERTIES
+    ):
+        return None
+
+    end_time = _get_timestamp(properties["iEndTime"])
+    if end_time <= _get_timestamp(old_properties["iEndTime"]):
+        return None
+
+    prior_lookup_results = LOOKUP_CACHE.get(
+        get_lookup_results_cache_key(event, METRIC_QUERY_GENERATOR.template_fingerprint)
+    )
+    if (
+        prior_lookup_results is None
+        or prior_lookup_results["endTime"] > end_time
+        or prior_lookup_results["settledTime"] >= end_time
+    ):
+        return None
+
+    return prior_lookup_results
+
+
+def _store_metric_queries(event):
+    """
+    Store the metric queries in the query store, if any, and answer the key prefix they
+    are stored under instead ("oQueryKeyPrefix"): a single attribute however many
+    metric queries the resource generates, the dashboards expanding it into the query
+    handles of their widgets. The lookup cache keeps the queries themselves, whose
+    stored copies would not outlive the resource.
+    Responses exceeding the custom resource response budget are rejected with an
+    explicit error, rather than failing on CloudFormation side.
+    """
+
+    if QUERY_STORE is not None:
+        key_prefix = get_query_key_prefix(event)
+        for name in [
+            name
+            for name in helper.Data
+            if name.startswith("o") and name not in SHARED_LOOKUP_ATTRIBUTES
+        ]:
+            QUERY_STORE.put(f"{key_prefix}{name}", helper.Data.pop(name))
+        helper.Data[QUERY_KEY_PREFIX_ATTRIBUTE] = key_prefix
+        LOGGER.info(f'Metric queries stored under "{key_prefix}"')
+
+    response_data_size = len(
+        json.dumps(
+            {name: value for name, value in helper.Data.items() if name.startswith("o")}
+        ).encode("utf-8")
+    )
+    if response_data_size > MAX_RESPONSE_DATA_SIZE:
+        raise Exception(
+            f'Metric queries add up to {response_data_size} bytes, exceeding the {MAX_RESPONSE_DATA_SIZE} bytes custom resource response budget, please enable the query references ("queryReferences")'
+        )
 
 
 @helper.delete
-def no_op(_, __):
+def delete_query(event, _):
+    """
+    Implementation for the CloudFormation delete events, deleting the stored metric
+    queries of the resource if any
+    """
+
+    if QUERY_STORE is not None:
+        QUERY_STORE.delete(get_query_key_prefix(event))
     return True
 
 
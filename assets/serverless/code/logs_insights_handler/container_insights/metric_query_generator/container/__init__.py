@@ -14,27 +14,49 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from container_insights.metric_query_generator import MetricQueryGenerator
-from jinja2 import BaseLoader, Environment
+from typing import List, Optional, Tuple
 
+from container_insights.metric_query_generator import (
+    LOG_STREAM_FILTER_TEMPLATE,
+    LOG_STREAM_NAME_FIELD,
+    LogStreamTargetingMixin,
+    LookupQueryMixin,
+    MetricQueryRenderingMixin,
+    get_bin_period,
+    is_log_stream_targeted,
+)
+from container_insights.metric_query_generator.namespace_selector import (
+    generate_namespace_filter,
+)
+from container_insights.metric_query_generator.query_results import QueryResults
 
-class ContainerMetricQueryGenerator(MetricQueryGenerator):
+
+class ContainerMetricQueryGenerator(
+    LookupQueryMixin, LogStreamTargetingMixin, MetricQueryRenderingMixin
+):
     """Concrete implementation of the Container specific Metric Query Generator class."""
 
-    QUERY_TEMPLATE = (
+    QUERY_TEMPLATE = LOG_STREAM_FILTER_TEMPLATE + (
+        "{% set multiple_namespaces = namespaces | length > 1 %}"
         "fields {metric}, "
-        "{% for pod_name in pod_container_mapping.keys() %}"
-        '(PodName = \\"{{ pod_name }}\\") as pod{{ loop.index }}, '
+        "{% for (namespace, pod_name), _ in pod_containers %}"
+        '({% if multiple_namespaces %}Namespace = \\"{{ namespace }}\\" and {% endif %}PodName = \\"{{ pod_name }}\\") as pod{{ loop.index }}, '
         "{% endfor %}"
         "{% for container_name in container_names %}"
         '(kubernetes.container_name = \\"{{ container_name }}\\") as container{{ loop.index }}{{ ", " if not loop.last else " " }}'
         "{% endfor %}"
-        '| filter (Type = \\"Container\\" or Type = \\"ContainerFS\\") and Namespace = \\"{{ namespace }}\\" and ispresent({metric}) '
+        '| filter (Type = \\"Container\\" or Type = \\"ContainerFS\\") and '
+        "{% if multiple_namespaces %}"
+        'Namespace in [{% for namespace in namespaces %}\\"{{ namespace }}\\"{{ ", " if not loop.last }}{% endfor %}] '
+        "{% else %}"
+        'Namespace = \\"{{ namespaces[0] }}\\" '
+        "{% endif %}"
+        "and ispresent({metric}) "
         "| stats "
-        "{% for pod_name in pod_container_mapping.keys() %}"
+        "{% for (namespace, pod_name), containers in pod_containers %}"
         "{% set outer_loop = loop %}"
-        "{% for container_name in pod_container_mapping[pod_name] %}"
-        'sum({metric} * pod{{ outer_loop.index }} * container{{ container_names.index(container_name) + 1 }}) / sum(pod{{ outer_loop.index }} * container{{ container_names.index(container_name) + 1 }}) as `{{ pod_name }} {{ container_name }}`{{ ", " if not (loop.last and outer_loop.last) else " " }}'
+        "{% for container_name, container_index in containers %}"
+        'sum({metric} * pod{{ outer_loop.index }} * container{{ container_index }}) / sum(pod{{ outer_loop.index }} * container{{ container_index }}) as `{% if multiple_namespaces %}{{ namespace }}/{% endif %}{{ pod_name }} {{ container_name }}`{{ ", " if not (loop.last and outer_loop.last) else " " }}'
         "{% endfor %}"
         "{% endfor %}"
         "by bin({{ period }})"
@@ -43,52 +65,115 @@ class ContainerMetricQueryGenerator(MetricQueryGenerator):
     def generate_lookup_query(self, event) -> str:
         """
         The Container lookup query is about retrieving all the container names as well as
-        their mapping with pod names.
+        their mapping with pod names, or only the top K ones when ranking the containers
+        by a given metric.
+        A single lookup query can serve several namespace selectors ("iNamespaces"), the
+        container names are then grouped by namespace as well.
+        Metric queries restricted to log streams ("iTargetLogStreams") need the nodes the
+        containers were running on as well.
         """
 
+        properties = event["ResourceProperties"]
+        if "iNamespaces" in properties:
+            fields = "Namespace, PodName, kubernetes.container_name"
+            namespace_filter = generate_namespace_filter(properties["iNamespaces"])
+        else:
+            fields = "PodName, kubernetes.container_name"
+            namespace_filter = f'Namespace = "{properties["iNamespace"]}"'
+        if is_log_stream_targeted(event):
+            fields += f", {LOG_STREAM_NAME_FIELD}"
+
+        if "iTopK" in properties:
+            return (
+                'fields {fields} | filter (Type = "Container" or Type = "ContainerFS") and {namespace_filter} and ispresent({metric}) | {stats}'
+            ).format(
+                fields=fields,
+                namespace_filter=namespace_filter,
+                metric=properties["iTopKMetric"],
+                stats=self.generate_top_k_stats(
+                    event, fields, distinct_series=not is_log_stream_targeted(event)
+                ),
+            )
+
         return (
-            'fields PodName, kubernetes.container_name | filter Type = "Container" and Namespace = "{namespace}" | stats count() by PodName, kubernetes.container_name'
-        ).format(namespace=event["ResourceProperties"]["iNamespace"])
+            'fields {fields} | filter Type = "Container" and {namespace_filter} | stats count() by {fields}'
+        ).format(fields=fields, namespace_filter=namespace_filter)
 
-    def generate_metric_query(self, event, response) -> str:
+    def get_series(self, event, response) -> List[Tuple[str, str, str]]:
         """
-        Thanks to the results collected via the lookup query, we can render the Container
-        metric query.
-        This query is not metric-specific but it is specific to container metrics.
-        The query will be formatted for a specific container metric at a later stage
-        thanks to the Custom::ContainerInsights-MetricQueryFormatter resource.
+        The Container series are the (namespace, pod name, container name) tuples collected
+        via the lookup query.
         """
 
-        pod_container_mapping = dict()
-
-        for result in response["results"]:
-            pod_name = next(
-                field["value"] for field in result if field["field"] == "PodName"
+        return list(
+            dict.fromkeys(
+                self.get_result_series(event, QueryResults.from_response(response))
             )
-            pod_container_mapping[pod_name] = pod_container_mapping.get(
-                pod_name, list()
+        )
+
+    def get_result_series(
+        self, event, results: QueryResults
+    ) -> List[Tuple[str, str, str]]:
+        return list(
+            zip(
+                results.column(
+                    "Namespace", event["ResourceProperties"].get("iNamespace")
+                ),
+                results.column("PodName"),
+                results.column("kubernetes.container_name"),
             )
+        )
+
+    def render_metric_query(
+        self,
+        event,
+        series: List[Tuple[str, str, str]],
+        log_streams: Optional[List[str]] = None,
+    ) -> str:
+        """
+        Thanks to the (namespace, pod name, container name) tuples collected via the lookup
+        query, we can render the Container metric query.
+        This query is not metric-specific but it is specific to container metrics.
+        The query will be formatted for every container metric of the dashboard at
+        deployment time, by the Fn::Split and Fn::Join intrinsic functions of the
+        dashboard widgets.
+        """
 
-            container_name = next(
-                field["value"]
-                for field in result
-                if field["field"] == "kubernetes.container_name"
+        pod_container_mapping = dict()
+        for namespace, pod_name, container_name in series:
+            pod_container_mapping[(namespace, pod_name)] = pod_container_mapping.get(
+                (namespace, pod_name), list()
             )
-            pod_container_mapping[pod_name].append(container_name)
+            pod_container_mapping[(namespace, pod_name)].append(container_name)
 
-        query_template = Environment(loader=BaseLoader()).from_string(
-            ContainerMetricQueryGenerator.QUERY_TEMPLATE
+        # Precomputed container name to alias index mapping, keeping the rendering linear
+        # in the number of (pod, container) pairs.
+        container_names = sorted(
+            {
+                container
+                for containers in pod_container_mapping.values()
+                for container in containers
+            }
         )
-        return query_template.render(
-            namespace=event["ResourceProperties"]["iNamespace"],
-            container_names=sorted(
-                {
-                    container
-                    for containers in pod_container_mapping.values()
-                    for container in containers
-                }
-            ),
-            pod_container_mapping=pod_container_mapping,
+        container_aliases = {
+            container_name: index
+            for index, container_name in enumerate(container_names, start=1)
+        }
+
+        return self.query_template.render(
+            log_streams=log_streams,
+            namespaces=list(dict.fromkeys(namespace for namespace, _, _ in series)),
+            container_names=container_names,
+            pod_containers=[
+                (
+                    pod,
+                    [
+                        (container_name, container_aliases[container_name])
+                        for container_name in containers
+                    ],
+                )
+                for pod, containers in pod_container_mapping.items()
+            ],
             aggregation_function="max",
-            period="1m",
+            period=get_bin_period(event),
         )
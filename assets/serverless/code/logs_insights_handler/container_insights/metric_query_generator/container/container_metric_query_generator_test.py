@@ -121,6 +121,23 @@ def test_generate_lookup_query(mocker):
     )
 
 
+def test_generate_lookup_query_top_k(mocker):
+    container_metric_query_generator = ContainerMetricQueryGenerator()
+    top_k_event = copy.deepcopy(EVENT)
+    top_k_event["ResourceProperties"].update(
+        {
+            "iTopK": "20",
+            "iTopKMetric": "container_memory_utilization",
+            "iTopKStatistic": "p99",
+        }
+    )
+
+    assert (
+        container_metric_query_generator.generate_lookup_query(top_k_event)
+        == 'fields PodName, kubernetes.container_name | filter (Type = "Container" or Type = "ContainerFS") and Namespace = "eks-baseline-services" and ispresent(container_memory_utilization) | stats pct(container_memory_utilization, 99) as rank by PodName, kubernetes.container_name | sort rank desc | limit 20'
+    )
+
+
 def test_generate_metric_query(mocker):
     container_metric_query_generator = ContainerMetricQueryGenerator()
 
@@ -151,3 +168,184 @@ def test_generate_metric_query(mocker):
         "sum({metric} * pod5 * container5) / sum(pod5 * container5) as `container-insights-metrics-opentelemetry-collector-agent opentelemetry-collector` "
         "by bin(1m)"
     )
+
+
+def test_generate_metric_query_distinct_containers(mocker):
+    """
+    Every pod coming with its own distinct container names, each container name gets a
+    single alias, referenced once by the aggregation of its (pod, container) pair (see
+    benchmarks/container_query_benchmark.py for the rendering time).
+    """
+    container_metric_query_generator = ContainerMetricQueryGenerator()
+
+    query = container_metric_query_generator.generate_metric_query(
+        EVENT, _lookup_query_response(pods=500, containers_per_pod=10)
+    )
+
+    assert query.count(") as pod") == 500
+    assert query.count(") as container") == 5000
+    assert query.count("sum({metric} * pod") == 5000
+    assert "sum({metric} * pod1 * container1) " in query
+    assert "sum({metric} * pod500 * container5000) " in query
+
+
+def _lookup_query_response(pods: int, containers_per_pod: int) -> Dict[str, Any]:
+    return {
+        "results": [
+            [
+                {"field": "PodName", "value": f"pod-{pod:06d}"},
+                {
+                    "field": "kubernetes.container_name",
+                    "value": f"pod-{pod:06d}-container-{container:02d}",
+                },
+                {"field": "count()", "value": "58"},
+            ]
+            for pod in range(1, pods + 1)
+            for container in range(containers_per_pod)
+        ],
+        "status": "Complete",
+    }
+
+
+def test_generate_metric_queries(mocker):
+    container_metric_query_generator = ContainerMetricQueryGenerator()
+    shard_event = copy.deepcopy(EVENT)
+    shard_event["ResourceProperties"]["iShardCount"] = "2"
+
+    queries = container_metric_query_generator.generate_metric_queries(
+        shard_event, LOOKUP_QUERY_RESPONSE
+    )
+
+    assert queries == [
+        container_metric_query_generator.render_metric_query(
+            EVENT,
+            [
+                (
+                    "eks-baseline-services",
+                    "csi-secrets-store-provider-aws-secrets-store-csi-driver",
+                    "secrets-store",
+                ),
+                (
+                    "eks-baseline-services",
+                    "cluster-autoscaler-aws-cluster-autoscaler",
+                    "aws-cluster-autoscaler",
+                ),
+                (
+                    "eks-baseline-services",
+                    "csi-secrets-store-provider-aws",
+                    "provider-aws-installer",
+                ),
+                (
+                    "eks-baseline-services",
+                    "csi-secrets-store-provider-aws-secrets-store-csi-driver",
+                    "node-driver-registrar",
+                ),
+            ],
+        ),
+        container_metric_query_generator.render_metric_query(
+            EVENT,
+            [
+                (
+                    "eks-baseline-services",
+                    "csi-secrets-store-provider-aws-secrets-store-csi-driver",
+                    "liveness-probe",
+                ),
+                (
+                    "eks-baseline-services",
+                    "aws-for-fluent-bit",
+                    "aws-for-fluent-bit",
+                ),
+                (
+                    "eks-baseline-services",
+                    "container-insights-metrics-opentelemetry-collector-agent",
+                    "opentelemetry-collector",
+                ),
+            ],
+        ),
+    ]
+    # Aliases are numbered per shard
+    assert (
+        "sum({metric} * pod1 * container2) / sum(pod1 * container2) as `csi-secrets-store-provider-aws-secrets-store-csi-driver liveness-probe`"
+        in queries[1]
+    )
+
+
+def test_generate_lookup_query_multiple_namespaces(mocker):
+    container_metric_query_generator = ContainerMetricQueryGenerator()
+    namespaces_event = copy.deepcopy(EVENT)
+    del namespaces_event["ResourceProperties"]["iNamespace"]
+    namespaces_event["ResourceProperties"]["iNamespaces"] = [
+        "kube-system",
+        "amazon-metrics",
+    ]
+
+    assert (
+        container_metric_query_generator.generate_lookup_query(namespaces_event)
+        == 'fields Namespace, PodName, kubernetes.container_name | filter Type = "Container" and (Namespace in ["kube-system", "amazon-metrics"]) | stats count() by Namespace, PodName, kubernetes.container_name'
+    )
+
+    assert container_metric_query_generator.generate_metric_query(
+        namespaces_event,
+        {
+            "results": [
+                [
+                    {"field": "Namespace", "value": "kube-system"},
+                    {"field": "PodName", "value": "coredns"},
+                    {"field": "kubernetes.container_name", "value": "coredns"},
+                    {"field": "count()", "value": "57"},
+                ],
+                [
+                    {"field": "Namespace", "value": "amazon-metrics"},
+                    {"field": "PodName", "value": "coredns"},
+                    {"field": "kubernetes.container_name", "value": "coredns"},
+                    {"field": "count()", "value": "57"},
+                ],
+            ],
+            "status": "Complete",
+        },
+    ) == (
+        "fields {metric}, "
+        '(Namespace = \\"kube-system\\" and PodName = \\"coredns\\") as pod1, '
+        '(Namespace = \\"amazon-metrics\\" and PodName = \\"coredns\\") as pod2, '
+        '(kubernetes.container_name = \\"coredns\\") as container1 '
+        '| filter (Type = \\"Container\\" or Type = \\"ContainerFS\\") and Namespace in [\\"kube-system\\", \\"amazon-metrics\\"] and ispresent({metric}) '
+        "| stats "
+        "sum({metric} * pod1 * container1) / sum(pod1 * container1) as `kube-system/coredns coredns`, "
+        "sum({metric} * pod2 * container1) / sum(pod2 * container1) as `amazon-metrics/coredns coredns` "
+        "by bin(1m)"
+    )
+
+
+def test_generate_metric_query_log_streams(mocker):
+    container_metric_query_generator = ContainerMetricQueryGenerator()
+    log_streams_event = copy.deepcopy(EVENT)
+    log_streams_event["ResourceProperties"]["iTargetLogStreams"] = "true"
+
+    assert (
+        container_metric_query_generator.generate_lookup_query(log_streams_event)
+        == 'fields PodName, kubernetes.container_name, NodeName | filter Type = "Container" and Namespace = "eks-baseline-services" | stats count() by PodName, kubernetes.container_name, NodeName'
+    )
+
+    assert container_metric_query_generator.generate_metric_query(
+        log_streams_event,
+        {
+            "results": [
+                [
+                    {"field": "PodName", "value": "coredns"},
+                    {"field": "kubernetes.container_name", "value": "coredns"},
+                    {"field": "NodeName", "value": node_name},
+                ]
+                for node_name in ["ip-10-0-1-2", "ip-10-0-1-1"]
+            ],
+            "status": "Complete",
+        },
+    ) == (
+        'filter @logStream in [\\"ip-10-0-1-1\\", \\"ip-10-0-1-2\\"] | '
+        "fields {metric}, "
+        '(PodName = \\"coredns\\") as pod1, '
+        '(kubernetes.container_name = \\"coredns\\") as container1 '
+        '| filter (Type = \\"Container\\" or Type = \\"ContainerFS\\") and Namespace = \\"eks-baseline-services\\" and ispresent({metric}) '
+        "| stats "
+        "sum({metric} * pod1 * container1) / sum(pod1 * container1) as `coredns coredns` "
+        "by bin(1m)"
+    )
@@ -0,0 +1,177 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from typing import Any, Dict, List
+
+from container_insights.metric_query_generator import (
+    LOG_STREAM_NAME_FIELD,
+    LookupQueryMixin,
+    is_log_stream_targeted,
+)
+from container_insights.metric_query_generator.container import (
+    ContainerMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.namespace_selector import (
+    generate_namespace_filter,
+)
+from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+from container_insights.metric_query_generator.query_results import QueryResults
+from container_insights.metric_query_generator.template_registry import (
+    QUERY_TEMPLATE_REGISTRY,
+)
+
+# Contents served by the discovery lookup, along with the fields identifying their series
+DISCOVERED_CONTENTS = {
+    "Node": (NodeMetricQueryGenerator, ("NodeName",)),
+    "Pod": (PodMetricQueryGenerator, ("Namespace", "PodName")),
+    "Container": (
+        ContainerMetricQueryGenerator,
+        ("Namespace", "PodName", "kubernetes.container_name"),
+    ),
+}
+
+DISCOVERY_FIELDS = "Type, NodeName, Namespace, PodName, kubernetes.container_name"
+
+
+class DiscoveryMetricQueryGenerator(LookupQueryMixin):
+    """
+    Cross-type Metric Query Generator, serving the node, pod and container generators
+    from a single lookup query.
+
+    The content specific properties are nested under "iNode", "iPod" and "iContainer",
+    and the generic metric queries are exposed as "o<Content>Query" attributes, suffixed
+    the same way as the content specific resources attributes (eg.
+    "oPodQueryNamespace1Shard2").
+    """
+
+    @property
+    def template_fingerprint(self) -> str:
+        """The discovery metric queries are rendered with the content specific templates"""
+        return QUERY_TEMPLATE_REGISTRY.get_fingerprint(
+            generator_class.__name__
+            for generator_class, _ in DISCOVERED_CONTENTS.values()
+        )
+
+    def get_contents(self, event) -> List[str]:
+        """The contents enabled on the discovery resource"""
+
+        return [
+            content
+            for content in DISCOVERED_CONTENTS
+            if f"i{content}" in event["ResourceProperties"]
+        ]
+
+    def get_content_event(self, event, content: str) -> Dict[str, Any]:
+        """The event a content specific generator would have received"""
+
+        properties = {
+            name: value
+            for name, value in event["ResourceProperties"].items()
+            if name not in [f"i{content}" for content in DISCOVERED_CONTENTS]
+        }
+        properties.update(event["ResourceProperties"][f"i{content}"])
+
+        return {**event, "ResourceProperties": properties}
+
+    def generate_lookup_query(self, event) -> str:
+        """
+        The discovery lookup query is about retrieving the node names, the pod names and
+        the container names of all the enabled contents in one go, each content being
+        scoped to its own namespace selectors.
+        The pods and containers are reported once per node they ran on, so the results
+        of every content add up towards the Logs Insights results limit, past which the
+        lookup query fails rather than dropping series.
+        """
+
+        content_filters = []
+        for content in self.get_contents(event):
+            properties = event["ResourceProperties"][f"i{content}"]
+            if "iNamespaces" in properties:
+                content_filters.append(
+                    f'(Type = "{content}" and {generate_namespace_filter(properties["iNamespaces"])})'
+                )
+            elif properties.get("iNamespace", ""):
+                content_filters.append(
+                    f'(Type = "{content}" and Namespace = "{properties["iNamespace"]}")'
+                )
+            else:
+                content_filters.append(f'Type = "{content}"')
+
+        return "fields {fields} | filter {filters} | stats count() by {fields}".format(
+            fields=DISCOVERY_FIELDS, filters=" or ".join(content_filters)
+        )
+
+    def get_series(self, event, response) -> Dict[str, List[Any]]:
+        """
+        The discovery series are the lookup query results split per content, restricted to
+        the fields identifying the content series and deduplicated (eg. a pod rescheduled
+        on another node is reported once per node by the lookup query).
+        Contents restricted to log streams ("iTargetLogStreams") keep one result per node
+        instead.
+        """
+
+        series = {content: dict() for content in self.get_contents(event)}
+        results = QueryResults.from_response(response)
+        content_key_fields = dict()
+        for content in series:
+            key_fields = DISCOVERED_CONTENTS[content][1]
+            if (
+                is_log_stream_targeted(self.get_content_event(event, content))
+                and LOG_STREAM_NAME_FIELD not in key_fields
+            ):
+                key_fields += (LOG_STREAM_NAME_FIELD,)
+            content_key_fields[content] = key_fields
+        key_columns = {
+            content: [results.column(key_field) for key_field in key_fields]
+            for content, key_fields in content_key_fields.items()
+        }
+        for row, content in enumerate(results.column("Type")):
+            if content not in series:
+                continue
+
+            key_fields = content_key_fields[content]
+            key = tuple(column[row] for column in key_columns[content])
+            if not all(key):
+                continue
+            if key not in series[content]:
+                series[content][key] = [
+                    {"field": key_field, "value": value}
+                    for key_field, value in zip(key_fields, key)
+                ]
+
+        return {content: list(results.values()) for content, results in series.items()}
+
+    def set_metric_queries(self, event, response, attribute_name: str = "oQuery"):
+        """
+        Hand the lookup results of every content over to its own generator, which renders
+        and exposes its generic metric queries as "o<Content>Query" attributes.
+        """
+
+        query_id = event["CrHelperData"]["PhysicalResourceId"]
+        for content, results in self.get_series(event, response).items():
+            if not results:
+                raise Exception(
+                    f'Query ID "{query_id}" didnt return any {content.lower()} result, please double check the correctness of the provided investigation window'
+                )
+
+            generator_class = DISCOVERED_CONTENTS[content][0]
+            generator_class().set_metric_queries(
+                self.get_content_event(event, content),
+                {**response, "results": results},
+                attribute_name.replace("o", f"o{content}", 1),
+            )
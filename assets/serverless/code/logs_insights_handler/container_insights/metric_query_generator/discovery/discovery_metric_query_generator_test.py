@@ -0,0 +1,221 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import copy
+
+import container_insights.metric_query_generator
+import pytest
+from container_insights.metric_query_generator.discovery import (
+    DiscoveryMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+
+EVENT = {
+    "RequestType": "Create",
+    "ResourceProperties": {
+        "iLogGroupName": "/aws/containerinsights/eks-cluster/performance",
+        "iStartTime": "2022-12-19T12:00:00",
+        "iEndTime": "2022-12-19T23:00:00",
+        "iNode": {"iNamespace": ""},
+        "iPod": {"iNamespaces": ["kube-system", "team-*"], "iShardCount": "2"},
+        "iContainer": {"iNamespaces": ["kube-system"]},
+    },
+    "CrHelperData": {"PhysicalResourceId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+}
+
+
+def result(type: str, node_name: str, namespace=None, pod_name=None, container=None):
+    fields = {
+        "Type": type,
+        "NodeName": node_name,
+        "Namespace": namespace,
+        "PodName": pod_name,
+        "kubernetes.container_name": container,
+    }
+    return [
+        {"field": field, "value": value}
+        for field, value in fields.items()
+        if value is not None
+    ] + [{"field": "count()", "value": "1438"}]
+
+
+LOOKUP_QUERY_RESPONSE = {
+    "results": [
+        result("Node", "ip-10-0-1-1"),
+        result("Node", "ip-10-0-1-2"),
+        result("Pod", "ip-10-0-1-1", "kube-system", "coredns"),
+        # Rescheduled pod, reported once per node
+        result("Pod", "ip-10-0-1-2", "kube-system", "coredns"),
+        result("Pod", "ip-10-0-1-2", "team-a", "api"),
+        result("Container", "ip-10-0-1-1", "kube-system", "coredns", "coredns"),
+        result("Container", "ip-10-0-1-2", "kube-system", "coredns", "coredns"),
+    ],
+    "status": "Complete",
+}
+
+
+def test_generate_lookup_query():
+    assert (
+        DiscoveryMetricQueryGenerator().generate_lookup_query(EVENT)
+        == "fields Type, NodeName, Namespace, PodName, kubernetes.container_name "
+        '| filter Type = "Node" '
+        'or (Type = "Pod" and (Namespace in ["kube-system"] or Namespace like /^team\\-.*$/)) '
+        'or (Type = "Container" and (Namespace in ["kube-system"])) '
+        "| stats count() by Type, NodeName, Namespace, PodName, kubernetes.container_name"
+    )
+
+
+def test_generate_lookup_query_single_content():
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            name: value
+            for name, value in EVENT["ResourceProperties"].items()
+            if name not in ["iNode", "iContainer"]
+        },
+    }
+
+    assert (
+        DiscoveryMetricQueryGenerator().generate_lookup_query(event)
+        == "fields Type, NodeName, Namespace, PodName, kubernetes.container_name "
+        '| filter (Type = "Pod" and (Namespace in ["kube-system"] or Namespace like /^team\\-.*$/)) '
+        "| stats count() by Type, NodeName, Namespace, PodName, kubernetes.container_name"
+    )
+
+
+def test_get_series():
+    assert DiscoveryMetricQueryGenerator().get_series(EVENT, LOOKUP_QUERY_RESPONSE) == {
+        "Node": [
+            [{"field": "NodeName", "value": "ip-10-0-1-1"}],
+            [{"field": "NodeName", "value": "ip-10-0-1-2"}],
+        ],
+        "Pod": [
+            [
+                {"field": "Namespace", "value": "kube-system"},
+                {"field": "PodName", "value": "coredns"},
+            ],
+            [
+                {"field": "Namespace", "value": "team-a"},
+                {"field": "PodName", "value": "api"},
+            ],
+        ],
+        "Container": [
+            [
+                {"field": "Namespace", "value": "kube-system"},
+                {"field": "PodName", "value": "coredns"},
+                {"field": "kubernetes.container_name", "value": "coredns"},
+            ],
+        ],
+    }
+
+
+def test_get_series_log_streams():
+    event = copy.deepcopy(EVENT)
+    event["ResourceProperties"]["iPod"]["iTargetLogStreams"] = "true"
+
+    assert DiscoveryMetricQueryGenerator().get_series(event, LOOKUP_QUERY_RESPONSE)[
+        "Pod"
+    ] == [
+        [
+            {"field": "Namespace", "value": "kube-system"},
+            {"field": "PodName", "value": "coredns"},
+            {"field": "NodeName", "value": "ip-10-0-1-1"},
+        ],
+        [
+            {"field": "Namespace", "value": "kube-system"},
+            {"field": "PodName", "value": "coredns"},
+            {"field": "NodeName", "value": "ip-10-0-1-2"},
+        ],
+        [
+            {"field": "Namespace", "value": "team-a"},
+            {"field": "PodName", "value": "api"},
+            {"field": "NodeName", "value": "ip-10-0-1-2"},
+        ],
+    ]
+
+
+def test_set_metric_queries():
+    container_insights.metric_query_generator.helper.Data = {}
+
+    DiscoveryMetricQueryGenerator().set_metric_queries(EVENT, LOOKUP_QUERY_RESPONSE)
+
+    assert sorted(container_insights.metric_query_generator.helper.Data) == [
+        "oContainerQueryNamespace1",
+        "oNodeQuery",
+        "oPodQueryNamespace1Shard1",
+        "oPodQueryNamespace1Shard2",
+        "oPodQueryNamespace2Shard1",
+        "oPodQueryNamespace2Shard2",
+    ]
+
+    # Every content query is the one its own lookup would have produced
+    assert container_insights.metric_query_generator.helper.Data[
+        "oNodeQuery"
+    ] == NodeMetricQueryGenerator().render_metric_query(
+        {}, ["ip-10-0-1-1", "ip-10-0-1-2"]
+    )
+    assert container_insights.metric_query_generator.helper.Data[
+        "oPodQueryNamespace2Shard1"
+    ] == PodMetricQueryGenerator().render_metric_query({}, [("team-a", "api")])
+
+
+def test_set_metric_queries_no_content_results():
+    response = {
+        **LOOKUP_QUERY_RESPONSE,
+        "results": [
+            result
+            for result in LOOKUP_QUERY_RESPONSE["results"]
+            if result[0]["value"] != "Container"
+        ],
+    }
+
+    with pytest.raises(Exception) as ex_info:
+        DiscoveryMetricQueryGenerator().set_metric_queries(EVENT, response)
+
+    assert (
+        f'Query ID "{EVENT["CrHelperData"]["PhysicalResourceId"]}" didnt return any container result'
+        in str(ex_info.value)
+    )
+
+
+def test_set_metric_queries_truncated_results(mocker):
+    mocker.patch.object(
+        container_insights.metric_query_generator,
+        "METRIC_QUERY_GENERATOR",
+        DiscoveryMetricQueryGenerator(),
+    )
+    set_metric_queries_spy = mocker.spy(
+        DiscoveryMetricQueryGenerator, "set_metric_queries"
+    )
+    response = {
+        **LOOKUP_QUERY_RESPONSE,
+        "results": [
+            result("Pod", f"ip-10-0-{index // 250}-{index % 250}", "team-a", "api")
+            for index in range(
+                container_insights.metric_query_generator.MAX_LOOKUP_RESULTS
+            )
+        ],
+    }
+
+    with pytest.raises(Exception) as ex_info:
+        container_insights.metric_query_generator._set_metric_queries(
+            EVENT, EVENT["CrHelperData"]["PhysicalResourceId"], [response]
+        )
+
+    assert not set_metric_queries_spy.called
+    assert "reaching the Logs Insights results limit" in str(ex_info.value)
@@ -0,0 +1,213 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+The lookup queries only depend on their log group, investigation window, content type
+and namespaces: once the investigation window is in the past, their results cannot
+change anymore. The generic metric queries assembled from them are therefore cached,
+content-addressed by the lookup resource properties, so that redeploying the same
+investigation skips the lookup queries altogether.
+
+The cache location is given by the LOOKUP_CACHE_URI environment variable, either an S3
+location ("s3://<bucket>/<prefix>") or a local directory ("file://<path>"), the latter
+standing in for S3 in tests and local runs. The cache is disabled when it is not set.
+
+The merged lookup results are cached as well, keyed regardless of the investigation
+window end, so that an update extending the window end only scans the added time range.
+"""
+
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from hashlib import sha256
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+import boto3
+from botocore.exceptions import ClientError
+
+LOGGER = logging.getLogger(__name__)
+
+# Logs ingestion delay after which an investigation window is considered settled
+LOOKUP_CACHE_SETTLING_TIME = 15 * 60
+
+# Properties left out of the lookup results cache key, the lookup results of a window
+# being reused when its end is extended
+LOOKUP_RESULTS_EXCLUDED_PROPERTIES = [
+    "ServiceToken",
+    "iEndTime",
+    "iTimeSlices",
+    "iLookupQueryId",
+    "iLookupStartTime",
+]
+
+# Properties referring to the lookup query shared by another resource, which change with
+# every lookup query run but not the metric queries
+SHARED_LOOKUP_PROPERTIES = ["iLookupQueryId", "iLookupStartTime"]
+
+
+class LookupCache(ABC):
+    """
+    Abstract cache of the lookup results, and of the generic metric queries assembled
+    from them
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cache entry, None on cache miss"""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Cache an entry, ie. metric queries or lookup results"""
+        pass
+
+
+class S3LookupCache(LookupCache):
+    """Lookup cache backed by an S3 bucket, one JSON object per cache entry"""
+
+    def __init__(self, bucket: str, prefix: str = "", s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._s3_client = s3_client
+
+    @property
+    def s3_client(self):
+        """S3 client, created on first use"""
+        if self._s3_client is None:
+            self._s3_client = boto3.client("s3")
+        return self._s3_client
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket, Key=f"{self.prefix}{key}.json"
+            )
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] not in ["NoSuchKey", "404"]:
+                LOGGER.warning(
+                    f'Could not get lookup cache entry "{key}"', exc_info=True
+                )
+            return None
+
+        return json.loads(response["Body"].read())
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=f"{self.prefix}{key}.json",
+                Body=json.dumps(entry).encode("utf-8"),
+                ContentType="application/json",
+            )
+        except ClientError:
+            LOGGER.warning(f'Could not put lookup cache entry "{key}"', exc_info=True)
+
+
+class LocalLookupCache(LookupCache):
+    """Lookup cache backed by a local directory, one JSON file per cache entry"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(
+                os.path.join(self.directory, f"{key}.json"), "r", encoding="utf8"
+            ) as cache_entry:
+                return json.load(cache_entry)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(
+            os.path.join(self.directory, f"{key}.json"), "w", encoding="utf8"
+        ) as cache_entry:
+            json.dump(entry, cache_entry)
+
+
+def get_lookup_cache(uri: str) -> Optional[LookupCache]:
+    """The lookup cache located at a given URI, None when no URI is given"""
+
+    if not uri:
+        return None
+
+    location = urlparse(uri)
+    if location.scheme == "s3":
+        return S3LookupCache(location.netloc, location.path.lstrip("/"))
+    if location.scheme == "file":
+        return LocalLookupCache(location.netloc + location.path)
+
+    raise Exception(f'Unsupported lookup cache URI "{uri}"')
+
+
+def get_lookup_cache_key(event, template_fingerprint: str) -> str:
+    """
+    The cache key is a digest of the resource type, of the properties driving the lookup
+    and metric queries (log group, window, namespaces, top K, shards...) and of the
+    fingerprint of the metric query templates of the resource, so that updated
+    templates never serve stale queries.
+    """
+
+    return _get_digest(
+        event, ["ServiceToken"] + SHARED_LOOKUP_PROPERTIES, template_fingerprint
+    )
+
+
+def get_lookup_results_cache_key(event, template_fingerprint: str) -> str:
+    """
+    The lookup results cache key leaves the investigation window end out, so that the
+    lookup results of a window are found back once its end is extended.
+    """
+
+    return "lookup-results-" + _get_digest(
+        event, LOOKUP_RESULTS_EXCLUDED_PROPERTIES, template_fingerprint
+    )
+
+
+def _get_digest(
+    event, excluded_properties: List[str], template_fingerprint: str
+) -> str:
+    return sha256(
+        json.dumps(
+            {
+                "ResourceType": event["ResourceType"],
+                "ResourceProperties": {
+                    name: value
+                    for name, value in event["ResourceProperties"].items()
+                    if name not in excluded_properties
+                },
+                "Templates": template_fingerprint,
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def is_cacheable(event) -> bool:
+    """Only settled investigation windows, whose lookup results cannot change, are cached"""
+
+    return (
+        datetime.strptime(
+            event["ResourceProperties"]["iEndTime"], "%Y-%m-%dT%H:%M:%S"
+        ).timestamp()
+        < time.time() - LOOKUP_CACHE_SETTLING_TIME
+    )
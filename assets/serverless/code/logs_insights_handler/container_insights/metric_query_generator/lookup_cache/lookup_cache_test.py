@@ -0,0 +1,223 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import io
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from container_insights.metric_query_generator.lookup_cache import (
+    LocalLookupCache,
+    S3LookupCache,
+    get_lookup_cache,
+    get_lookup_cache_key,
+    get_lookup_results_cache_key,
+    is_cacheable,
+)
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+from container_insights.metric_query_generator.template_registry import (
+    QueryTemplateRegistry,
+)
+
+EVENT = {
+    "RequestType": "Create",
+    "ResourceType": "Custom::ContainerInsights-PodMetricQuery",
+    "ResourceProperties": {
+        "ServiceToken": "arn:aws:lambda:eu-central-1:123456789012:function:handler",
+        "iLogGroupName": "/aws/containerinsights/eks-cluster/performance",
+        "iNamespaces": ["kube-system"],
+        "iStartTime": "2022-12-19T12:00:00",
+        "iEndTime": "2022-12-19T23:00:00",
+    },
+}
+
+TEMPLATE_FINGERPRINT = "c2d8b2b8f9e1a7d3c6e5f4a3b2c1d0e9f8a7b6c5"
+
+METRIC_QUERIES = {"oQueryNamespace1": "dummy log insights metric query"}
+
+
+def test_local_lookup_cache(tmp_path):
+    lookup_cache = LocalLookupCache(str(tmp_path / "lookup-cache"))
+
+    assert lookup_cache.get("key") is None
+
+    lookup_cache.put("key", METRIC_QUERIES)
+
+    assert lookup_cache.get("key") == METRIC_QUERIES
+
+
+def test_s3_lookup_cache():
+    s3_client = boto3.client("s3")
+    s3_stubber = Stubber(s3_client)
+    s3_stubber.add_client_error("get_object", service_error_code="NoSuchKey")
+    s3_stubber.add_response(
+        "put_object",
+        {},
+        {
+            "Bucket": "lookup-cache-bucket",
+            "Key": "prefix/key.json",
+            "Body": json.dumps(METRIC_QUERIES).encode("utf-8"),
+            "ContentType": "application/json",
+        },
+    )
+    s3_stubber.add_response(
+        "get_object",
+        {"Body": io.BytesIO(json.dumps(METRIC_QUERIES).encode("utf-8"))},
+        {"Bucket": "lookup-cache-bucket", "Key": "prefix/key.json"},
+    )
+    # Cache errors never fail the lookup
+    s3_stubber.add_client_error("get_object", service_error_code="AccessDenied")
+
+    lookup_cache = S3LookupCache("lookup-cache-bucket", "prefix/", s3_client)
+    with s3_stubber:
+        assert lookup_cache.get("key") is None
+        lookup_cache.put("key", METRIC_QUERIES)
+        assert lookup_cache.get("key") == METRIC_QUERIES
+        assert lookup_cache.get("key") is None
+
+    s3_stubber.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize(
+    "uri,expected_class,expected_location",
+    [
+        ("s3://lookup-cache-bucket/prefix/", S3LookupCache, "prefix/"),
+        ("file:///tmp/lookup-cache", LocalLookupCache, "/tmp/lookup-cache"),
+    ],
+)
+def test_get_lookup_cache(uri, expected_class, expected_location):
+    lookup_cache = get_lookup_cache(uri)
+
+    assert isinstance(lookup_cache, expected_class)
+    assert expected_location in [
+        getattr(lookup_cache, "prefix", None),
+        getattr(lookup_cache, "directory", None),
+    ]
+
+
+def test_get_lookup_cache_disabled():
+    assert get_lookup_cache("") is None
+    with pytest.raises(Exception) as ex_info:
+        get_lookup_cache("dynamodb://table")
+    assert 'Unsupported lookup cache URI "dynamodb://table"' in str(ex_info.value)
+
+
+@pytest.mark.parametrize(
+    "property_name,property_value,same_key",
+    [
+        (
+            "ServiceToken",
+            "arn:aws:lambda:eu-central-1:123456789012:function:other",
+            True,
+        ),
+        ("iLogGroupName", "/aws/containerinsights/other-cluster/performance", False),
+        ("iEndTime", "2022-12-19T22:00:00", False),
+        ("iNamespaces", ["kube-system", "team-*"], False),
+        ("iTopK", "10", False),
+    ],
+)
+def test_get_lookup_cache_key(property_name, property_value, same_key):
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            property_name: property_value,
+        },
+    }
+
+    assert (
+        get_lookup_cache_key(event, TEMPLATE_FINGERPRINT)
+        == get_lookup_cache_key(EVENT, TEMPLATE_FINGERPRINT)
+    ) == same_key
+
+
+@pytest.mark.parametrize(
+    "property_name,property_value,same_key",
+    [
+        ("iEndTime", "2022-12-19T23:30:00", True),
+        ("iTimeSlices", "4", True),
+        ("iStartTime", "2022-12-19T11:00:00", False),
+        ("iNamespaces", ["kube-system", "team-*"], False),
+    ],
+)
+def test_get_lookup_results_cache_key(property_name, property_value, same_key):
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            property_name: property_value,
+        },
+    }
+
+    assert (
+        get_lookup_results_cache_key(event, TEMPLATE_FINGERPRINT)
+        == get_lookup_results_cache_key(EVENT, TEMPLATE_FINGERPRINT)
+    ) == same_key
+    assert get_lookup_results_cache_key(
+        event, TEMPLATE_FINGERPRINT
+    ) != get_lookup_cache_key(event, TEMPLATE_FINGERPRINT)
+
+
+def test_get_lookup_cache_key_content_type():
+    event = {**EVENT, "ResourceType": "Custom::ContainerInsights-ContainerMetricQuery"}
+
+    assert get_lookup_cache_key(event, TEMPLATE_FINGERPRINT) != get_lookup_cache_key(
+        EVENT, TEMPLATE_FINGERPRINT
+    )
+
+
+def test_get_lookup_cache_key_lazy_imports(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register(
+        PodMetricQueryGenerator.__name__, PodMetricQueryGenerator.QUERY_TEMPLATE
+    )
+    mocker.patch(
+        "container_insights.metric_query_generator.QUERY_TEMPLATE_REGISTRY", registry
+    )
+    cache_key = get_lookup_cache_key(
+        EVENT, PodMetricQueryGenerator().template_fingerprint
+    )
+
+    # Another generator, imported later on within the same process
+    registry.register("NodeMetricQueryGenerator", "fields {metric}")
+
+    assert (
+        get_lookup_cache_key(EVENT, PodMetricQueryGenerator().template_fingerprint)
+        == cache_key
+    )
+
+    # Whereas an updated template of the generator changes the key
+    registry.register(PodMetricQueryGenerator.__name__, "fields {metric}")
+
+    assert (
+        get_lookup_cache_key(EVENT, PodMetricQueryGenerator().template_fingerprint)
+        != cache_key
+    )
+
+
+@pytest.mark.parametrize(
+    "end_time,expected_cacheable",
+    [("2022-12-19T23:00:00", True), ("2999-12-19T23:00:00", False)],
+)
+def test_is_cacheable(end_time, expected_cacheable):
+    event = {
+        **EVENT,
+        "ResourceProperties": {**EVENT["ResourceProperties"], "iEndTime": end_time},
+    }
+
+    assert is_cacheable(event) == expected_cacheable
@@ -14,9 +14,18 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import json
+from functools import partial
+
 import container_insights.metric_query_generator
 import pytest
 from botocore.stub import ANY, Stubber
+from container_insights.metric_query_generator import MetricQueryRenderingMixin
+from container_insights.metric_query_generator.lookup_cache import (
+    LocalLookupCache,
+    get_lookup_results_cache_key,
+)
+from container_insights.query_store import LocalQueryStore, get_query_key_prefix
 
 EVENT = {
     "RequestType": "Create",
@@ -39,11 +48,48 @@ POLL_EVENT = {
     "CrHelperData": {"PhysicalResourceId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
 }
 
+TEMPLATE_FINGERPRINT = "c2d8b2b8f9e1a7d3c6e5f4a3b2c1d0e9f8a7b6c5"
+
+
+def get_metric_query_generator_mock(mocker):
+    """Metric query generator mock, only the metric queries generation being mocked"""
+
+    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock.template_fingerprint = TEMPLATE_FINGERPRINT
+    for method in [
+        "set_metric_queries",
+        "_set_metric_query_shards",
+        "select_top_k_results",
+    ]:
+        getattr(metric_query_generator_mock, method).side_effect = partial(
+            getattr(MetricQueryRenderingMixin, method), metric_query_generator_mock
+        )
+
+    return metric_query_generator_mock
+
+
+def add_describe_queries_responses(logs_stubber: Stubber, running_query_count: int = 0):
+    """Queries running in the account, as checked before starting the lookup query"""
+
+    for status in ["Scheduled", "Running"]:
+        logs_stubber.add_response(
+            "describe_queries",
+            {
+                "queries": [
+                    {"queryId": f"{status}-{index}", "status": status}
+                    for index in range(
+                        running_query_count if status == "Running" else 0
+                    )
+                ]
+            },
+            {"status": status},
+        )
+
 
 def test_create_query(mocker):
     dummy_log_insights_lookup_query = "dummy log insights lookup query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_lookup_query.return_value = (
         dummy_log_insights_lookup_query
     )
@@ -51,8 +97,13 @@ def test_create_query(mocker):
     container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
         metric_query_generator_mock
     )
+    # Straight to the crhelper poll cycle
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_POLLING_BUDGET", 0
+    )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
     logs_stubber.add_response(
         "start_query",
         {
@@ -80,10 +131,91 @@ def test_create_query(mocker):
     metric_query_generator_mock.generate_lookup_query.assert_called_once_with(EVENT)
 
 
+def test_create_query_rollup(mocker):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.has_lookup_query.return_value = False
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "dummy log insights metric query"
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    container_insights.metric_query_generator.helper._completed = False
+
+    # No Logs Insights call at all
+    with Stubber(container_insights.metric_query_generator.get_logs_client()):
+        assert container_insights.metric_query_generator.create_query(EVENT, {}) == True
+
+    assert container_insights.metric_query_generator.helper._completed
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQuery": "dummy log insights metric query"
+    }
+    metric_query_generator_mock.generate_lookup_query.assert_not_called()
+    metric_query_generator_mock.generate_metric_query.assert_called_once_with(
+        EVENT, None
+    )
+
+
+@pytest.mark.parametrize("query_length", [100, 5000])
+def test_create_query_query_store(mocker, tmp_path, query_length):
+    event = {
+        **EVENT,
+        "ResourceType": "Custom::ContainerInsights-ClusterMetricQuery",
+        "LogicalResourceId": "ClusterMetricQuery",
+    }
+    metric_query = "fields {metric} | " + "x" * query_length
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.has_lookup_query.return_value = False
+    metric_query_generator_mock.generate_metric_query.return_value = metric_query
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    query_store = LocalQueryStore(str(tmp_path))
+    mocker.patch.object(
+        container_insights.metric_query_generator, "QUERY_STORE", query_store
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+
+    assert container_insights.metric_query_generator.create_query(event, {}) == True
+
+    # Whatever their size, the queries are stored and the resource only answers their
+    # key prefix
+    key_prefix = get_query_key_prefix(event)
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQueryKeyPrefix": key_prefix
+    }
+    key = f"{key_prefix}oQuery"
+    assert query_store.get(key) == metric_query
+
+    container_insights.metric_query_generator.delete_query(
+        {**event, "RequestType": "Delete"}, {}
+    )
+
+    with pytest.raises(Exception, match="not found"):
+        query_store.get(key)
+
+
+def test_create_query_response_too_large(mocker):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.has_lookup_query.return_value = False
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "fields {metric} | " + "x" * 5000
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    mocker.patch.object(container_insights.metric_query_generator, "QUERY_STORE", None)
+    container_insights.metric_query_generator.helper.Data = {}
+
+    with pytest.raises(Exception, match="exceeding the 3072 bytes custom resource"):
+        container_insights.metric_query_generator.create_query(EVENT, {})
+
+
 def test_create_query_error(mocker):
     dummy_log_insights_lookup_query = "dummy log insights lookup query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_lookup_query.return_value = (
         dummy_log_insights_lookup_query
     )
@@ -92,7 +224,12 @@ def test_create_query_error(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_POLLING_BUDGET", 0
+    )
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
     logs_stubber.add_client_error("start_query")
 
     with logs_stubber, pytest.raises(Exception) as ex_info:
@@ -105,6 +242,426 @@ def test_create_query_error(mocker):
     )
 
 
+@pytest.mark.parametrize("running_status", ["Scheduled", "Running"])
+def test_create_query_in_invocation_polling(mocker, running_status):
+    dummy_log_insights_metric_query = "dummy log insights metric query"
+    dummy_get_query_result_response = {
+        "results": [[{"field": "dummy"}]],
+        "status": "Complete",
+        "ResponseMetadata": {
+            "HTTPStatusCode": 200,
+        },
+    }
+
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        dummy_log_insights_metric_query
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    sleep_mock = mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query", {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    for _ in range(2):
+        logs_stubber.add_response(
+            "get_query_results",
+            {"status": running_status},
+            {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+        )
+    logs_stubber.add_response(
+        "get_query_results",
+        dummy_get_query_result_response,
+        {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(EVENT, context)
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    # Exponential backoff between the get_query_results calls
+    assert [call.args[0] for call in sleep_mock.call_args_list] == [0.5, 1]
+    assert (
+        container_insights.metric_query_generator.helper.Data["oQuery"]
+        == dummy_log_insights_metric_query
+    )
+    assert container_insights.metric_query_generator.helper._completed
+
+
+def test_create_query_shared_lookup(mocker):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.return_value = "dummy query"
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iSharedLookup": {"iNamespaces": ["eks-baseline-services", "kube-system"]},
+        },
+    }
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query", {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    logs_stubber.add_response(
+        "get_query_results",
+        {"results": [[{"field": "dummy"}]], "status": "Complete"},
+        {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(event, context)
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    # The lookup query covers the properties shared with the other resources, which
+    # are answered the query ID and the start of the scanned time range
+    lookup_event = metric_query_generator_mock.generate_lookup_query.call_args.args[0]
+    assert lookup_event["ResourceProperties"]["iNamespaces"] == [
+        "eks-baseline-services",
+        "kube-system",
+    ]
+    assert "iSharedLookup" not in lookup_event["ResourceProperties"]
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQuery": "dummy query",
+        "oLookupQueryId": "ca588a23-3279-4341-adcf-87d39ea4fac3",
+        "oLookupStartTime": str(
+            container_insights.metric_query_generator._get_timestamp(
+                EVENT["ResourceProperties"]["iStartTime"]
+            )
+        ),
+    }
+
+
+@pytest.mark.parametrize("extended_window", [False, True])
+def test_create_query_read_shared_lookup(mocker, extended_window):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.return_value = "dummy query"
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    container_insights.metric_query_generator.helper._completed = False
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_POLLING_BUDGET", 0
+    )
+    start_time = container_insights.metric_query_generator._get_timestamp(
+        EVENT["ResourceProperties"]["iStartTime"]
+    )
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iLookupQueryId": "ca588a23-3279-4341-adcf-87d39ea4fac3,deferred-slice",
+            "iLookupStartTime": str(start_time + (3600 if extended_window else 0)),
+        },
+    }
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    if extended_window:
+        # Without the lookup results of the former window, the resource runs the lookup
+        # query of the whole window on its own
+        add_describe_queries_responses(logs_stubber)
+        logs_stubber.add_response(
+            "start_query", {"queryId": "a5a3d1a1-53b4-4cbb-b4f5-9e1c31f1c2d4"}
+        )
+    else:
+        for query_id in ["ca588a23-3279-4341-adcf-87d39ea4fac3", "deferred-slice"]:
+            logs_stubber.add_response(
+                "get_query_results",
+                {
+                    "results": [[{"field": "PodName", "value": "dummy"}]],
+                    "status": "Complete",
+                },
+                {"queryId": query_id},
+            )
+
+    with logs_stubber:
+        assert container_insights.metric_query_generator.create_query(event, {}) == (
+            "a5a3d1a1-53b4-4cbb-b4f5-9e1c31f1c2d4" if extended_window else True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    if extended_window:
+        assert not container_insights.metric_query_generator.helper._completed
+    else:
+        metric_query_generator_mock.generate_lookup_query.assert_not_called()
+        assert container_insights.metric_query_generator.helper._completed
+        assert container_insights.metric_query_generator.helper.Data == {
+            "oQuery": "dummy query"
+        }
+
+
+def test_create_query_in_invocation_polling_budget_exhausted(mocker):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper._completed = False
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_POLLING_BUDGET", 2.5
+    )
+    mocker.patch("time.sleep")
+    # Each get_query_results call lasts a second
+    mocker.patch("time.monotonic", side_effect=range(100))
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query", {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    for _ in range(2):
+        logs_stubber.add_response(
+            "get_query_results",
+            {"status": "Running"},
+            {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+        )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(EVENT, context)
+            == "ca588a23-3279-4341-adcf-87d39ea4fac3"
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    assert not metric_query_generator_mock.generate_metric_query.called
+    assert not container_insights.metric_query_generator.helper._completed
+
+
+@pytest.mark.parametrize("limit_exceeded", [True, False])
+def test_create_query_concurrency_cap(mocker, limit_exceeded):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_POLLING_BUDGET", 0
+    )
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    if limit_exceeded:
+        # The account limit is reached before the concurrency cap
+        add_describe_queries_responses(logs_stubber)
+        logs_stubber.add_client_error(
+            "start_query", service_error_code="LimitExceededException"
+        )
+    else:
+        add_describe_queries_responses(
+            logs_stubber,
+            container_insights.metric_query_generator.query_scheduler.MAX_CONCURRENT_QUERIES,
+        )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(EVENT, {})
+            == container_insights.metric_query_generator.DEFERRED_QUERY_ID
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize("completed", [True, False])
+def test_poll_create_query_deferred(mocker, completed):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "dummy log insights metric query"
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    update_poll_data_mock = mocker.patch.object(
+        container_insights.metric_query_generator.helper, "update_poll_data"
+    )
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    # Room for a single get_query_results call
+    context.get_remaining_time_in_millis.return_value = 10500
+    deferred_poll_event = {
+        **POLL_EVENT,
+        "CrHelperData": {
+            "PhysicalResourceId": container_insights.metric_query_generator.DEFERRED_QUERY_ID
+        },
+    }
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query", {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    logs_stubber.add_response(
+        "get_query_results",
+        (
+            {"status": "Complete", "results": [[{"field": "dummy"}]]}
+            if completed
+            else {"status": "Running"}
+        ),
+        {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.poll_create_query(
+                deferred_poll_event, context
+            )
+            == completed
+        )
+
+    logs_stubber.assert_no_pending_responses()
+    # The query ID is handed over to the next polls, which resume the query rather than
+    # starting it again
+    assert container_insights.metric_query_generator.helper.Data == (
+        {"oQuery": "dummy log insights metric query"}
+        if completed
+        else {"PhysicalResourceId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    assert update_poll_data_mock.called != completed
+
+
+def test_create_query_lookup_cache(mocker, tmp_path):
+    cache_event = {
+        **EVENT,
+        "ResourceType": "Custom::ContainerInsights-PodMetricQuery",
+    }
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "dummy log insights metric query"
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    mocker.patch.object(
+        container_insights.metric_query_generator,
+        "LOOKUP_CACHE",
+        LocalLookupCache(str(tmp_path)),
+    )
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    # Cache miss: the lookup query runs and its metric queries are cached
+    container_insights.metric_query_generator.helper.Data = {}
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query", {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"}
+    )
+    logs_stubber.add_response(
+        "get_query_results",
+        {"status": "Complete", "results": [[{"field": "dummy"}]]},
+        {"queryId": "ca588a23-3279-4341-adcf-87d39ea4fac3"},
+    )
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(cache_event, context)
+            == True
+        )
+    logs_stubber.assert_no_pending_responses()
+
+    # Cache hit: the lookup query is skipped altogether
+    container_insights.metric_query_generator.helper.Data = {}
+    container_insights.metric_query_generator.helper._completed = False
+    with Stubber(container_insights.metric_query_generator.get_logs_client()):
+        assert (
+            container_insights.metric_query_generator.create_query(cache_event, context)
+            == True
+        )
+
+    assert container_insights.metric_query_generator.helper._completed
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQuery": "dummy log insights metric query"
+    }
+    assert metric_query_generator_mock.generate_metric_query.call_count == 1
+
+
+@pytest.mark.parametrize("completed", [True, False])
+def test_helper_poll_enabled(mocker, completed):
+    def create(event, context):
+        if completed:
+            container_insights.metric_query_generator.helper.complete()
+        return True
+
+    helper = container_insights.metric_query_generator.InvocationPollingCfnResource()
+    helper.create(create)
+    helper.poll_create(lambda event, context: True)
+    polling_init_mock = mocker.patch.object(helper, "_polling_init")
+    cfn_response_mock = mocker.patch.object(helper, "_cfn_response")
+    mocker.patch.object(container_insights.metric_query_generator, "helper", helper)
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    helper(
+        {
+            **EVENT,
+            "StackId": "arn:aws:cloudformation:eu-central-1:123456789012:stack/test/1",
+            "RequestId": "request-id",
+            "LogicalResourceId": "NodeMetricQuery",
+            "ResponseURL": "https://example.com",
+        },
+        context,
+    )
+
+    # Completed requests are answered right away, the other ones go through the crhelper
+    # poll cycle
+    assert polling_init_mock.called != completed
+    assert cfn_response_mock.called == completed
+
+
+def test_helper_update_poll_data(mocker):
+    helper = container_insights.metric_query_generator.InvocationPollingCfnResource()
+    helper._event = {
+        **POLL_EVENT,
+        "CrHelperRule": "arn:aws:events:eu-central-1:123456789012:rule/name",
+    }
+    helper._context = mocker.MagicMock()
+    helper._context.function_name = "function-name"
+    helper.Data = {"PhysicalResourceId": "query-0,query-1"}
+    put_targets_mock = mocker.patch.object(helper, "_events_client")
+
+    helper.update_poll_data()
+
+    # The next polls are triggered with the current data
+    assert helper._event["CrHelperData"] == {"PhysicalResourceId": "query-0,query-1"}
+    put_targets_mock.put_targets.assert_called_once()
+    (target,) = put_targets_mock.put_targets.call_args.kwargs["Targets"]
+    assert json.loads(target["Input"])["CrHelperData"] == {
+        "PhysicalResourceId": "query-0,query-1"
+    }
+
+
 def test_poll_create_query(mocker):
     dummy_get_query_result_response = {
         "results": [[{"field": "dummy"}]],
@@ -120,7 +677,7 @@ def test_poll_create_query(mocker):
     }
     dummy_log_insights_metric_query = "dummy log insights metric query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_metric_query.return_value = (
         dummy_log_insights_metric_query
     )
@@ -129,7 +686,7 @@ def test_poll_create_query(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
     logs_stubber.add_response(
         "get_query_results",
         dummy_get_query_result_response,
@@ -156,6 +713,191 @@ def test_poll_create_query(mocker):
     )
 
 
+def test_poll_create_query_shards(mocker):
+    dummy_get_query_result_response = {
+        "results": [[{"field": "dummy"}]],
+        "status": "Complete",
+        "ResponseMetadata": {
+            "HTTPStatusCode": 200,
+        },
+    }
+    dummy_log_insights_metric_queries = [
+        "dummy log insights metric query shard 1",
+        "dummy log insights metric query shard 2",
+    ]
+    shard_poll_event = {
+        **POLL_EVENT,
+        "ResourceProperties": {**POLL_EVENT["ResourceProperties"], "iShardCount": "2"},
+    }
+
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_metric_queries.return_value = (
+        dummy_log_insights_metric_queries
+    )
+
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    logs_stubber.add_response(
+        "get_query_results",
+        dummy_get_query_result_response,
+        {
+            "queryId": POLL_EVENT["CrHelperData"]["PhysicalResourceId"],
+        },
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.poll_create_query(
+                shard_poll_event, {}
+            )
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    metric_query_generator_mock.generate_metric_queries.assert_called_once_with(
+        shard_poll_event, dummy_get_query_result_response
+    )
+    assert not metric_query_generator_mock.generate_metric_query.called
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQueryShard1": "dummy log insights metric query shard 1",
+        "oQueryShard2": "dummy log insights metric query shard 2",
+    }
+
+
+@pytest.mark.parametrize(
+    "top_k,expected_namespace_results",
+    [
+        (
+            None,
+            [["team-a/api", "team-b/api", "team-a/worker"], ["kube-system/coredns"]],
+        ),
+        ("1", [["team-a/api"], ["kube-system/coredns"]]),
+    ],
+)
+def test_poll_create_query_namespaces(mocker, top_k, expected_namespace_results):
+    def result(namespace: str, pod_name: str):
+        return [
+            {"field": "Namespace", "value": namespace},
+            {"field": "PodName", "value": pod_name},
+            {"field": "count()", "value": "1438"},
+        ]
+
+    dummy_get_query_result_response = {
+        "results": [
+            result("team-a", "api"),
+            result("kube-system", "coredns"),
+            result("team-b", "api"),
+            result("team-a", "worker"),
+        ],
+        "status": "Complete",
+        "ResponseMetadata": {
+            "HTTPStatusCode": 200,
+        },
+    }
+    namespaces_poll_event = {
+        **POLL_EVENT,
+        "ResourceProperties": {
+            **POLL_EVENT["ResourceProperties"],
+            "iNamespaces": ["team-*", "kube-system"],
+        },
+    }
+    if top_k:
+        namespaces_poll_event["ResourceProperties"]["iTopK"] = top_k
+
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_metric_query.side_effect = (
+        lambda event, response: ", ".join(
+            "/".join(field["value"] for field in result[:2])
+            for result in response["results"]
+        )
+    )
+
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    logs_stubber.add_response(
+        "get_query_results",
+        dummy_get_query_result_response,
+        {
+            "queryId": POLL_EVENT["CrHelperData"]["PhysicalResourceId"],
+        },
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.poll_create_query(
+                namespaces_poll_event, {}
+            )
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQueryNamespace1": ", ".join(expected_namespace_results[0]),
+        "oQueryNamespace2": ", ".join(expected_namespace_results[1]),
+    }
+
+
+def test_poll_create_query_namespaces_no_results(mocker):
+    dummy_get_query_result_response = {
+        "results": [
+            [
+                {"field": "Namespace", "value": "kube-system"},
+                {"field": "PodName", "value": "coredns"},
+                {"field": "count()", "value": "1438"},
+            ]
+        ],
+        "status": "Complete",
+        "ResponseMetadata": {
+            "HTTPStatusCode": 200,
+        },
+    }
+    namespaces_poll_event = {
+        **POLL_EVENT,
+        "ResourceProperties": {
+            **POLL_EVENT["ResourceProperties"],
+            "iNamespaces": ["kube-system", "team-*"],
+        },
+    }
+
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "dummy log insights metric query"
+    )
+
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    logs_stubber.add_response(
+        "get_query_results",
+        dummy_get_query_result_response,
+        {
+            "queryId": POLL_EVENT["CrHelperData"]["PhysicalResourceId"],
+        },
+    )
+
+    with logs_stubber, pytest.raises(Exception) as ex_info:
+        container_insights.metric_query_generator.poll_create_query(
+            namespaces_poll_event, {}
+        )
+
+    assert (
+        f'Query ID "{POLL_EVENT["CrHelperData"]["PhysicalResourceId"]}" didnt return any result for namespace "team-*"'
+        in str(ex_info.value)
+    )
+
+
 def test_poll_create_query_status_running(mocker):
     dummy_get_query_result_response = {
         "statistics": {
@@ -170,7 +912,7 @@ def test_poll_create_query_status_running(mocker):
     }
     dummy_log_insights_metric_query = "dummy log insights metric query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_metric_query.return_value = (
         dummy_log_insights_metric_query
     )
@@ -179,7 +921,7 @@ def test_poll_create_query_status_running(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
     logs_stubber.add_response(
         "get_query_results",
         dummy_get_query_result_response,
@@ -202,7 +944,7 @@ def test_poll_create_query_status_running(mocker):
 def test_poll_create_query_error(mocker):
     dummy_log_insights_metric_query = "dummy log insights metric query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_metric_query.return_value = (
         dummy_log_insights_metric_query
     )
@@ -211,7 +953,7 @@ def test_poll_create_query_error(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
     logs_stubber.add_client_error("get_query_results")
 
     with logs_stubber, pytest.raises(Exception) as ex_info:
@@ -241,7 +983,7 @@ def test_poll_create_query_status_failed(mocker):
     }
     dummy_log_insights_metric_query = "dummy log insights metric query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_metric_query.return_value = (
         dummy_log_insights_metric_query
     )
@@ -250,7 +992,7 @@ def test_poll_create_query_status_failed(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
     logs_stubber.add_response(
         "get_query_results",
         dummy_get_query_result_response,
@@ -286,7 +1028,7 @@ def test_poll_create_query_no_results(mocker):
     }
     dummy_log_insights_metric_query = "dummy log insights metric query"
 
-    metric_query_generator_mock = mocker.MagicMock()
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
     metric_query_generator_mock.generate_metric_query.return_value = (
         dummy_log_insights_metric_query
     )
@@ -295,7 +1037,7 @@ def test_poll_create_query_no_results(mocker):
         metric_query_generator_mock
     )
 
-    logs_stubber = Stubber(container_insights.metric_query_generator.LOGS_CLIENT)
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
     logs_stubber.add_response(
         "get_query_results",
         dummy_get_query_result_response,
@@ -314,3 +1056,425 @@ def test_poll_create_query_no_results(mocker):
         f'Query ID "{POLL_EVENT["CrHelperData"]["PhysicalResourceId"]}" didnt return any result, please double check the correctness of the provided investigation window'
         in str(ex_info.value)
     )
+
+
+def test_poll_create_query_truncated_results(mocker):
+    dummy_get_query_result_response = {
+        "results": [
+            [{"field": "PodName", "value": f"pod-{index}"}]
+            for index in range(
+                container_insights.metric_query_generator.MAX_LOOKUP_RESULTS
+            )
+        ],
+        "statistics": {},
+        "status": "Complete",
+    }
+
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    logs_stubber.add_response(
+        "get_query_results",
+        dummy_get_query_result_response,
+        {
+            "queryId": POLL_EVENT["CrHelperData"]["PhysicalResourceId"],
+        },
+    )
+
+    with logs_stubber, pytest.raises(Exception) as ex_info:
+        container_insights.metric_query_generator.poll_create_query(POLL_EVENT, {})
+
+    logs_stubber.assert_no_pending_responses()
+
+    assert not metric_query_generator_mock.generate_metric_query.called
+    assert (
+        f'Query ID "{POLL_EVENT["CrHelperData"]["PhysicalResourceId"]}" returned 10000 results, reaching the Logs Insights results limit'
+        in str(ex_info.value)
+    )
+
+
+def test_get_time_slices():
+    assert container_insights.metric_query_generator.get_time_slices(0, 100, 1) == [
+        (0, 100)
+    ]
+    assert container_insights.metric_query_generator.get_time_slices(0, 100, 3) == [
+        (0, 33),
+        (33, 66),
+        (66, 100),
+    ]
+
+
+@pytest.mark.parametrize(
+    "start_time,end_time,period,expected_period",
+    [
+        ("2022-12-19T12:00:00", "2022-12-19T23:00:00", None, "1m"),
+        ("2022-12-19T00:00:00", "2022-12-20T00:00:00", None, "1m"),
+        ("2022-12-19T00:00:00", "2022-12-20T00:01:00", None, "2m"),
+        ("2022-12-12T00:00:00", "2022-12-19T00:00:00", None, "10m"),
+        ("2022-11-19T00:00:00", "2022-12-19T00:00:00", None, "30m"),
+        ("2021-12-19T00:00:00", "2022-12-19T00:00:00", None, "12h"),
+        ("2016-12-19T00:00:00", "2022-12-19T00:00:00", None, "2d"),
+        ("2022-11-19T00:00:00", "2022-12-19T00:00:00", "5m", "5m"),
+    ],
+)
+def test_get_bin_period(start_time, end_time, period, expected_period):
+    properties = {"iStartTime": start_time, "iEndTime": end_time}
+    if period is not None:
+        properties["iPeriod"] = period
+
+    assert (
+        container_insights.metric_query_generator.get_bin_period(
+            {"ResourceProperties": properties}
+        )
+        == expected_period
+    )
+    # Events without investigation window fall back to the shortest period
+    assert container_insights.metric_query_generator.get_bin_period({}) == "1m"
+
+
+def lookup_result(pod_name: str, rank: str = None):
+    result = [{"field": "PodName", "value": pod_name}]
+    if rank is None:
+        return result + [{"field": "count()", "value": "1438"}]
+    return result + [{"field": "rank", "value": rank}]
+
+
+def test_merge_lookup_responses():
+    responses = [
+        {
+            "results": [lookup_result("coredns"), lookup_result("kube-proxy")],
+            "statistics": {"recordsScanned": 10.0, "bytesScanned": 100.0},
+            "status": "Complete",
+        },
+        {
+            "results": [lookup_result("kube-proxy"), lookup_result("aws-node")],
+            "statistics": {"recordsScanned": 20.0, "bytesScanned": 200.0},
+            "status": "Complete",
+        },
+    ]
+
+    assert container_insights.metric_query_generator.merge_lookup_responses(
+        EVENT, responses
+    ) == {
+        "results": [
+            [{"field": "PodName", "value": "coredns"}],
+            [{"field": "PodName", "value": "kube-proxy"}],
+            [{"field": "PodName", "value": "aws-node"}],
+        ],
+        "statistics": {"recordsScanned": 30.0, "bytesScanned": 300.0},
+        "status": "Complete",
+    }
+
+
+@pytest.mark.parametrize(
+    "statistic,expected_results",
+    [
+        ("max", [("aws-node", "9.0"), ("coredns", "8.0"), ("kube-proxy", "6.0")]),
+        ("avg", [("aws-node", "9.0"), ("kube-proxy", "5.0"), ("coredns", "4.5")]),
+    ],
+)
+def test_merge_lookup_responses_top_k(statistic, expected_results):
+    top_k_event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iTopK": "2",
+            "iTopKMetric": "pod_cpu_utilization",
+            "iTopKStatistic": statistic,
+        },
+    }
+    responses = [
+        {
+            "results": [
+                lookup_result("coredns", "8"),
+                lookup_result("kube-proxy", "6"),
+            ],
+            "status": "Complete",
+        },
+        {
+            "results": [
+                lookup_result("aws-node", "9"),
+                lookup_result("kube-proxy", "4"),
+                lookup_result("coredns", "1"),
+            ],
+            "status": "Complete",
+        },
+    ]
+
+    assert container_insights.metric_query_generator.merge_lookup_responses(
+        top_k_event, responses
+    )["results"] == [
+        [{"field": "PodName", "value": pod_name}, {"field": "rank", "value": rank}]
+        for pod_name, rank in expected_results
+    ]
+
+
+def test_create_query_time_slices(mocker):
+    time_slices_event = {
+        **EVENT,
+        "ResourceProperties": {**EVENT["ResourceProperties"], "iTimeSlices": "3"},
+    }
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.side_effect = (
+        lambda event, response: ", ".join(
+            result[0]["value"] for result in response["results"]
+        )
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    for time_slice in range(3):
+        logs_stubber.add_response("start_query", {"queryId": f"query-{time_slice}"})
+    for time_slice, pod_name in enumerate(["coredns", "kube-proxy", "coredns"]):
+        logs_stubber.add_response(
+            "get_query_results",
+            {"status": "Complete", "results": [lookup_result(pod_name)]},
+            {"queryId": f"query-{time_slice}"},
+        )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(
+                time_slices_event, context
+            )
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQuery": "coredns, kube-proxy"
+    }
+
+
+def test_poll_create_query_time_slices_deferred(mocker):
+    time_slices_poll_event = {
+        **POLL_EVENT,
+        "ResourceProperties": {**POLL_EVENT["ResourceProperties"], "iTimeSlices": "2"},
+        "CrHelperData": {"PhysicalResourceId": "query-0,deferred"},
+    }
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    container_insights.metric_query_generator.helper.Data = dict(
+        time_slices_poll_event["CrHelperData"]
+    )
+    update_poll_data_mock = mocker.patch.object(
+        container_insights.metric_query_generator.helper, "update_poll_data"
+    )
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    # Room for a single get_query_results round
+    context.get_remaining_time_in_millis.return_value = 10500
+
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response("start_query", {"queryId": "query-1"})
+    logs_stubber.add_response(
+        "get_query_results",
+        {"status": "Complete", "results": [lookup_result("coredns")]},
+        {"queryId": "query-0"},
+    )
+    logs_stubber.add_response(
+        "get_query_results", {"status": "Running"}, {"queryId": "query-1"}
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.poll_create_query(
+                time_slices_poll_event, context
+            )
+            == False
+        )
+
+    logs_stubber.assert_no_pending_responses()
+    update_poll_data_mock.assert_called_once_with()
+    assert (
+        container_insights.metric_query_generator.helper.Data["PhysicalResourceId"]
+        == "query-0,query-1"
+    )
+
+    # The next poll resumes both slices without starting any query
+    metric_query_generator_mock.generate_metric_query.return_value = (
+        "dummy log insights metric query"
+    )
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    for query_id in ["query-0", "query-1"]:
+        logs_stubber.add_response(
+            "get_query_results",
+            {"status": "Complete", "results": [lookup_result("coredns")]},
+            {"queryId": query_id},
+        )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.poll_create_query(
+                {
+                    **time_slices_poll_event,
+                    "CrHelperData": {"PhysicalResourceId": "query-0,query-1"},
+                },
+                context,
+            )
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+    update_poll_data_mock.assert_called_once_with()
+    assert (
+        container_insights.metric_query_generator.helper.Data["oQuery"]
+        == "dummy log insights metric query"
+    )
+
+
+UPDATE_EVENT = {
+    **EVENT,
+    "RequestType": "Update",
+    "ResourceType": "Custom::ContainerInsights-PodMetricQuery",
+    "ResourceProperties": {
+        **EVENT["ResourceProperties"],
+        "iEndTime": "2022-12-19T23:30:00",
+    },
+    "OldResourceProperties": EVENT["ResourceProperties"],
+}
+
+
+@pytest.mark.parametrize(
+    "old_properties,settled_time,expected_prior",
+    [
+        ({}, "2022-12-19T23:00:00", True),
+        ({"iTimeSlices": "4"}, "2022-12-19T23:00:00", True),
+        ({"iStartTime": "2022-12-19T11:00:00"}, "2022-12-19T23:00:00", False),
+        ({"iNamespace": "kube-system"}, "2022-12-19T23:00:00", False),
+        ({"iEndTime": "2022-12-19T23:30:00"}, "2022-12-19T23:00:00", False),
+        ({"iEndTime": "2022-12-20T00:00:00"}, "2022-12-19T23:00:00", False),
+        ({}, "2022-12-19T23:30:00", False),
+    ],
+)
+def test_get_prior_lookup_results(
+    mocker, tmp_path, old_properties, settled_time, expected_prior
+):
+    update_event = {
+        **UPDATE_EVENT,
+        "OldResourceProperties": {**EVENT["ResourceProperties"], **old_properties},
+    }
+    lookup_cache = LocalLookupCache(str(tmp_path))
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_CACHE", lookup_cache
+    )
+    mocker.patch.object(
+        container_insights.metric_query_generator,
+        "METRIC_QUERY_GENERATOR",
+        get_metric_query_generator_mock(mocker),
+    )
+    prior_lookup_results = {
+        "endTime": container_insights.metric_query_generator._get_timestamp(
+            "2022-12-19T23:00:00"
+        ),
+        "settledTime": container_insights.metric_query_generator._get_timestamp(
+            settled_time
+        ),
+        "response": {"status": "Complete", "results": [lookup_result("coredns")]},
+    }
+    lookup_cache.put(
+        get_lookup_results_cache_key(update_event, TEMPLATE_FINGERPRINT),
+        prior_lookup_results,
+    )
+
+    assert container_insights.metric_query_generator._get_prior_lookup_results(
+        update_event
+    ) == (prior_lookup_results if expected_prior else None)
+    # Creates always scan the whole window
+    assert (
+        container_insights.metric_query_generator._get_prior_lookup_results(
+            {**update_event, "RequestType": "Create"}
+        )
+        is None
+    )
+
+
+def test_create_query_incremental_update(mocker, tmp_path):
+    metric_query_generator_mock = get_metric_query_generator_mock(mocker)
+    metric_query_generator_mock.generate_lookup_query.return_value = "dummy query"
+    metric_query_generator_mock.generate_metric_query.side_effect = (
+        lambda event, response: ", ".join(
+            result[0]["value"] for result in response["results"]
+        )
+    )
+    container_insights.metric_query_generator.METRIC_QUERY_GENERATOR = (
+        metric_query_generator_mock
+    )
+    lookup_cache = LocalLookupCache(str(tmp_path))
+    mocker.patch.object(
+        container_insights.metric_query_generator, "LOOKUP_CACHE", lookup_cache
+    )
+    get_timestamp = container_insights.metric_query_generator._get_timestamp
+    lookup_cache.put(
+        get_lookup_results_cache_key(UPDATE_EVENT, TEMPLATE_FINGERPRINT),
+        {
+            "endTime": get_timestamp("2022-12-19T23:00:00"),
+            "settledTime": get_timestamp("2022-12-19T22:45:00"),
+            "response": {
+                "status": "Complete",
+                "results": [lookup_result("coredns"), lookup_result("kube-proxy")],
+                "statistics": {"bytesScanned": 1000.0},
+            },
+        },
+    )
+    container_insights.metric_query_generator.helper.Data = {}
+    mocker.patch("time.sleep")
+    context = mocker.MagicMock()
+    context.get_remaining_time_in_millis.return_value = 60000
+
+    # Only the time range past the settled time of the former window is scanned
+    logs_stubber = Stubber(container_insights.metric_query_generator.get_logs_client())
+    add_describe_queries_responses(logs_stubber)
+    logs_stubber.add_response(
+        "start_query",
+        {"queryId": "query-0"},
+        {
+            "logGroupName": "/aws/containerinsights/eks-cluster/performance",
+            "startTime": get_timestamp("2022-12-19T22:45:00"),
+            "endTime": get_timestamp("2022-12-19T23:30:00"),
+            "queryString": "dummy query",
+        },
+    )
+    logs_stubber.add_response(
+        "get_query_results",
+        {
+            "status": "Complete",
+            "results": [lookup_result("coredns"), lookup_result("aws-node")],
+            "statistics": {"bytesScanned": 100.0},
+        },
+        {"queryId": "query-0"},
+    )
+
+    with logs_stubber:
+        assert (
+            container_insights.metric_query_generator.create_query(
+                UPDATE_EVENT, context
+            )
+            == True
+        )
+
+    logs_stubber.assert_no_pending_responses()
+    assert container_insights.metric_query_generator.helper.Data == {
+        "oQuery": "coredns, kube-proxy, aws-node"
+    }
+    lookup_results = lookup_cache.get(
+        get_lookup_results_cache_key(UPDATE_EVENT, TEMPLATE_FINGERPRINT)
+    )
+    assert lookup_results["endTime"] == get_timestamp("2022-12-19T23:30:00")
+    assert lookup_results["response"]["statistics"] == {"bytesScanned": 1100.0}
@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Namespace selectors, as configured in the "dashboard_configuration.yaml" file, come in
+three flavors:
+    1. plain namespace names, eg. "kube-system"
+    2. wildcards, eg. "team-*" or "team-?"
+    3. regular expressions enclosed in slashes, eg. "/^team-(a|b)$/"
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+WILDCARD_CHARACTERS = "*?"
+
+
+def get_selector_regex(selector: str) -> Optional[str]:
+    """Regular expression matching a wildcard or regex selector, None for plain names"""
+
+    if len(selector) > 1 and selector.startswith("/") and selector.endswith("/"):
+        return selector[1:-1]
+
+    if any(character in selector for character in WILDCARD_CHARACTERS):
+        return (
+            "^"
+            + "".join(
+                (
+                    ".*"
+                    if character == "*"
+                    else "." if character == "?" else re.escape(character)
+                )
+                for character in selector
+            )
+            + "$"
+        )
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def _compile_selector(selector: str) -> Optional[re.Pattern]:
+    if (regex := get_selector_regex(selector)) is None:
+        return None
+    return re.compile(regex)
+
+
+def match_namespace(selector: str, namespace: str) -> bool:
+    """Whether a namespace is selected by a given selector"""
+
+    if (pattern := _compile_selector(selector)) is None:
+        return namespace == selector
+    return pattern.search(namespace) is not None
+
+
+def generate_namespace_filter(selectors: List[str]) -> str:
+    """Logs Insights filter expression matching any of the given selectors"""
+
+    namespace_names = [
+        selector for selector in selectors if get_selector_regex(selector) is None
+    ]
+    expressions = []
+    if namespace_names:
+        expressions.append(
+            "Namespace in [{}]".format(
+                ", ".join(f'"{namespace}"' for namespace in namespace_names)
+            )
+        )
+    expressions.extend(
+        f"Namespace like /{regex}/"
+        for selector in selectors
+        if (regex := get_selector_regex(selector)) is not None
+    )
+
+    return f"({' or '.join(expressions)})"
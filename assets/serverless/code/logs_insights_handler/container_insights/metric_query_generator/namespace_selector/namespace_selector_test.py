@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import pytest
+from container_insights.metric_query_generator.namespace_selector import (
+    generate_namespace_filter,
+    get_selector_regex,
+    match_namespace,
+)
+
+
+@pytest.mark.parametrize(
+    "selector,regex",
+    [
+        ("kube-system", None),
+        ("team-*", "^team\\-.*$"),
+        ("team-?", "^team\\-.$"),
+        ("/^team-(a|b)$/", "^team-(a|b)$"),
+        ("/", None),
+    ],
+)
+def test_get_selector_regex(mocker, selector, regex):
+    assert get_selector_regex(selector) == regex
+
+
+@pytest.mark.parametrize(
+    "selector,namespace,expected",
+    [
+        ("kube-system", "kube-system", True),
+        ("kube-system", "kube-system-2", False),
+        ("team-*", "team-a", True),
+        ("team-*", "team-", True),
+        ("team-*", "my-team-a", False),
+        ("team-?", "team-a", True),
+        ("team-?", "team-ab", False),
+        ("/^team-(a|b)$/", "team-b", True),
+        ("/^team-(a|b)$/", "team-c", False),
+        ("/team/", "my-team-c", True),
+    ],
+)
+def test_match_namespace(mocker, selector, namespace, expected):
+    assert match_namespace(selector, namespace) == expected
+
+
+def test_generate_namespace_filter(mocker):
+    assert (
+        generate_namespace_filter(["kube-system", "team-*", "amazon-metrics", "/^ops/"])
+        == '(Namespace in ["kube-system", "amazon-metrics"] or Namespace like /^team\\-.*$/ or Namespace like /^ops/)'
+    )
+    assert (
+        generate_namespace_filter(["kube-system"]) == '(Namespace in ["kube-system"])'
+    )
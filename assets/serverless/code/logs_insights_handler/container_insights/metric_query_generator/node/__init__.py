@@ -14,14 +14,24 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from container_insights.metric_query_generator import MetricQueryGenerator
-from jinja2 import BaseLoader, Environment
+from typing import List, Optional
 
+from container_insights.metric_query_generator import (
+    LOG_STREAM_FILTER_TEMPLATE,
+    LogStreamTargetingMixin,
+    LookupQueryMixin,
+    MetricQueryRenderingMixin,
+    get_bin_period,
+)
+from container_insights.metric_query_generator.query_results import QueryResults
 
-class NodeMetricQueryGenerator(MetricQueryGenerator):
+
+class NodeMetricQueryGenerator(
+    LookupQueryMixin, LogStreamTargetingMixin, MetricQueryRenderingMixin
+):
     """Concrete implementation of the Node specific Metric Query Generator class."""
 
-    QUERY_TEMPLATE = (
+    QUERY_TEMPLATE = LOG_STREAM_FILTER_TEMPLATE + (
         "fields {metric}, "
         "{% for node_name in node_names %}"
         '(NodeName = \\"{{ node_name }}\\") as node{{ loop.index }}{{ ", " if not loop.last else " " }}'
@@ -35,31 +45,50 @@ class NodeMetricQueryGenerator(MetricQueryGenerator):
     )
 
     def generate_lookup_query(self, event) -> str:
-        """The Node lookup query is about retrieving all the node names."""
+        """
+        The Node lookup query is about retrieving all the node names, or only the top K
+        ones when ranking the nodes by a given metric.
+        """
+
+        if "iTopK" in event["ResourceProperties"]:
+            return (
+                'fields NodeName | filter (Type = "Node" or Type = "NodeNet" or Type = "NodeFS" or Type = "NodeDiskIO") and ispresent({metric}) | {stats}'
+            ).format(
+                metric=event["ResourceProperties"]["iTopKMetric"],
+                stats=self.generate_top_k_stats(event, "NodeName"),
+            )
 
         return 'fields NodeName | filter Type = "Node" | stats count() by NodeName'
 
-    def generate_metric_query(self, event, response) -> str:
+    def get_result_series(self, event, results: QueryResults) -> List[str]:
+        """The node names are the log stream names as well."""
+        return results.column("NodeName")
+
+    def get_series(self, event, response) -> List[str]:
+        """The Node series are the node names collected via the lookup query."""
+
+        return [
+            node_name
+            for node_name in QueryResults.from_response(response).column("NodeName")
+            if node_name is not None
+        ]
+
+    def render_metric_query(
+        self, event, series: List[str], log_streams: Optional[List[str]] = None
+    ) -> str:
         """
-        Thanks to the results collected via the lookup query, we can render the Node metric
-        query.
+        Thanks to the node names collected via the lookup query, we can render the Node
+        metric query.
         This query is not metric-specific but it is specific to node metrics.
-        The query will be formatted for a specific node metric at a later stage thanks to
-        the Custom::ContainerInsights-MetricQueryFormatter resource.
+        The query will be formatted for every node metric of the dashboard at deployment
+        time, by the Fn::Split and Fn::Join intrinsic functions of the dashboard widgets.
+        Restricted to the log streams of the plotted nodes ("iTargetLogStreams"), the query
+        only scans the logs of these nodes.
         """
 
-        node_names = [
-            field["value"]
-            for result in response["results"]
-            for field in result
-            if field["field"] == "NodeName"
-        ]
-
-        query_template = Environment(loader=BaseLoader()).from_string(
-            NodeMetricQueryGenerator.QUERY_TEMPLATE
-        )
-        return query_template.render(
-            node_names=node_names,
+        return self.query_template.render(
+            log_streams=log_streams,
+            node_names=series,
             aggregation_function="max",
-            period="1m",
+            period=get_bin_period(event),
         )
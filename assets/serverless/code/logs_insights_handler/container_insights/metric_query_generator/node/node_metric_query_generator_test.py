@@ -14,6 +14,8 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import copy
+
 from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
 
 EVENT = {
@@ -65,6 +67,19 @@ def test_generate_lookup_query(mocker):
     )
 
 
+def test_generate_lookup_query_top_k(mocker):
+    node_metric_query_generator = NodeMetricQueryGenerator()
+    top_k_event = copy.deepcopy(EVENT)
+    top_k_event["ResourceProperties"].update(
+        {"iTopK": "5", "iTopKMetric": "node_cpu_utilization"}
+    )
+
+    assert (
+        node_metric_query_generator.generate_lookup_query(top_k_event)
+        == 'fields NodeName | filter (Type = "Node" or Type = "NodeNet" or Type = "NodeFS" or Type = "NodeDiskIO") and ispresent(node_cpu_utilization) | stats max(node_cpu_utilization) as rank by NodeName | sort rank desc | limit 5'
+    )
+
+
 def test_generate_metric_query(mocker):
     node_metric_query_generator = NodeMetricQueryGenerator()
 
@@ -78,3 +93,29 @@ def test_generate_metric_query(mocker):
         "sum({metric} * node1) / sum(node1) as `ip-192-168-10-213.eu-central-1.compute.internal` "
         "by bin(1m)"
     )
+
+
+def test_generate_metric_queries_log_streams(mocker):
+    node_metric_query_generator = NodeMetricQueryGenerator()
+    log_streams_event = copy.deepcopy(EVENT)
+    log_streams_event["ResourceProperties"].update(
+        {"iTargetLogStreams": "true", "iShardCount": "2"}
+    )
+    response = {
+        "results": [
+            [{"field": "NodeName", "value": node_name}]
+            for node_name in ["ip-10-0-1-1", "ip-10-0-1-2", "ip-10-0-1-3"]
+        ],
+        "status": "Complete",
+    }
+
+    queries = node_metric_query_generator.generate_metric_queries(
+        log_streams_event, response
+    )
+
+    assert queries[0].startswith(
+        'filter @logStream in [\\"ip-10-0-1-1\\", \\"ip-10-0-1-2\\"] | fields {metric}, '
+    )
+    assert queries[1].startswith(
+        'filter @logStream in [\\"ip-10-0-1-3\\"] | fields {metric}, '
+    )
@@ -14,53 +14,200 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from container_insights.metric_query_generator import MetricQueryGenerator
-from jinja2 import BaseLoader, Environment
+import re
+from typing import List, Optional, Tuple
 
+from container_insights.metric_query_generator import (
+    LOG_STREAM_FILTER_TEMPLATE,
+    LOG_STREAM_NAME_FIELD,
+    LogStreamTargetingMixin,
+    LookupQueryMixin,
+    MetricQueryRenderingMixin,
+    get_bin_period,
+    is_log_stream_targeted,
+)
+from container_insights.metric_query_generator.namespace_selector import (
+    generate_namespace_filter,
+)
+from container_insights.metric_query_generator.query_results import QueryResults
 
-class PodMetricQueryGenerator(MetricQueryGenerator):
+# Characters of the random suffixes Kubernetes controllers append to the names of the
+# pods they own (k8s.io/apimachinery/pkg/util/rand), free of vowels and look-alikes
+POD_NAME_SUFFIX_CHARACTERS = "[bcdfghjklmnpqrstvwxz2456789]"
+
+# Suffixes of the names of the pods owned by a workload, following the workload name
+WORKLOAD_POD_NAME_SUFFIX = (
+    # Deployment: ReplicaSet pod template hash, then pod suffix
+    f"({POD_NAME_SUFFIX_CHARACTERS}{{6,10}}-{POD_NAME_SUFFIX_CHARACTERS}{{5}}"
+    # CronJob: Job scheduled time, then pod suffix
+    f"|[0-9]+-{POD_NAME_SUFFIX_CHARACTERS}{{5}}"
+    # DaemonSet, ReplicaSet or Job: pod suffix
+    f"|{POD_NAME_SUFFIX_CHARACTERS}{{5}}"
+    # StatefulSet: pod ordinal
+    "|[0-9]+)"
+)
+
+WORKLOAD_POD_NAME_REGEX = re.compile(f"^(.+?)-{WORKLOAD_POD_NAME_SUFFIX}$")
+
+
+def get_workload_name(pod_name: str) -> str:
+    """The name of the workload owning a pod, the pod name for standalone pods"""
+
+    if match := WORKLOAD_POD_NAME_REGEX.match(pod_name):
+        return match.group(1)
+    return pod_name
+
+
+def get_workload_label_field(workload_label: str) -> str:
+    """Logs Insights field of a kubernetes label"""
+    return f"kubernetes.labels.{workload_label}"
+
+
+class PodMetricQueryGenerator(
+    LookupQueryMixin, LogStreamTargetingMixin, MetricQueryRenderingMixin
+):
     """Concrete implementation of the Pod specific Metric Query Generator class."""
 
-    QUERY_TEMPLATE = (
+    QUERY_TEMPLATE = LOG_STREAM_FILTER_TEMPLATE + (
+        "{% set multiple_namespaces = namespaces | length > 1 %}"
         "fields {metric}, "
-        "{% for pod_name in pod_names %}"
-        '(PodName = \\"{{ pod_name }}\\") as pod{{ loop.index }}{{ ", " if not loop.last else " " }}'
+        "{% for namespace, pod_name in pod_names %}"
+        '({% if multiple_namespaces %}Namespace = \\"{{ namespace }}\\" and {% endif %}'
+        "{% if workload_label_field %}"
+        '`{{ workload_label_field }}` = \\"{{ pod_name }}\\"'
+        "{% elif workload_pod_name_suffix %}"
+        'PodName like /^{{ pod_name | replace(".", "[.]") }}-{{ workload_pod_name_suffix }}$/'
+        "{% else %}"
+        'PodName = \\"{{ pod_name }}\\"'
+        "{% endif %}"
+        ') as pod{{ loop.index }}{{ ", " if not loop.last else " " }}'
         "{% endfor %}"
-        '| filter (Type = \\"Pod\\" or Type = \\"PodNet\\") and Namespace = \\"{{ namespace }}\\" and ispresent({metric}) '
+        '| filter (Type = \\"Pod\\" or Type = \\"PodNet\\") and '
+        "{% if multiple_namespaces %}"
+        'Namespace in [{% for namespace in namespaces %}\\"{{ namespace }}\\"{{ ", " if not loop.last }}{% endfor %}] '
+        "{% else %}"
+        'Namespace = \\"{{ namespaces[0] }}\\" '
+        "{% endif %}"
+        "and ispresent({metric}) "
         "| stats "
-        "{% for pod_name in pod_names %}"
-        'sum({metric} * pod{{ loop.index }}) / sum(pod{{ loop.index }}) as `{{ pod_name }}`{{ ", " if not loop.last else " " }}'
+        "{% for namespace, pod_name in pod_names %}"
+        'sum({metric} * pod{{ loop.index }}) / sum(pod{{ loop.index }}) as `{% if multiple_namespaces %}{{ namespace }}/{% endif %}{{ pod_name }}`{{ ", " if not loop.last else " " }}'
         "{% endfor %}"
         "by bin({{ period }})"
     )
 
     def generate_lookup_query(self, event) -> str:
-        """The Pod lookup query is about retrieving all the pod names for a given namespace."""
+        """
+        The Pod lookup query is about retrieving all the pod names for a given namespace,
+        or only the top K ones when ranking the pods by a given metric.
+        A single lookup query can serve several namespace selectors ("iNamespaces"), the
+        pod names are then grouped by namespace.
+        Pods grouped by a workload label ("iWorkloadLabel") are looked up by label value
+        rather than by pod name.
+        Metric queries restricted to log streams ("iTargetLogStreams") need the nodes the
+        pods were running on as well.
+        Top K lookups whose results are not distinct series, per node or per pod of a same
+        workload, keep every ranked result, the top K series being selected afterwards.
+        """
+
+        properties = event["ResourceProperties"]
+        name_field = "PodName"
+        if (workload_label_field := self.get_workload_label_field(event)) is not None:
+            name_field = f"`{workload_label_field}`"
+        if "iNamespaces" in properties:
+            fields = f"Namespace, {name_field}"
+            namespace_filter = generate_namespace_filter(properties["iNamespaces"])
+        else:
+            fields = name_field
+            namespace_filter = f'Namespace = "{properties["iNamespace"]}"'
+        if workload_label_field is not None:
+            namespace_filter += f" and ispresent({name_field})"
+        if is_log_stream_targeted(event):
+            fields += f", {LOG_STREAM_NAME_FIELD}"
+
+        if "iTopK" in properties:
+            return (
+                'fields {fields} | filter (Type = "Pod" or Type = "PodNet") and {namespace_filter} and ispresent({metric}) | {stats}'
+            ).format(
+                fields=fields,
+                namespace_filter=namespace_filter,
+                metric=properties["iTopKMetric"],
+                stats=self.generate_top_k_stats(
+                    event,
+                    fields,
+                    distinct_series=not is_log_stream_targeted(event)
+                    and (
+                        properties.get("iGroupBy", "pod") != "workload"
+                        or workload_label_field is not None
+                    ),
+                ),
+            )
 
         return (
-            'fields PodName | filter Type = "Pod" and Namespace = "{namespace}" | stats count() by PodName'
-        ).format(namespace=event["ResourceProperties"]["iNamespace"])
+            'fields {fields} | filter Type = "Pod" and {namespace_filter} | stats count() by {fields}'
+        ).format(fields=fields, namespace_filter=namespace_filter)
+
+    def get_series(self, event, response) -> List[Tuple[str, str]]:
+        """
+        The Pod series are the (namespace, pod name) pairs collected via the lookup query.
+        Pods grouped by workload ("iGroupBy") make (namespace, workload name) series
+        instead, the workload name being either derived from the pod name or read from the
+        workload label.
+        """
+
+        return list(
+            dict.fromkeys(
+                self.get_result_series(event, QueryResults.from_response(response))
+            )
+        )
 
-    def generate_metric_query(self, event, response) -> str:
+    def get_result_series(self, event, results: QueryResults) -> List[Tuple[str, str]]:
+        namespaces = results.column(
+            "Namespace", event["ResourceProperties"].get("iNamespace")
+        )
+        if event["ResourceProperties"].get("iGroupBy", "pod") != "workload":
+            return list(zip(namespaces, results.column("PodName")))
+
+        if (workload_label_field := self.get_workload_label_field(event)) is not None:
+            workload_names = results.column(workload_label_field)
+        else:
+            workload_names = map(get_workload_name, results.column("PodName"))
+        return list(zip(namespaces, workload_names))
+
+    def render_metric_query(
+        self,
+        event,
+        series: List[Tuple[str, str]],
+        log_streams: Optional[List[str]] = None,
+    ) -> str:
         """
-        Thanks to the results collected via the lookup query, we can render the Pod metric
-        query.
+        Thanks to the pod names collected via the lookup query, we can render the Pod
+        metric query.
         This query is not metric-specific but it is specific to pod metrics.
-        The query will be formatted for a specific pod metric at a later stage thanks to
-        the Custom::ContainerInsights-MetricQueryFormatter resource.
+        The query will be formatted for every pod metric of the dashboard at deployment
+        time, by the Fn::Split and Fn::Join intrinsic functions of the dashboard widgets.
         """
-        pod_names = [
-            field["value"]
-            for result in response["results"]
-            for field in result
-            if field["field"] == "PodName"
-        ]
-
-        query_template = Environment(loader=BaseLoader()).from_string(
-            PodMetricQueryGenerator.QUERY_TEMPLATE
+
+        grouped_by_workload = (
+            event.get("ResourceProperties", {}).get("iGroupBy", "pod") == "workload"
         )
-        return query_template.render(
-            namespace=event["ResourceProperties"]["iNamespace"],
-            pod_names=pod_names,
-            period="1m",
+        return self.query_template.render(
+            log_streams=log_streams,
+            namespaces=list(dict.fromkeys(namespace for namespace, _ in series)),
+            pod_names=series,
+            workload_label_field=self.get_workload_label_field(event),
+            workload_pod_name_suffix=(
+                WORKLOAD_POD_NAME_SUFFIX if grouped_by_workload else None
+            ),
+            period=get_bin_period(event),
         )
+
+    def get_workload_label_field(self, event) -> Optional[str]:
+        """The field of the label the pods are grouped by, None if not grouped by label"""
+
+        properties = event.get("ResourceProperties", {})
+        if properties.get("iGroupBy", "pod") != "workload":
+            return None
+        if not (workload_label := properties.get("iWorkloadLabel", None)):
+            return None
+        return get_workload_label_field(workload_label)
@@ -14,7 +14,18 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+from typing import Any, Dict, List
+
+import pytest
+from container_insights.metric_query_generator import (
+    DEFAULT_MAX_QUERY_LENGTH,
+    EMPTY_SHARD_QUERY,
+)
+from container_insights.metric_query_generator.pod import (
+    WORKLOAD_POD_NAME_SUFFIX,
+    PodMetricQueryGenerator,
+    get_workload_name,
+)
 
 EVENT = {
     "RequestType": "Create",
@@ -126,6 +137,61 @@ def test_generate_lookup_query(mocker):
     )
 
 
+@pytest.mark.parametrize(
+    "statistic,aggregation",
+    [
+        (None, "max(pod_cpu_utilization)"),
+        ("max", "max(pod_cpu_utilization)"),
+        ("avg", "avg(pod_cpu_utilization)"),
+        ("p95", "pct(pod_cpu_utilization, 95)"),
+    ],
+)
+def test_generate_lookup_query_top_k(mocker, statistic, aggregation):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    top_k_event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iTopK": "10",
+            "iTopKMetric": "pod_cpu_utilization",
+        },
+    }
+    if statistic:
+        top_k_event["ResourceProperties"]["iTopKStatistic"] = statistic
+
+    assert (
+        pod_metric_query_generator.generate_lookup_query(top_k_event)
+        == f'fields PodName | filter (Type = "Pod" or Type = "PodNet") and Namespace = "eks-baseline-services" and ispresent(pod_cpu_utilization) | stats {aggregation} as rank by PodName | sort rank desc | limit 10'
+    )
+
+
+def test_generate_metric_query_top_k(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+
+    assert pod_metric_query_generator.generate_metric_query(
+        EVENT,
+        {
+            "results": [
+                [
+                    {"field": "PodName", "value": "coredns"},
+                    {"field": "rank", "value": "87.5"},
+                ],
+                [
+                    {"field": "PodName", "value": "kube-proxy"},
+                    {"field": "rank", "value": "12.25"},
+                ],
+            ],
+            "status": "Complete",
+        },
+    ) == pod_metric_query_generator.render_metric_query(
+        EVENT,
+        [
+            ("eks-baseline-services", "coredns"),
+            ("eks-baseline-services", "kube-proxy"),
+        ],
+    )
+
+
 def test_generate_metric_query(mocker):
     pod_metric_query_generator = PodMetricQueryGenerator()
 
@@ -169,3 +235,383 @@ def test_generate_metric_query(mocker):
         "sum({metric} * pod16) / sum(pod16) as `gatekeeper-audit` "
         "by bin(1m)"
     )
+
+
+def test_generate_metric_queries(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    pod_names = pod_metric_query_generator.get_series(EVENT, LOOKUP_QUERY_RESPONSE)
+
+    assert pod_metric_query_generator.generate_metric_queries(
+        _shard_event(shard_count=3), LOOKUP_QUERY_RESPONSE
+    ) == [
+        pod_metric_query_generator.render_metric_query(EVENT, pod_names[0:6]),
+        pod_metric_query_generator.render_metric_query(EVENT, pod_names[6:11]),
+        pod_metric_query_generator.render_metric_query(EVENT, pod_names[11:16]),
+    ]
+
+
+def test_generate_metric_queries_empty_shard(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+
+    queries = pod_metric_query_generator.generate_metric_queries(
+        _shard_event(shard_count=17), LOOKUP_QUERY_RESPONSE
+    )
+
+    assert len(queries) == 17
+    assert queries[15] == pod_metric_query_generator.render_metric_query(
+        EVENT, [("eks-baseline-services", "gatekeeper-audit")]
+    )
+    assert queries[16] == EMPTY_SHARD_QUERY
+
+
+def test_generate_metric_queries_over_budget(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    max_query_length = max(
+        len(query)
+        for query in pod_metric_query_generator.generate_metric_queries(
+            _shard_event(shard_count=2), LOOKUP_QUERY_RESPONSE
+        )
+    )
+
+    # Fits the budget as long as the metric name is not longer than "{metric}"
+    assert (
+        len(
+            pod_metric_query_generator.generate_metric_queries(
+                _shard_event(
+                    shard_count=2,
+                    max_query_length=max_query_length,
+                    max_metric_name_length=len("{metric}"),
+                ),
+                LOOKUP_QUERY_RESPONSE,
+            )
+        )
+        == 2
+    )
+
+    # The longest shard has 10 "{metric}" placeholders (fields, filter and 8 pods), each
+    # of them growing by 15 characters once formatted
+    with pytest.raises(Exception) as ex_info:
+        pod_metric_query_generator.generate_metric_queries(
+            _shard_event(
+                shard_count=2,
+                max_query_length=max_query_length + 10 * 15 - 1,
+                max_metric_name_length=len("pod_network_total_bytes"),
+            ),
+            LOOKUP_QUERY_RESPONSE,
+        )
+
+    assert (
+        f"Metric query shard 2/2 is {max_query_length + 10 * 15} characters long, exceeding the {max_query_length + 10 * 15 - 1} characters budget, please increase the number of shards"
+        in str(ex_info.value)
+    )
+
+
+def test_set_metric_queries_over_budget(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    query_length = len(
+        pod_metric_query_generator.generate_metric_query(EVENT, LOOKUP_QUERY_RESPONSE)
+    )
+
+    # A single shard query is checked against the budget as well
+    with pytest.raises(Exception) as ex_info:
+        pod_metric_query_generator.set_metric_queries(
+            _shard_event(shard_count=1, max_query_length=query_length - 1),
+            LOOKUP_QUERY_RESPONSE,
+        )
+
+    assert (
+        f"Metric query is {query_length} characters long, exceeding the {query_length - 1} characters budget, please increase the number of shards"
+        in str(ex_info.value)
+    )
+
+
+def _shard_event(
+    shard_count: int,
+    max_query_length: int = DEFAULT_MAX_QUERY_LENGTH,
+    max_metric_name_length: int = len("{metric}"),
+) -> Dict[str, Any]:
+    return {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iShardCount": str(shard_count),
+            "iMaxQueryLength": str(max_query_length),
+            "iMaxMetricNameLength": str(max_metric_name_length),
+        },
+    }
+
+
+def test_generate_lookup_query_multiple_namespaces(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    namespaces_event = _namespaces_event(["kube-system", "team-*"])
+
+    assert (
+        pod_metric_query_generator.generate_lookup_query(namespaces_event)
+        == 'fields Namespace, PodName | filter Type = "Pod" and (Namespace in ["kube-system"] or Namespace like /^team\\-.*$/) | stats count() by Namespace, PodName'
+    )
+
+    namespaces_event["ResourceProperties"].update(
+        {"iTopK": "10", "iTopKMetric": "pod_cpu_utilization"}
+    )
+
+    # The top K pods are selected per namespace selector once the results are fanned out
+    assert (
+        pod_metric_query_generator.generate_lookup_query(namespaces_event)
+        == 'fields Namespace, PodName | filter (Type = "Pod" or Type = "PodNet") and (Namespace in ["kube-system"] or Namespace like /^team\\-.*$/) and ispresent(pod_cpu_utilization) | stats max(pod_cpu_utilization) as rank by Namespace, PodName | sort rank desc'
+    )
+
+
+def test_generate_metric_query_multiple_namespaces(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+
+    assert pod_metric_query_generator.generate_metric_query(
+        _namespaces_event(["team-*"]),
+        {
+            "results": [
+                [
+                    {"field": "Namespace", "value": "team-a"},
+                    {"field": "PodName", "value": "api"},
+                    {"field": "count()", "value": "1438"},
+                ],
+                [
+                    {"field": "Namespace", "value": "team-b"},
+                    {"field": "PodName", "value": "api"},
+                    {"field": "count()", "value": "1438"},
+                ],
+            ],
+            "status": "Complete",
+        },
+    ) == (
+        "fields {metric}, "
+        '(Namespace = \\"team-a\\" and PodName = \\"api\\") as pod1, '
+        '(Namespace = \\"team-b\\" and PodName = \\"api\\") as pod2 '
+        '| filter (Type = \\"Pod\\" or Type = \\"PodNet\\") and Namespace in [\\"team-a\\", \\"team-b\\"] and ispresent({metric}) '
+        "| stats "
+        "sum({metric} * pod1) / sum(pod1) as `team-a/api`, "
+        "sum({metric} * pod2) / sum(pod2) as `team-b/api` "
+        "by bin(1m)"
+    )
+
+
+@pytest.mark.parametrize(
+    "pod_name,workload_name",
+    [
+        ("coredns-5d4f7d6b8c-x7k2p", "coredns"),
+        (
+            "aws-load-balancer-controller-7b6c9d8f45-q2w4z",
+            "aws-load-balancer-controller",
+        ),
+        ("aws-node-x7k2p", "aws-node"),
+        ("report-28443480-vbz5q", "report"),
+        ("kafka-0", "kafka"),
+        ("kafka-12", "kafka"),
+        ("metrics-server", "metrics-server"),
+        ("cert-manager-webhook", "cert-manager-webhook"),
+    ],
+)
+def test_get_workload_name(pod_name, workload_name):
+    assert get_workload_name(pod_name) == workload_name
+
+
+def test_generate_metric_query_workloads(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    workloads_event = {
+        **EVENT,
+        "ResourceProperties": {**EVENT["ResourceProperties"], "iGroupBy": "workload"},
+    }
+    response = {
+        "results": [
+            [{"field": "PodName", "value": pod_name}]
+            for pod_name in [
+                "coredns-5d4f7d6b8c-x7k2p",
+                "coredns-5d4f7d6b8c-bq9zr",
+                "coredns-6c8d9f7b5d-m2n4p",
+                "web.v2-0",
+            ]
+        ],
+        "status": "Complete",
+    }
+
+    # Every pod of a workload, across rollouts, makes a single series
+    assert pod_metric_query_generator.get_series(workloads_event, response) == [
+        ("eks-baseline-services", "coredns"),
+        ("eks-baseline-services", "web.v2"),
+    ]
+    assert pod_metric_query_generator.generate_metric_query(
+        workloads_event, response
+    ) == (
+        "fields {metric}, "
+        f"(PodName like /^coredns-{WORKLOAD_POD_NAME_SUFFIX}$/) as pod1, "
+        f"(PodName like /^web[.]v2-{WORKLOAD_POD_NAME_SUFFIX}$/) as pod2 "
+        '| filter (Type = \\"Pod\\" or Type = \\"PodNet\\") and Namespace = \\"eks-baseline-services\\" and ispresent({metric}) '
+        "| stats "
+        "sum({metric} * pod1) / sum(pod1) as `coredns`, "
+        "sum({metric} * pod2) / sum(pod2) as `web.v2` "
+        "by bin(1m)"
+    )
+
+
+def test_generate_metric_query_workload_label(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    workload_label_event = _namespaces_event(["team-*"])
+    workload_label_event["ResourceProperties"].update(
+        {"iGroupBy": "workload", "iWorkloadLabel": "app.kubernetes.io/name"}
+    )
+
+    assert (
+        pod_metric_query_generator.generate_lookup_query(workload_label_event)
+        == 'fields Namespace, `kubernetes.labels.app.kubernetes.io/name` | filter Type = "Pod" and (Namespace like /^team\\-.*$/) and ispresent(`kubernetes.labels.app.kubernetes.io/name`) | stats count() by Namespace, `kubernetes.labels.app.kubernetes.io/name`'
+    )
+    assert pod_metric_query_generator.generate_metric_query(
+        workload_label_event,
+        {
+            "results": [
+                [
+                    {"field": "Namespace", "value": "team-a"},
+                    {
+                        "field": "kubernetes.labels.app.kubernetes.io/name",
+                        "value": "api",
+                    },
+                    {"field": "count()", "value": "1438"},
+                ],
+            ],
+            "status": "Complete",
+        },
+    ) == (
+        "fields {metric}, "
+        '(`kubernetes.labels.app.kubernetes.io/name` = \\"api\\") as pod1 '
+        '| filter (Type = \\"Pod\\" or Type = \\"PodNet\\") and Namespace = \\"team-a\\" and ispresent({metric}) '
+        "| stats "
+        "sum({metric} * pod1) / sum(pod1) as `api` "
+        "by bin(1m)"
+    )
+
+
+def _namespaces_event(namespace_selectors: List[str]) -> Dict[str, Any]:
+    properties = {
+        key: value
+        for key, value in EVENT["ResourceProperties"].items()
+        if key != "iNamespace"
+    }
+    return {
+        **EVENT,
+        "ResourceProperties": {**properties, "iNamespaces": namespace_selectors},
+    }
+
+
+def test_generate_lookup_query_log_streams(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    log_streams_event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iTargetLogStreams": "true",
+        },
+    }
+
+    assert (
+        pod_metric_query_generator.generate_lookup_query(log_streams_event)
+        == 'fields PodName, NodeName | filter Type = "Pod" and Namespace = "eks-baseline-services" | stats count() by PodName, NodeName'
+    )
+
+
+def test_generate_metric_queries_log_streams(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    log_streams_event = _shard_event(shard_count=2)
+    log_streams_event["ResourceProperties"]["iTargetLogStreams"] = "true"
+    response = {
+        "results": [
+            [
+                {"field": "PodName", "value": pod_name},
+                {"field": "NodeName", "value": node_name},
+            ]
+            for pod_name, node_name in [
+                ("coredns", "ip-10-0-1-1"),
+                # Rescheduled pod, reported once per node
+                ("coredns", "ip-10-0-1-2"),
+                ("kube-proxy", "ip-10-0-1-1"),
+                ("metrics-server", "ip-10-0-1-3"),
+            ]
+        ],
+        "status": "Complete",
+    }
+
+    assert pod_metric_query_generator.generate_metric_queries(
+        log_streams_event, response
+    ) == [
+        pod_metric_query_generator.render_metric_query(
+            EVENT,
+            [
+                ("eks-baseline-services", "coredns"),
+                ("eks-baseline-services", "kube-proxy"),
+            ],
+            ["ip-10-0-1-1", "ip-10-0-1-2"],
+        ),
+        pod_metric_query_generator.render_metric_query(
+            EVENT,
+            [("eks-baseline-services", "metrics-server")],
+            ["ip-10-0-1-3"],
+        ),
+    ]
+
+
+def test_select_top_k_results_log_streams(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    log_streams_event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iTargetLogStreams": "true",
+            "iTopK": "2",
+            "iTopKMetric": "pod_cpu_utilization",
+        },
+    }
+
+    # The results are per pod and node, the top K pods are selected afterwards
+    assert (
+        pod_metric_query_generator.generate_lookup_query(log_streams_event)
+        == 'fields PodName, NodeName | filter (Type = "Pod" or Type = "PodNet") and Namespace = "eks-baseline-services" and ispresent(pod_cpu_utilization) | stats max(pod_cpu_utilization) as rank by PodName, NodeName | sort rank desc'
+    )
+
+    results = [
+        [
+            {"field": "PodName", "value": pod_name},
+            {"field": "NodeName", "value": node_name},
+            {"field": "rank", "value": rank},
+        ]
+        for pod_name, node_name, rank in [
+            ("coredns", "ip-10-0-1-1", "90"),
+            # Rescheduled pod, reported once per node
+            ("coredns", "ip-10-0-1-2", "80"),
+            ("kube-proxy", "ip-10-0-1-1", "70"),
+            ("metrics-server", "ip-10-0-1-3", "60"),
+        ]
+    ]
+
+    assert (
+        pod_metric_query_generator.select_top_k_results(log_streams_event, results)
+        == results[:3]
+    )
+
+
+def test_generate_metric_query_bin_period(mocker):
+    pod_metric_query_generator = PodMetricQueryGenerator()
+    week_event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            "iStartTime": "2022-12-12T12:00:00",
+            "iEndTime": "2022-12-19T12:00:00",
+        },
+    }
+
+    assert pod_metric_query_generator.generate_metric_query(
+        week_event, LOOKUP_QUERY_RESPONSE
+    ).endswith("by bin(10m)")
+    assert pod_metric_query_generator.generate_metric_query(
+        {
+            **week_event,
+            "ResourceProperties": {**week_event["ResourceProperties"], "iPeriod": "1h"},
+        },
+        LOOKUP_QUERY_RESPONSE,
+    ).endswith("by bin(1h)")
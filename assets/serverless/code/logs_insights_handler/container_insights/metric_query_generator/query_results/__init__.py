@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Logs Insights returns query results as a list of rows, every row being a list of
+{"field": ..., "value": ...} dicts, fields without value being left out of the row.
+The query results view turns them into one array of values per field, so that the
+generators read a column at once rather than building or scanning every row for the
+fields they need.
+Every column is extracted in a single pass over the rows, on first access. The fields
+of a stats query come in the same order in every row, the position of a field in the
+previous row is therefore checked first, only falling back to a scan of the row when
+the field moved or is missing.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class QueryResults:
+    """Columnar view of the results of a Logs Insights query"""
+
+    def __init__(self, results: List[List[Dict[str, str]]]):
+        self.results = results
+        self.columns: Dict[str, List[Optional[str]]] = dict()
+
+    @classmethod
+    def from_response(cls, response: Dict[str, Any]) -> "QueryResults":
+        """Columnar view of a get_query_results response"""
+        return cls(response.get("results", []))
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def column(self, field: str, default: Any = None) -> List[Any]:
+        """Values of a field for every row, "default" for the rows without the field"""
+
+        if (column := self.columns.get(field, None)) is None:
+            column = self.columns[field] = self._extract_column(field)
+        if default is None:
+            return column
+        return [default if value is None else value for value in column]
+
+    def rows(self, *fields: str) -> Iterator[Tuple[Optional[str], ...]]:
+        """Values of the given fields, row by row"""
+        return zip(*(self.column(field) for field in fields))
+
+    def _extract_column(self, field: str) -> List[Optional[str]]:
+        column = []
+        append = column.append
+        position = 0
+        for result in self.results:
+            if position < len(result) and result[position]["field"] == field:
+                append(result[position]["value"])
+                continue
+
+            for position, result_field in enumerate(result):
+                if result_field["field"] == field:
+                    append(result_field["value"])
+                    break
+            else:
+                append(None)
+                position = 0
+
+        return column
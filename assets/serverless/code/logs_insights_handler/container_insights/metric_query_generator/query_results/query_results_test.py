@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from container_insights.metric_query_generator.query_results import QueryResults
+
+RESPONSE = {
+    "results": [
+        [
+            {"field": "Namespace", "value": "kube-system"},
+            {"field": "PodName", "value": "coredns"},
+            {"field": "count()", "value": "10"},
+        ],
+        [
+            {"field": "PodName", "value": "aws-node"},
+            {"field": "count()", "value": "12"},
+        ],
+        [
+            {"field": "Namespace", "value": "team-a"},
+            {"field": "PodName", "value": "api"},
+        ],
+    ],
+    "status": "Complete",
+}
+
+
+def test_query_results(mocker):
+    results = QueryResults.from_response(RESPONSE)
+
+    assert len(results) == 3
+    assert results.column("PodName") == ["coredns", "aws-node", "api"]
+    assert results.column("Namespace") == ["kube-system", None, "team-a"]
+    assert results.column("count()") == ["10", "12", None]
+
+
+def test_query_results_default(mocker):
+    results = QueryResults.from_response(RESPONSE)
+
+    assert results.column("Namespace", "default") == [
+        "kube-system",
+        "default",
+        "team-a",
+    ]
+    assert results.column("NodeName") == [None, None, None]
+    assert results.column("NodeName", "") == ["", "", ""]
+
+
+def test_query_results_rows(mocker):
+    results = QueryResults.from_response(RESPONSE)
+
+    assert list(results.rows("Namespace", "PodName")) == [
+        ("kube-system", "coredns"),
+        (None, "aws-node"),
+        ("team-a", "api"),
+    ]
+
+
+def test_query_results_empty(mocker):
+    results = QueryResults.from_response({"status": "Complete"})
+
+    assert len(results) == 0
+    assert results.column("PodName") == []
+    assert list(results.rows("Namespace", "PodName")) == []
+
+
+def test_query_results_field_order(mocker):
+    results = QueryResults(
+        [
+            [{"field": "PodName", "value": "a"}, {"field": "Namespace", "value": "x"}],
+            [{"field": "Namespace", "value": "y"}, {"field": "PodName", "value": "b"}],
+            [{"field": "Namespace", "value": "z"}],
+            [{"field": "PodName", "value": "d"}],
+        ]
+    )
+
+    assert results.column("PodName") == ["a", "b", None, "d"]
+    assert results.column("Namespace") == ["x", "y", "z", None]
+    assert results.column("PodName") is results.column("PodName")
@@ -0,0 +1,219 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Logs Insights only runs a limited number of concurrent queries per account and region,
+any query started beyond that limit failing with a LimitExceededException. The query
+scheduler keeps the queries it starts within a configurable concurrency cap, accounting
+for the queries already running in the account, queues the excess and starts the
+queued queries smallest first as slots free up.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import time
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+LOGGER = logging.getLogger(__name__)
+
+# Concurrency cap, kept below the Logs Insights account limit so that dashboards and
+# other users of the account can still run their own queries
+MAX_CONCURRENT_QUERIES = int(
+    os.environ.get("LOGS_INSIGHTS_MAX_CONCURRENT_QUERIES", "20")
+)
+
+# Client side rate limiting and retries of throttled calls, along with a connection
+# pool large enough for all the queries polled by a single invocation
+LOGS_CLIENT_CONFIG = Config(
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    max_pool_connections=MAX_CONCURRENT_QUERIES,
+    connect_timeout=5,
+    read_timeout=30,
+)
+
+RUNNING_STATUSES = ["Scheduled", "Running"]
+
+
+@lru_cache(maxsize=None)
+def get_logs_client():
+    """
+    Logs client shared by every lookup query of the execution environment, created on
+    first use rather than at import so that cold starts not running any query skip it.
+    """
+
+    return boto3.client("logs", config=LOGS_CLIENT_CONFIG)
+
+
+INITIAL_POLLING_INTERVAL = 0.5
+MAX_POLLING_INTERVAL = 8
+
+
+def get_query_cost(start_query_parameters: Dict[str, Any]) -> tuple:
+    """
+    Estimated cost of a query: the longer its time window, the more data it scans, the
+    query length breaking ties.
+    """
+
+    return (
+        start_query_parameters["endTime"] - start_query_parameters["startTime"],
+        len(start_query_parameters["queryString"]),
+    )
+
+
+class QueryScheduler:
+    """Logs Insights query scheduler, running queued queries smallest first"""
+
+    def __init__(self, logs_client, max_concurrent_queries: int = None):
+        self.logs_client = logs_client
+        self.max_concurrent_queries = (
+            MAX_CONCURRENT_QUERIES
+            if max_concurrent_queries is None
+            else max_concurrent_queries
+        )
+        self.queued = []
+        self.query_ids: Dict[Hashable, str] = dict()
+        self.running: Dict[Hashable, str] = dict()
+        self.completed: Dict[Hashable, Dict[str, Any]] = dict()
+        self.poll_count = 0
+        self._sequence = itertools.count()
+
+    def submit(self, key: Hashable, **start_query_parameters):
+        """Queue a query, "start_query_parameters" being the StartQuery API parameters"""
+
+        heapq.heappush(
+            self.queued,
+            (
+                get_query_cost(start_query_parameters),
+                next(self._sequence),
+                key,
+                start_query_parameters,
+            ),
+        )
+
+    def track(self, key: Hashable, query_id: str):
+        """Track a query started beforehand, eg. by a previous invocation"""
+
+        self.query_ids[key] = self.running[key] = query_id
+
+    def get_running_query_count(self) -> int:
+        """Number of queries running in the account and region, whoever started them"""
+
+        paginator = self.logs_client.get_paginator("describe_queries")
+        return sum(
+            len(page.get("queries", []))
+            for status in RUNNING_STATUSES
+            for page in paginator.paginate(status=status)
+        )
+
+    def start_queries(self) -> List[Hashable]:
+        """Start as many queued queries as the concurrency cap allows, smallest first"""
+
+        if not self.queued:
+            return []
+
+        started = []
+        available_slots = self.max_concurrent_queries - self.get_running_query_count()
+        while self.queued and available_slots > 0:
+            _, _, key, start_query_parameters = self.queued[0]
+            try:
+                query_id = self.logs_client.start_query(**start_query_parameters)[
+                    "queryId"
+                ]
+            except ClientError as ex:
+                if ex.response["Error"]["Code"] == "LimitExceededException":
+                    LOGGER.info(
+                        f"Logs Insights concurrent queries limit reached, {len(self.queued)} queries left in the queue"
+                    )
+                    break
+                error_msg = f'Could not start query "{start_query_parameters["queryString"]}", against log group "{start_query_parameters["logGroupName"]}"'
+                LOGGER.exception(error_msg)
+                raise Exception(error_msg) from ex
+
+            heapq.heappop(self.queued)
+            self.query_ids[key] = self.running[key] = query_id
+            started.append(key)
+            available_slots -= 1
+
+        return started
+
+    def poll_queries(self) -> List[Hashable]:
+        """Collect the responses of the running queries which are no longer running"""
+
+        completed = []
+        for key, query_id in list(self.running.items()):
+            try:
+                response = self.logs_client.get_query_results(queryId=query_id)
+            except Exception as ex:
+                error_msg = f'Could not get query results for query ID "{query_id}"'
+                LOGGER.exception(error_msg)
+                raise Exception(error_msg) from ex
+            self.poll_count += 1
+
+            if response.get("status", None) in RUNNING_STATUSES:
+                continue
+
+            del self.running[key]
+            self.completed[key] = response
+            completed.append(key)
+
+        return completed
+
+    def stop_queries(self, keys: List[Hashable] = None):
+        """
+        Stop the running queries, or only some of them, eg. when their query ID cannot be
+        kept track of.
+        """
+
+        for key in list(self.running) if keys is None else keys:
+            if (query_id := self.running.pop(key, None)) is None:
+                continue
+            try:
+                self.logs_client.stop_query(queryId=query_id)
+            except ClientError:
+                LOGGER.warning(f'Could not stop query ID "{query_id}"', exc_info=True)
+
+    def run(self, budget: float) -> Dict[Hashable, Dict[str, Any]]:
+        """
+        Start the queued queries and poll the running ones, with an exponential backoff,
+        until all of them are complete or the budget (in seconds) is spent.
+        The queries are started at least once, but only polled within a positive budget.
+        """
+
+        start_time = time.monotonic()
+        polling_interval = INITIAL_POLLING_INTERVAL
+        while True:
+            self.start_queries()
+            if budget <= 0:
+                break
+
+            self.poll_queries()
+            if not self.queued and not self.running:
+                break
+
+            if time.monotonic() - start_time + polling_interval > budget:
+                break
+            time.sleep(polling_interval)
+            polling_interval = min(polling_interval * 2, MAX_POLLING_INTERVAL)
+
+        return self.completed
@@ -0,0 +1,199 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import itertools
+from datetime import datetime
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from container_insights.metric_query_generator.query_scheduler import (
+    QueryScheduler,
+    get_logs_client,
+)
+
+START_TIME = int(datetime(2022, 12, 19, 12).timestamp())
+
+
+class LimitEnforcingLogsClient:
+    """
+    Logs client stand-in running at most "limit" concurrent queries, some of them being
+    started by someone else, every query completing after two get_query_results calls.
+    """
+
+    def __init__(self, limit: int, external_query_count: int = 0):
+        self.limit = limit
+        self.running = {f"external-{index}": 0 for index in range(external_query_count)}
+        self.started = []
+        self.max_running_count = 0
+        self._query_ids = itertools.count()
+
+    def get_paginator(self, operation_name: str):
+        client = self
+
+        class Paginator:
+            def paginate(self, status: str):
+                yield {
+                    "queries": (
+                        [
+                            {"queryId": query_id, "status": "Running"}
+                            for query_id in client.running
+                        ]
+                        if status == "Running"
+                        else []
+                    )
+                }
+
+        return Paginator()
+
+    def start_query(self, **parameters):
+        if len(self.running) >= self.limit:
+            raise ClientError(
+                {"Error": {"Code": "LimitExceededException", "Message": "Limit"}},
+                "StartQuery",
+            )
+
+        query_id = f"query-{next(self._query_ids)}"
+        self.running[query_id] = 2
+        self.started.append(parameters["queryString"])
+        self.max_running_count = max(self.max_running_count, len(self.running))
+        return {"queryId": query_id}
+
+    def get_query_results(self, queryId: str):
+        self.running[queryId] -= 1
+        if self.running[queryId] > 0:
+            return {"status": "Running"}
+
+        del self.running[queryId]
+        # External queries complete along with the first polled query
+        for query_id in [key for key in self.running if key.startswith("external")]:
+            del self.running[query_id]
+        return {"status": "Complete", "results": [[{"field": "id", "value": queryId}]]}
+
+
+def submit_queries(query_scheduler: QueryScheduler, window_hours):
+    for index, hours in enumerate(window_hours):
+        query_scheduler.submit(
+            index,
+            logGroupName="/aws/containerinsights/eks-cluster/performance",
+            startTime=START_TIME,
+            endTime=START_TIME + hours * 3600,
+            queryString=f"query {index}",
+        )
+
+
+@pytest.mark.parametrize(
+    "limit,external_query_count,max_concurrent_queries",
+    [
+        # Concurrency cap below the account limit
+        (10, 0, 3),
+        # Account limit reached because of queries started by someone else
+        (4, 3, 10),
+    ],
+)
+def test_run(mocker, limit, external_query_count, max_concurrent_queries):
+    mocker.patch("time.sleep")
+    logs_client = LimitEnforcingLogsClient(limit, external_query_count)
+    query_scheduler = QueryScheduler(logs_client, max_concurrent_queries)
+    window_hours = [6, 1, 12, 3, 24, 2, 8, 4]
+    submit_queries(query_scheduler, window_hours)
+
+    responses = query_scheduler.run(budget=300)
+
+    assert sorted(responses) == list(range(len(window_hours)))
+    assert all(response["status"] == "Complete" for response in responses.values())
+    assert not query_scheduler.queued and not query_scheduler.running
+    assert logs_client.max_running_count <= min(limit, max_concurrent_queries)
+    # Smallest first
+    assert logs_client.started == [
+        f"query {index}"
+        for index in sorted(range(len(window_hours)), key=lambda i: window_hours[i])
+    ]
+
+
+def test_start_queries_concurrency_cap(mocker):
+    logs_client = LimitEnforcingLogsClient(limit=30, external_query_count=18)
+    query_scheduler = QueryScheduler(logs_client, max_concurrent_queries=20)
+    submit_queries(query_scheduler, [3, 2, 1])
+
+    assert query_scheduler.start_queries() == [2, 1]
+    assert len(query_scheduler.queued) == 1
+    assert list(query_scheduler.running) == [2, 1]
+
+
+def test_start_queries_limit_exceeded():
+    logs_client = boto3.client("logs")
+    logs_stubber = Stubber(logs_client)
+    for status in ["Scheduled", "Running"]:
+        logs_stubber.add_response(
+            "describe_queries", {"queries": []}, {"status": status}
+        )
+    logs_stubber.add_response("start_query", {"queryId": "query-1"})
+    logs_stubber.add_client_error(
+        "start_query", service_error_code="LimitExceededException"
+    )
+
+    query_scheduler = QueryScheduler(logs_client)
+    submit_queries(query_scheduler, [1, 2])
+
+    with logs_stubber:
+        assert query_scheduler.start_queries() == [0]
+
+    logs_stubber.assert_no_pending_responses()
+    assert query_scheduler.query_ids == {0: "query-1"}
+    assert len(query_scheduler.queued) == 1
+
+
+def test_start_queries_error():
+    logs_client = boto3.client("logs")
+    logs_stubber = Stubber(logs_client)
+    for status in ["Scheduled", "Running"]:
+        logs_stubber.add_response(
+            "describe_queries", {"queries": []}, {"status": status}
+        )
+    logs_stubber.add_client_error(
+        "start_query", service_error_code="InvalidParameterException"
+    )
+
+    query_scheduler = QueryScheduler(logs_client)
+    submit_queries(query_scheduler, [1])
+
+    with logs_stubber, pytest.raises(Exception) as ex_info:
+        query_scheduler.start_queries()
+
+    assert 'Could not start query "query 0", against log group' in str(ex_info.value)
+
+
+def test_stop_queries():
+    logs_client = boto3.client("logs")
+    logs_stubber = Stubber(logs_client)
+    logs_stubber.add_response("stop_query", {"success": True}, {"queryId": "query-1"})
+
+    query_scheduler = QueryScheduler(logs_client)
+    query_scheduler.track("lookup", "query-1")
+
+    with logs_stubber:
+        query_scheduler.stop_queries()
+
+    logs_stubber.assert_no_pending_responses()
+    assert not query_scheduler.running
+
+
+def test_get_logs_client():
+    assert get_logs_client() is get_logs_client()
+    assert get_logs_client().meta.config.retries["mode"] == "adaptive"
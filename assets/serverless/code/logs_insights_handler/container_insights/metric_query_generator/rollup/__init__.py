@@ -0,0 +1,142 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Rollup Metric Query Generators, plotting the cluster-wide figures Container Insights
+reports through its cluster level record types ("Cluster", "ClusterNamespace" and
+"ClusterService").
+
+A handful of such records are written per minute whatever the cluster size, and their
+series are known upfront, the cluster itself or the configured selectors: the rollup
+metric queries are rendered right away, without any lookup query.
+"""
+
+import re
+from typing import List, Optional
+
+from container_insights.metric_query_generator import (
+    MetricQueryRenderingMixin,
+    get_bin_period,
+)
+from container_insights.metric_query_generator.namespace_selector import (
+    get_selector_regex,
+)
+
+LOG_GROUP_NAME_REGEX = re.compile(r"^/aws/containerinsights/(.+)/performance$")
+
+
+def get_cluster_name(log_group_name: str) -> str:
+    """The cluster name embedded in a Container Insights performance log group name"""
+
+    if match := LOG_GROUP_NAME_REGEX.match(log_group_name):
+        return match.group(1)
+    return "cluster"
+
+
+def get_series_expression(field: str, selector: str) -> str:
+    """
+    Logs Insights expression matching the records of a selector, escaped as the other
+    generic metric queries to be embedded in the dashboard body.
+    """
+
+    if (regex := get_selector_regex(selector)) is None:
+        return f'{field} = \\"{selector}\\"'
+    return f"{field} like /{regex}/".replace("\\", "\\\\")
+
+
+class RollupMetricQueryGenerator(MetricQueryRenderingMixin):
+    """
+    Abstract Rollup Metric Query Generator, plotting a metric of a cluster level record
+    type ("RECORD_TYPE") for every series selector ("iSeries") matched against the
+    "SERIES_FIELD" field, a wildcard or regex selector plotting the average of the
+    records it matches.
+    """
+
+    RECORD_TYPE: str = None
+    SERIES_FIELD: str = None
+
+    QUERY_TEMPLATE = (
+        "fields {metric}"
+        "{% for label, expression in series %}"
+        "{% if expression %}, ({{ expression }}) as series{{ loop.index }}{% endif %}"
+        "{% endfor %} "
+        '| filter Type = \\"{{ record_type }}\\" and ispresent({metric}) '
+        "| stats "
+        "{% for label, expression in series %}"
+        "{% if expression %}"
+        "sum({metric} * series{{ loop.index }}) / sum(series{{ loop.index }})"
+        "{% else %}"
+        "avg({metric})"
+        "{% endif %}"
+        ' as `{{ label }}`{{ ", " if not loop.last else " " }}'
+        "{% endfor %}"
+        "by bin({{ period }})"
+    )
+
+    def get_series(self, event, response) -> List[str]:
+        """The rollup series are the configured series selectors."""
+        return list(event["ResourceProperties"]["iSeries"])
+
+    def render_metric_query(
+        self, event, series: List[str], log_streams: Optional[List[str]] = None
+    ) -> str:
+        """
+        The rollup metric query is not metric-specific, it is formatted for every metric
+        of the dashboard at a later stage as the other generic metric queries.
+        Cluster level records are not written to node log streams, "log_streams" is
+        ignored.
+        """
+
+        return self.query_template.render(
+            record_type=self.RECORD_TYPE,
+            series=[
+                (
+                    label,
+                    (
+                        get_series_expression(self.SERIES_FIELD, label)
+                        if self.SERIES_FIELD
+                        else None
+                    ),
+                )
+                for label in series
+            ],
+            period=get_bin_period(event),
+        )
+
+
+class ClusterMetricQueryGenerator(RollupMetricQueryGenerator):
+    """Cluster rollup, a single series named after the cluster."""
+
+    RECORD_TYPE = "Cluster"
+
+    def get_series(self, event, response) -> List[str]:
+        """The cluster itself, as named by the log group."""
+        return [get_cluster_name(event["ResourceProperties"]["iLogGroupName"])]
+
+
+class NamespaceMetricQueryGenerator(RollupMetricQueryGenerator):
+    """Namespace rollup, a series per namespace selector."""
+
+    RECORD_TYPE = "ClusterNamespace"
+    SERIES_FIELD = "Namespace"
+
+
+class ServiceMetricQueryGenerator(RollupMetricQueryGenerator):
+    """Service rollup, a series per service selector."""
+
+    RECORD_TYPE = "ClusterService"
+    SERIES_FIELD = "Service"
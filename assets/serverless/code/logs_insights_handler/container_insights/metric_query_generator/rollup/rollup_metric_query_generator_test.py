@@ -0,0 +1,108 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import copy
+
+import pytest
+from container_insights.metric_query_generator.rollup import (
+    ClusterMetricQueryGenerator,
+    NamespaceMetricQueryGenerator,
+    ServiceMetricQueryGenerator,
+    get_cluster_name,
+    get_series_expression,
+)
+
+EVENT = {
+    "RequestType": "Create",
+    "ResourceProperties": {
+        "iLogGroupName": "/aws/containerinsights/eks-cluster/performance",
+        "iStartTime": "2022-12-19T12:00:00",
+        "iEndTime": "2022-12-19T13:00:00",
+    },
+}
+
+
+@pytest.mark.parametrize(
+    "log_group_name,expected_cluster_name",
+    [
+        ("/aws/containerinsights/eks-cluster/performance", "eks-cluster"),
+        ("custom-log-group", "cluster"),
+    ],
+)
+def test_get_cluster_name(log_group_name, expected_cluster_name):
+    assert get_cluster_name(log_group_name) == expected_cluster_name
+
+
+@pytest.mark.parametrize(
+    "selector,expected_expression",
+    [
+        ("kube-system", 'Namespace = \\"kube-system\\"'),
+        ("team-*", "Namespace like /^team\\\\-.*$/"),
+        ("/^team-(a|b)$/", "Namespace like /^team-(a|b)$/"),
+    ],
+)
+def test_get_series_expression(selector, expected_expression):
+    assert get_series_expression("Namespace", selector) == expected_expression
+
+
+def test_cluster_metric_query(mocker):
+    cluster_metric_query_generator = ClusterMetricQueryGenerator()
+
+    assert not cluster_metric_query_generator.has_lookup_query(EVENT)
+    assert (
+        cluster_metric_query_generator.generate_metric_query(EVENT, None)
+        == 'fields {metric} | filter Type = \\"Cluster\\" and ispresent({metric}) | stats avg({metric}) as `eks-cluster` by bin(1m)'
+    )
+
+
+def test_namespace_metric_query(mocker):
+    namespace_metric_query_generator = NamespaceMetricQueryGenerator()
+    namespace_event = copy.deepcopy(EVENT)
+    namespace_event["ResourceProperties"].update(
+        {"iSeries": ["kube-system", "/^team-(a|b)$/"], "iPeriod": "5m"}
+    )
+
+    assert not namespace_metric_query_generator.has_lookup_query(namespace_event)
+    assert (
+        namespace_metric_query_generator.generate_metric_query(namespace_event, None)
+        == "fields {metric}, "
+        '(Namespace = \\"kube-system\\") as series1, '
+        "(Namespace like /^team-(a|b)$/) as series2 "
+        '| filter Type = \\"ClusterNamespace\\" and ispresent({metric}) '
+        "| stats sum({metric} * series1) / sum(series1) as `kube-system`, "
+        "sum({metric} * series2) / sum(series2) as `/^team-(a|b)$/` "
+        "by bin(5m)"
+    )
+
+
+def test_service_metric_query(mocker):
+    service_metric_query_generator = ServiceMetricQueryGenerator()
+    service_event = copy.deepcopy(EVENT)
+    service_event["ResourceProperties"]["iSeries"] = ["kube-dns"]
+
+    assert (
+        service_metric_query_generator.generate_metric_query(service_event, None)
+        == 'fields {metric}, (Service = \\"kube-dns\\") as series1 '
+        '| filter Type = \\"ClusterService\\" and ispresent({metric}) '
+        "| stats sum({metric} * series1) / sum(series1) as `kube-dns` by bin(1m)"
+    )
+
+
+def test_rollup_lookup_query(mocker):
+    cluster_metric_query_generator = ClusterMetricQueryGenerator()
+
+    assert not cluster_metric_query_generator.has_lookup_query(EVENT)
+    assert not hasattr(cluster_metric_query_generator, "generate_lookup_query")
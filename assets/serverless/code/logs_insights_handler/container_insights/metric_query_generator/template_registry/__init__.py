@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import logging
+import os
+from hashlib import sha1
+from typing import Dict, Iterable
+
+from jinja2 import ChoiceLoader, DictLoader, Environment, ModuleLoader, Template
+
+LOGGER = logging.getLogger(__name__)
+
+COMPILED_TEMPLATES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "compiled"
+)
+
+
+class QueryTemplateRegistry:
+    """
+    Process wide registry of the metric query templates.
+
+    Each template is parsed and compiled at most once per process, the compiled template
+    is then reused across invocations of a warm Lambda execution environment.
+    When ahead-of-time compiled template modules are shipped along with the Lambda asset
+    (see "compile_templates"), they are loaded instead so that cold starts skip the
+    parsing as well.
+    """
+
+    def __init__(self, compiled_templates_path: str = COMPILED_TEMPLATES_PATH):
+        self._sources: Dict[str, str] = dict()
+        self._template_names: Dict[str, str] = dict()
+        self._templates: Dict[str, Template] = dict()
+
+        loaders = [DictLoader(self._sources)]
+        if os.path.isdir(compiled_templates_path):
+            loaders.insert(0, ModuleLoader(compiled_templates_path))
+        self._environment = Environment(loader=ChoiceLoader(loaders))
+
+    @staticmethod
+    def get_template_name(name: str, source: str) -> str:
+        """
+        The template name embeds a fingerprint of the template source, so that a stale
+        precompiled module can never shadow an updated template: it is simply not found
+        and the template gets compiled from its source instead.
+        """
+
+        return f"{name}-{sha1(source.encode('utf-8')).hexdigest()[:12]}"
+
+    def register(self, name: str, source: str):
+        """Register a template source under a given name."""
+
+        template_name = QueryTemplateRegistry.get_template_name(name, source)
+        if self._template_names.get(name, None) != template_name:
+            self._template_names[name] = template_name
+            self._sources[template_name] = source
+            self._templates.pop(name, None)
+
+    @property
+    def fingerprint(self) -> str:
+        """Fingerprint of all the registered template sources"""
+
+        return self.get_fingerprint(self._template_names)
+
+    def get_fingerprint(self, names: Iterable[str]) -> str:
+        """
+        Fingerprint of the template sources registered under the given names, regardless
+        of any other template registered within the process.
+        """
+
+        return sha1(
+            ",".join(sorted(self._template_names[name] for name in names)).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+
+    def get_template(self, name: str) -> Template:
+        """Return the compiled template registered under a given name."""
+
+        if (template := self._templates.get(name, None)) is None:
+            template = self._environment.get_template(self._template_names[name])
+            self._templates[name] = template
+
+        return template
+
+    def compile_templates(self, target: str):
+        """Compile every registered template into Python modules stored in "target"."""
+
+        Environment(loader=DictLoader(self._sources)).compile_templates(
+            target,
+            zip=None,
+            log_function=LOGGER.info,
+            ignore_errors=False,
+        )
+
+
+QUERY_TEMPLATE_REGISTRY = QueryTemplateRegistry()
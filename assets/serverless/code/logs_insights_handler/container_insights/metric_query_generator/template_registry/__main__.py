@@ -0,0 +1,51 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import argparse
+import logging
+
+# Importing the generators registers their query templates
+from container_insights.metric_query_generator.container import (
+    ContainerMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+from container_insights.metric_query_generator.rollup import (
+    ClusterMetricQueryGenerator,
+    NamespaceMetricQueryGenerator,
+    ServiceMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.template_registry import (
+    COMPILED_TEMPLATES_PATH,
+    QUERY_TEMPLATE_REGISTRY,
+)
+
+logging.basicConfig(level=logging.INFO)
+
+parser = argparse.ArgumentParser(
+    prog="template_registry",
+    description="Ahead-of-time compile the metric query templates into Python modules",
+)
+parser.add_argument(
+    "-t",
+    "--target",
+    default=COMPILED_TEMPLATES_PATH,
+    help=f"Folder where the compiled template modules are written. (default: {COMPILED_TEMPLATES_PATH})",
+)
+args = parser.parse_args()
+
+QUERY_TEMPLATE_REGISTRY.compile_templates(args.target)
@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from container_insights.metric_query_generator.template_registry import (
+    QueryTemplateRegistry,
+)
+
+TEMPLATE_SOURCE = (
+    "fields {metric}, "
+    "{% for pod_name in pod_names %}"
+    '(PodName = \\"{{ pod_name }}\\") as pod{{ loop.index }}{{ ", " if not loop.last else " " }}'
+    "{% endfor %}"
+    "by bin({{ period }})"
+)
+
+RENDERED_TEMPLATE = (
+    "fields {metric}, "
+    '(PodName = \\"coredns\\") as pod1, '
+    '(PodName = \\"kube-proxy\\") as pod2 '
+    "by bin(1m)"
+)
+
+
+def test_get_template(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+
+    template = registry.get_template("DummyMetricQueryGenerator")
+
+    assert registry.get_template("DummyMetricQueryGenerator") is template
+    assert (
+        template.render(pod_names=["coredns", "kube-proxy"], period="1m")
+        == RENDERED_TEMPLATE
+    )
+
+
+def test_register_updated_template(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register("DummyMetricQueryGenerator", "outdated template")
+    assert registry.get_template("DummyMetricQueryGenerator").render() == (
+        "outdated template"
+    )
+
+    registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+
+    assert (
+        registry.get_template("DummyMetricQueryGenerator").render(
+            pod_names=["coredns", "kube-proxy"], period="1m"
+        )
+        == RENDERED_TEMPLATE
+    )
+
+
+def test_fingerprint(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register("DummyMetricQueryGenerator", "outdated template")
+    outdated_fingerprint = registry.fingerprint
+
+    registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+
+    assert registry.fingerprint != outdated_fingerprint
+    assert registry.fingerprint == registry.fingerprint
+
+
+def test_compile_templates(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+    registry.compile_templates(str(tmp_path))
+
+    assert len(list(tmp_path.glob("tmpl_*.py"))) == 1
+
+    precompiled_registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    precompiled_registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+    dict_loader_mock = mocker.patch(
+        "container_insights.metric_query_generator.template_registry.DictLoader.get_source"
+    )
+
+    assert (
+        precompiled_registry.get_template("DummyMetricQueryGenerator").render(
+            pod_names=["coredns", "kube-proxy"], period="1m"
+        )
+        == RENDERED_TEMPLATE
+    )
+    assert not dict_loader_mock.called
+
+
+def test_compile_templates_stale_module(mocker, tmp_path):
+    registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    registry.register("DummyMetricQueryGenerator", "outdated template")
+    registry.compile_templates(str(tmp_path))
+
+    precompiled_registry = QueryTemplateRegistry(compiled_templates_path=str(tmp_path))
+    precompiled_registry.register("DummyMetricQueryGenerator", TEMPLATE_SOURCE)
+
+    assert (
+        precompiled_registry.get_template("DummyMetricQueryGenerator").render(
+            pod_names=["coredns", "kube-proxy"], period="1m"
+        )
+        == RENDERED_TEMPLATE
+    )
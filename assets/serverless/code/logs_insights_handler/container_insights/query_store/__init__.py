@@ -0,0 +1,230 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+CloudFormation caps custom resource responses at 4 KB, all attributes included, whereas
+a generic metric query alone can be up to the 10,000 characters Logs Insights allows.
+Given a query store, the metric queries are therefore stored rather than returned as
+custom resource attributes, under a key prefix specific to their resource
+("<LogicalResourceId>/<digest>/") followed by their attribute name. The resource only
+returns the key prefix ("oQueryKeyPrefix"), however many metric queries it generates.
+
+The dashboard widgets refer to the stored queries through query handles,
+"{{query:<key>:<metric>}}", which the dashboard custom resource resolves into the stored
+query formatted with that metric.
+
+The store location is given by the QUERY_STORE_URI environment variable, either an SSM
+Parameter Store path ("ssm:///<path>/") or a local directory ("file://<path>"), the
+latter standing in for SSM in tests and local runs. Query handles are not used when it
+is not set.
+"""
+
+import json
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from hashlib import sha256
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import boto3
+from botocore.config import Config
+
+LOGGER = logging.getLogger(__name__)
+
+METRIC_PLACEHOLDER = "{metric}"
+
+# Custom resource attribute holding the key prefix of the stored metric queries
+QUERY_KEY_PREFIX_ATTRIBUTE = "oQueryKeyPrefix"
+
+QUERY_HANDLE_PATTERN = re.compile(r"\{\{query:([^:{}]+):(\{metric\}|[^{}]*)\}\}")
+
+# SSM standard parameters hold up to 4 KB, larger queries are split across several
+# parameters. Performance log fields are ASCII, hence one byte per character
+MAX_PARAMETER_LENGTH = 4096
+
+# DeleteParameters API limit
+MAX_DELETED_PARAMETERS = 10
+
+# Parameter Store throttles write bursts, the retries spread them over time
+SSM_CLIENT_CONFIG = Config(retries={"max_attempts": 10, "mode": "adaptive"})
+
+
+class QueryStore(ABC):
+    """Abstract store of the metric queries too large to be returned to CloudFormation"""
+
+    @abstractmethod
+    def get(self, key: str) -> str:
+        """The stored query, raising an exception when not found"""
+        pass
+
+    @abstractmethod
+    def put(self, key: str, query: str):
+        """Store a query"""
+        pass
+
+    @abstractmethod
+    def delete(self, prefix: str):
+        """Delete every query whose key starts with a given prefix"""
+        pass
+
+
+class SsmQueryStore(QueryStore):
+    """
+    Query store backed by SSM Parameter Store, a query being stored as
+    "<path><key>/<chunk>" parameters of up to 4 KB
+    """
+
+    def __init__(self, path: str, ssm_client=None):
+        self.path = path
+        self._ssm_client = ssm_client
+
+    @property
+    def ssm_client(self):
+        """SSM client, created on first use"""
+        if self._ssm_client is None:
+            self._ssm_client = boto3.client("ssm", config=SSM_CLIENT_CONFIG)
+        return self._ssm_client
+
+    def get(self, key: str) -> str:
+        chunks = {
+            parameter["Name"]: parameter["Value"]
+            for parameter in self._get_parameters(f"{self.path}{key}/")
+        }
+        if not chunks:
+            raise Exception(f'Query "{key}" not found in "{self.path}"')
+
+        return "".join(
+            chunks[name]
+            for name in sorted(chunks, key=lambda name: int(name.rsplit("/", 1)[1]))
+        )
+
+    def put(self, key: str, query: str):
+        for chunk, start in enumerate(
+            range(0, max(len(query), 1), MAX_PARAMETER_LENGTH), start=1
+        ):
+            self.ssm_client.put_parameter(
+                Name=f"{self.path}{key}/{chunk}",
+                Value=query[start : start + MAX_PARAMETER_LENGTH],
+                Type="String",
+                Overwrite=True,
+            )
+
+    def delete(self, prefix: str):
+        names = [
+            parameter["Name"]
+            for parameter in self._get_parameters(f"{self.path}{prefix}")
+        ]
+        for start in range(0, len(names), MAX_DELETED_PARAMETERS):
+            self.ssm_client.delete_parameters(
+                Names=names[start : start + MAX_DELETED_PARAMETERS]
+            )
+
+    def _get_parameters(self, path: str):
+        paginator = self.ssm_client.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=path.rstrip("/"), Recursive=True):
+            yield from page["Parameters"]
+
+
+class LocalQueryStore(QueryStore):
+    """Query store backed by a local directory, one file per query"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get(self, key: str) -> str:
+        try:
+            with open(os.path.join(self.directory, key), "r", encoding="utf8") as query:
+                return query.read()
+        except FileNotFoundError:
+            raise Exception(f'Query "{key}" not found in "{self.directory}"')
+
+    def put(self, key: str, query: str):
+        os.makedirs(os.path.dirname(os.path.join(self.directory, key)), exist_ok=True)
+        with open(os.path.join(self.directory, key), "w", encoding="utf8") as stored:
+            stored.write(query)
+
+    def delete(self, prefix: str):
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                if os.path.relpath(path, self.directory).startswith(prefix):
+                    os.remove(path)
+
+
+def get_query_store(uri: str) -> Optional[QueryStore]:
+    """The query store located at a given URI, None when no URI is given"""
+
+    if not uri:
+        return None
+
+    location = urlparse(uri)
+    if location.scheme == "ssm":
+        return SsmQueryStore(location.path)
+    if location.scheme == "file":
+        return LocalQueryStore(location.netloc + location.path)
+
+    raise Exception(f'Unsupported query store URI "{uri}"')
+
+
+def get_query_key_prefix(event) -> str:
+    """
+    The queries of a metric query custom resource are keyed by its logical ID and a
+    digest of its properties, so that the Delete event of a resource replaced by an
+    update only deletes the queries of the former properties.
+    """
+
+    digest = sha256(
+        json.dumps(
+            {
+                "ResourceType": event["ResourceType"],
+                "ResourceProperties": {
+                    name: value
+                    for name, value in event["ResourceProperties"].items()
+                    if name != "ServiceToken"
+                },
+            },
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+    return f"{event['LogicalResourceId']}/{digest[:16]}/"
+
+
+def get_query_handle(key: str, metric: str = METRIC_PLACEHOLDER) -> str:
+    """Handle of a stored generic metric query, formatted with a given metric name"""
+    return f"{{{{query:{key}:{metric}}}}}"
+
+
+def resolve_query_handles(text: str, query_store: Optional[QueryStore]) -> str:
+    """
+    Replace the query handles found in a text, eg. a dashboard body, with the stored
+    queries formatted with the metric name of their handle. Every stored query is only
+    fetched once, however many metrics it is formatted with.
+    """
+
+    queries: Dict[str, str] = dict()
+
+    def resolve(handle: re.Match) -> str:
+        key, metric = handle.groups()
+        if key not in queries:
+            if query_store is None:
+                raise Exception(f'No query store to resolve the query "{key}"')
+            queries[key] = query_store.get(key)
+        return metric.join(queries[key].split(METRIC_PLACEHOLDER))
+
+    return QUERY_HANDLE_PATTERN.sub(resolve, text)
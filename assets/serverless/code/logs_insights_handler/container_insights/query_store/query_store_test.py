@@ -0,0 +1,205 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from container_insights.query_store import (
+    LocalQueryStore,
+    SsmQueryStore,
+    get_query_handle,
+    get_query_key_prefix,
+    get_query_store,
+    resolve_query_handles,
+)
+
+EVENT = {
+    "RequestType": "Create",
+    "ResourceType": "Custom::ContainerInsights-PodMetricQuery",
+    "LogicalResourceId": "PodMetricQuery",
+    "ResourceProperties": {
+        "ServiceToken": "arn:aws:lambda:eu-central-1:123456789012:function:handler",
+        "iLogGroupName": "/aws/containerinsights/eks-cluster/performance",
+        "iNamespaces": ["kube-system"],
+        "iStartTime": "2022-12-19T12:00:00",
+        "iEndTime": "2022-12-19T23:00:00",
+    },
+}
+
+METRIC_QUERY = (
+    'fields {metric} | filter Type = \\"Pod\\" | stats max({metric}) by bin(1m)'
+)
+
+
+def test_local_query_store(tmp_path):
+    query_store = LocalQueryStore(str(tmp_path / "query-store"))
+
+    query_store.put("PodMetricQuery/digest/oQueryNamespace1", METRIC_QUERY)
+    query_store.put("PodMetricQuery/digest/oQueryNamespace2", METRIC_QUERY)
+    query_store.put("PodMetricQuery/other/oQueryNamespace1", METRIC_QUERY)
+
+    assert query_store.get("PodMetricQuery/digest/oQueryNamespace1") == METRIC_QUERY
+
+    query_store.delete("PodMetricQuery/digest/")
+
+    for key in [
+        "PodMetricQuery/digest/oQueryNamespace1",
+        "PodMetricQuery/digest/oQueryNamespace2",
+    ]:
+        with pytest.raises(Exception, match=f'Query "{key}" not found'):
+            query_store.get(key)
+    assert query_store.get("PodMetricQuery/other/oQueryNamespace1") == METRIC_QUERY
+
+
+def test_ssm_query_store():
+    # Queries larger than an SSM standard parameter are split across several ones
+    query = "x" * 4096 + "y" * 100
+    ssm_client = boto3.client("ssm")
+    ssm_stubber = Stubber(ssm_client)
+    for chunk, value in enumerate(["x" * 4096, "y" * 100], start=1):
+        ssm_stubber.add_response(
+            "put_parameter",
+            {"Version": 1},
+            {
+                "Name": f"/dashboards/stack/PodMetricQuery/digest/oQuery/{chunk}",
+                "Value": value,
+                "Type": "String",
+                "Overwrite": True,
+            },
+        )
+    ssm_stubber.add_response(
+        "get_parameters_by_path",
+        {
+            "Parameters": [
+                {
+                    "Name": "/dashboards/stack/PodMetricQuery/digest/oQuery/2",
+                    "Value": "y" * 100,
+                },
+                {
+                    "Name": "/dashboards/stack/PodMetricQuery/digest/oQuery/1",
+                    "Value": "x" * 4096,
+                },
+            ]
+        },
+        {"Path": "/dashboards/stack/PodMetricQuery/digest/oQuery", "Recursive": True},
+    )
+    ssm_stubber.add_response(
+        "get_parameters_by_path",
+        {
+            "Parameters": [
+                {"Name": f"/dashboards/stack/PodMetricQuery/digest/oQuery{index}/1"}
+                for index in range(12)
+            ]
+        },
+        {"Path": "/dashboards/stack/PodMetricQuery/digest", "Recursive": True},
+    )
+    for indexes in [range(10), range(10, 12)]:
+        ssm_stubber.add_response(
+            "delete_parameters",
+            {},
+            {
+                "Names": [
+                    f"/dashboards/stack/PodMetricQuery/digest/oQuery{index}/1"
+                    for index in indexes
+                ]
+            },
+        )
+    ssm_stubber.add_response(
+        "get_parameters_by_path",
+        {"Parameters": []},
+        {"Path": "/dashboards/stack/PodMetricQuery/digest/oQuery", "Recursive": True},
+    )
+
+    query_store = SsmQueryStore("/dashboards/stack/", ssm_client)
+    with ssm_stubber:
+        query_store.put("PodMetricQuery/digest/oQuery", query)
+        assert query_store.get("PodMetricQuery/digest/oQuery") == query
+        query_store.delete("PodMetricQuery/digest/")
+        with pytest.raises(Exception, match='Query "PodMetricQuery/digest/oQuery"'):
+            query_store.get("PodMetricQuery/digest/oQuery")
+
+    ssm_stubber.assert_no_pending_responses()
+
+
+@pytest.mark.parametrize(
+    "uri,expected_class,expected_location",
+    [
+        ("ssm:///dashboards/stack/", SsmQueryStore, "/dashboards/stack/"),
+        ("file:///tmp/query-store", LocalQueryStore, "/tmp/query-store"),
+    ],
+)
+def test_get_query_store(uri, expected_class, expected_location):
+    query_store = get_query_store(uri)
+
+    assert isinstance(query_store, expected_class)
+    assert expected_location in [
+        getattr(query_store, "path", None),
+        getattr(query_store, "directory", None),
+    ]
+
+
+def test_get_query_store_disabled():
+    assert get_query_store("") is None
+    with pytest.raises(Exception) as ex_info:
+        get_query_store("s4://bucket")
+    assert 'Unsupported query store URI "s4://bucket"' in str(ex_info.value)
+
+
+@pytest.mark.parametrize(
+    "property_name,property_value,same_key",
+    [
+        (
+            "ServiceToken",
+            "arn:aws:lambda:eu-central-1:123456789012:function:other",
+            True,
+        ),
+        ("iEndTime", "2022-12-19T22:00:00", False),
+        ("iNamespaces", ["kube-system", "team-*"], False),
+    ],
+)
+def test_get_query_key_prefix(property_name, property_value, same_key):
+    event = {
+        **EVENT,
+        "ResourceProperties": {
+            **EVENT["ResourceProperties"],
+            property_name: property_value,
+        },
+    }
+
+    assert get_query_key_prefix(event).startswith("PodMetricQuery/")
+    assert (get_query_key_prefix(event) == get_query_key_prefix(EVENT)) == same_key
+
+
+def test_resolve_query_handles(tmp_path):
+    query_store = LocalQueryStore(str(tmp_path))
+    query_store.put("PodMetricQuery/digest/oQuery", METRIC_QUERY)
+    handle = get_query_handle("PodMetricQuery/digest/oQuery")
+    # Dashboard widgets format the handles as they would format the queries
+    body = " ".join(
+        metric.join(handle.split("{metric}"))
+        for metric in ["pod_cpu_utilization", "pod_memory_utilization"]
+    )
+
+    assert resolve_query_handles(body, query_store) == " ".join(
+        metric.join(METRIC_QUERY.split("{metric}"))
+        for metric in ["pod_cpu_utilization", "pod_memory_utilization"]
+    )
+    # Generic handles resolve into generic queries
+    assert resolve_query_handles(handle, query_store) == METRIC_QUERY
+    assert resolve_query_handles(METRIC_QUERY, None) == METRIC_QUERY
+    with pytest.raises(Exception, match="No query store"):
+        resolve_query_handles(body, None)
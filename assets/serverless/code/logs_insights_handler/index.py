@@ -14,43 +14,95 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from container_insights import metric_query_formatter, metric_query_generator
-from container_insights.metric_query_generator.container import (
-    ContainerMetricQueryGenerator,
-)
-from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
-from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+import importlib
+from functools import lru_cache
+from typing import Callable
+
+# Handler module, along with the "module:class" path of its metric query generator if
+# any, of every custom resource type. Modules are imported on first use only, so that a
+# cold start only pays for the handler of the incoming resource type.
+RESOURCE_HANDLERS = {
+    # Execute node specific lookup query to generate a generic node metric query
+    "Custom::ContainerInsights-NodeMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.node:NodeMetricQueryGenerator",
+    ),
+    # Execute pod specific lookup query to generate a generic pod metric query
+    "Custom::ContainerInsights-PodMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.pod:PodMetricQueryGenerator",
+    ),
+    # Execute container specific lookup query to generate a generic container metric
+    # query
+    "Custom::ContainerInsights-ContainerMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.container:ContainerMetricQueryGenerator",
+    ),
+    # Execute a single lookup query shared by the node, pod and container resources, each
+    # of them generating the generic metric queries of its own content
+    "Custom::ContainerInsights-DiscoveryMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.discovery:DiscoveryMetricQueryGenerator",
+    ),
+    # Generate the cluster, namespace and service rollup generic metric queries, which
+    # need no lookup query
+    "Custom::ContainerInsights-ClusterMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.rollup:ClusterMetricQueryGenerator",
+    ),
+    "Custom::ContainerInsights-NamespaceMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.rollup:NamespaceMetricQueryGenerator",
+    ),
+    "Custom::ContainerInsights-ServiceMetricQuery": (
+        "container_insights.metric_query_generator",
+        "container_insights.metric_query_generator.rollup:ServiceMetricQueryGenerator",
+    ),
+    # Turns a node, pod or container generic query into a metric specific query
+    "Custom::ContainerInsights-MetricQueryFormatter": (
+        "container_insights.metric_query_formatter",
+        None,
+    ),
+    # Puts a dashboard whose widget queries may be query handles, resolving them into
+    # the stored metric queries
+    "Custom::ContainerInsights-Dashboard": (
+        "container_insights.dashboard",
+        None,
+    ),
+}
+
+
+@lru_cache(maxsize=None)
+def get_resource_handler(resource_type: str) -> Callable:
+    """Import the handler serving a given custom resource type"""
+
+    if resource_type not in RESOURCE_HANDLERS:
+        raise Exception(f"Unknown resource type: {resource_type}")
+
+    module_name, generator_path = RESOURCE_HANDLERS[resource_type]
+    module = importlib.import_module(module_name)
+    if generator_path is None:
+        return module.handler
+
+    generator_module_name, generator_class_name = generator_path.split(":")
+    generator_class = getattr(
+        importlib.import_module(generator_module_name), generator_class_name
+    )
+    return lambda event, context: module.handler(event, context, generator_class())
 
 
 def handler(event, context):
     """
-    This Lambda handler serves four distinct CloudFormation custom resources:
+    This Lambda handler serves nine distinct CloudFormation custom resources:
         1. Custom::ContainerInsights-NodeMetricQuery
         2. Custom::ContainerInsights-PodMetricQuery
         3. Custom::ContainerInsights-ContainerMetricQuery
-        4. Custom::ContainerInsights-MetricQueryFormatter
+        4. Custom::ContainerInsights-DiscoveryMetricQuery
+        5. Custom::ContainerInsights-ClusterMetricQuery
+        6. Custom::ContainerInsights-NamespaceMetricQuery
+        7. Custom::ContainerInsights-ServiceMetricQuery
+        8. Custom::ContainerInsights-MetricQueryFormatter
+        9. Custom::ContainerInsights-Dashboard
     """
 
-    resource_type = event.get("ResourceType", None)
-
-    # Execute node specific lookup query to generate a generic node metric query
-    if resource_type == "Custom::ContainerInsights-NodeMetricQuery":
-        return metric_query_generator.handler(
-            event, context, NodeMetricQueryGenerator()
-        )
-
-    # Execute pod specific lookup query to generate a generic pod metric query
-    if resource_type == "Custom::ContainerInsights-PodMetricQuery":
-        return metric_query_generator.handler(event, context, PodMetricQueryGenerator())
-
-    # Execute container specific lookup query to generate a generic container metric query
-    if resource_type == "Custom::ContainerInsights-ContainerMetricQuery":
-        return metric_query_generator.handler(
-            event, context, ContainerMetricQueryGenerator()
-        )
-
-    # Turns a node, pod or container generic query into a metric specific query
-    if resource_type == "Custom::ContainerInsights-MetricQueryFormatter":
-        return metric_query_formatter.handler(event, context)
-
-    raise Exception(f"Unknown resource type: {resource_type}")
+    return get_resource_handler(event.get("ResourceType", None))(event, context)
@@ -0,0 +1,102 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import sys
+
+import pytest
+
+import index
+
+
+@pytest.mark.parametrize(
+    "resource_type,generator_class_name",
+    [
+        ("Custom::ContainerInsights-NodeMetricQuery", "NodeMetricQueryGenerator"),
+        ("Custom::ContainerInsights-PodMetricQuery", "PodMetricQueryGenerator"),
+        (
+            "Custom::ContainerInsights-ContainerMetricQuery",
+            "ContainerMetricQueryGenerator",
+        ),
+        (
+            "Custom::ContainerInsights-DiscoveryMetricQuery",
+            "DiscoveryMetricQueryGenerator",
+        ),
+        ("Custom::ContainerInsights-ClusterMetricQuery", "ClusterMetricQueryGenerator"),
+        (
+            "Custom::ContainerInsights-NamespaceMetricQuery",
+            "NamespaceMetricQueryGenerator",
+        ),
+        ("Custom::ContainerInsights-ServiceMetricQuery", "ServiceMetricQueryGenerator"),
+    ],
+)
+def test_handler_metric_query_generator(mocker, resource_type, generator_class_name):
+    import container_insights.metric_query_generator
+
+    handler_mock = mocker.patch.object(
+        container_insights.metric_query_generator, "handler", return_value="done"
+    )
+    event = {"ResourceType": resource_type}
+
+    assert index.handler(event, {}) == "done"
+    handler_mock.assert_called_once()
+    assert handler_mock.call_args.args[:2] == (event, {})
+    assert type(handler_mock.call_args.args[2]).__name__ == generator_class_name
+
+
+def test_handler_metric_query_formatter(mocker):
+    import container_insights.metric_query_formatter
+
+    handler_mock = mocker.patch.object(
+        container_insights.metric_query_formatter, "handler", return_value="done"
+    )
+    event = {"ResourceType": "Custom::ContainerInsights-MetricQueryFormatter"}
+
+    assert index.handler(event, {}) == "done"
+    handler_mock.assert_called_once_with(event, {})
+
+
+def test_handler_dashboard(mocker):
+    import container_insights.dashboard
+
+    handler_mock = mocker.patch.object(
+        container_insights.dashboard, "handler", return_value="done"
+    )
+    event = {"ResourceType": "Custom::ContainerInsights-Dashboard"}
+
+    assert index.handler(event, {}) == "done"
+    handler_mock.assert_called_once_with(event, {})
+
+
+def test_handler_unknown_resource_type():
+    with pytest.raises(Exception, match="Unknown resource type: Custom::Unknown"):
+        index.handler({"ResourceType": "Custom::Unknown"}, {})
+
+
+def test_get_resource_handler_lazy_imports(mocker):
+    # Start from a cold execution environment
+    mocker.patch.dict(sys.modules)
+    for module_name in list(sys.modules):
+        if module_name.split(".")[0] in ["container_insights", "jinja2"]:
+            del sys.modules[module_name]
+    index.get_resource_handler.cache_clear()
+
+    index.get_resource_handler("Custom::ContainerInsights-MetricQueryFormatter")
+
+    assert "container_insights.metric_query_formatter" in sys.modules
+    assert "container_insights.metric_query_generator" not in sys.modules
+    assert "jinja2" not in sys.modules
+    index.get_resource_handler.cache_clear()
@@ -0,0 +1,140 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Cold start of the Lambda function for every custom resource type: import time of the
+entry point, and latency of the first invocation up to the CloudFormation response,
+with the handler modules imported on first use or all of them imported up front, as
+the entry point used to do. Every measurement runs in a fresh interpreter.
+
+Metric query generator invocations are measured up to their first Logs Insights call,
+ie. the handler module import, the generator instantiation and the logs client creation.
+
+    python benchmarks/cold_start_benchmark.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HANDLER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "assets",
+    "serverless",
+    "code",
+    "logs_insights_handler",
+)
+
+# Executed in a fresh interpreter, prints the import and first invocation times in ms
+COLD_START_SCRIPT = """
+import json
+import sys
+import time
+
+resource_type, eager = sys.argv[1], sys.argv[2] == "eager"
+
+start = time.perf_counter()
+import index
+imported = time.perf_counter()
+
+if eager:
+    for eager_resource_type in index.RESOURCE_HANDLERS:
+        index.get_resource_handler(eager_resource_type)
+
+handler = index.get_resource_handler(resource_type)
+if resource_type.endswith("Formatter"):
+    from crhelper import CfnResource
+
+    # No CloudFormation to answer
+    CfnResource._send = lambda self, *args, **kwargs: None
+
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 300000
+
+    handler(
+        {
+            "RequestType": "Create",
+            "ResourceType": resource_type,
+            "ResponseURL": "https://localhost/response",
+            "StackId": "arn:aws:cloudformation:us-east-1:123456789012:stack/benchmark/id",
+            "RequestId": "request",
+            "LogicalResourceId": "Formatter",
+            "ResourceProperties": {
+                "iQuery": "fields {metric} | stats max({metric}) by bin(1m)",
+                "iMetric": "pod_cpu_utilization",
+            },
+        },
+        Context(),
+    )
+else:
+    from container_insights.metric_query_generator import get_logs_client
+
+    get_logs_client()
+invoked = time.perf_counter()
+
+print(json.dumps([(imported - start) * 1000, (invoked - imported) * 1000]))
+"""
+
+parser = argparse.ArgumentParser(
+    prog="cold_start_benchmark",
+    description="Benchmark the Lambda function cold start",
+)
+parser.add_argument(
+    "-r",
+    "--runs",
+    type=int,
+    default=5,
+    help="Number of fresh interpreters per measurement.",
+)
+args = parser.parse_args()
+
+
+def _cold_start(resource_type, mode):
+    output = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT, resource_type, mode],
+        cwd=HANDLER_PATH,
+        env={
+            **os.environ,
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_REGION": "us-east-1",
+        },
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+sys.path.insert(0, HANDLER_PATH)
+from index import RESOURCE_HANDLERS
+
+print(
+    f"{'resource type':>36} {'mode':>6} {'import (ms)':>12} {'first invoke (ms)':>18}"
+)
+for resource_type in RESOURCE_HANDLERS:
+    for mode in ["eager", "lazy"]:
+        timings = [_cold_start(resource_type, mode) for _ in range(args.runs)]
+        import_time = statistics.median(timing[0] for timing in timings)
+        invoke_time = statistics.median(timing[1] for timing in timings)
+        print(
+            f"{resource_type.split('-', 1)[1]:>36} {mode:>6} {import_time:>12.1f} {invoke_time:>18.1f}"
+        )
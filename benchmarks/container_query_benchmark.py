@@ -0,0 +1,116 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Rendering time of the container metric query as the number of (pod, container) pairs
+grows, every pod coming with its own distinct container names. The rendering is linear
+in the number of pairs as long as the time per pair stays flat.
+
+    python benchmarks/container_query_benchmark.py --pairs 5000 50000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from container_insights.metric_query_generator.container import (
+    ContainerMetricQueryGenerator,
+)
+
+parser = argparse.ArgumentParser(
+    prog="container_query_benchmark",
+    description="Benchmark the container metric query rendering",
+)
+parser.add_argument(
+    "-p",
+    "--pairs",
+    nargs="+",
+    type=int,
+    default=[5000, 50000],
+    help="Number of (pod, container) pairs returned by the lookup query.",
+)
+parser.add_argument(
+    "-c",
+    "--containers-per-pod",
+    type=int,
+    default=10,
+    help="Number of distinct containers of every pod.",
+)
+parser.add_argument(
+    "-n",
+    "--number",
+    type=int,
+    default=3,
+    help="Number of renders per measurement, the fastest one being reported.",
+)
+args = parser.parse_args()
+
+EVENT = {
+    "ResourceProperties": {
+        "iNamespace": "benchmark",
+        "iStartTime": "2022-12-19T12:00:00",
+        "iEndTime": "2022-12-19T23:00:00",
+    },
+}
+
+
+def _generate_response(pair_count: int):
+    return {
+        "results": [
+            [
+                {"field": "PodName", "value": f"pod-{pod:06d}"},
+                {
+                    "field": "kubernetes.container_name",
+                    "value": f"pod-{pod:06d}-container-{container:02d}",
+                },
+                {"field": "count()", "value": "58"},
+            ]
+            for pod in range(pair_count // args.containers_per_pod)
+            for container in range(args.containers_per_pod)
+        ],
+        "status": "Complete",
+    }
+
+
+generator = ContainerMetricQueryGenerator()
+print(f"{'pairs':>8} {'render (ms)':>14} {'per pair (us)':>14}")
+for pair_count in args.pairs:
+    response = _generate_response(pair_count)
+    duration = min(
+        timeit.repeat(
+            lambda: generator.generate_metric_query(EVENT, response),
+            number=1,
+            repeat=args.number,
+        )
+    )
+    print(
+        f"{pair_count:>8} {duration * 1000:>14.3f} {duration / pair_count * 1000000:>14.3f}"
+    )
@@ -0,0 +1,263 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+End-to-end latency, peak memory and output size of the metric query custom resources,
+driven through the Lambda entry point against a synthetic cluster of growing size, the
+Logs Insights, EventBridge and Lambda clients being stubbed.
+
+Every resource is measured through both of its paths: a lookup query completing within
+the Create invocation, and a lookup query left to the crhelper poll cycle, ie. a Create
+invocation starting it then a Poll invocation collecting its results.
+
+    python benchmarks/handler_benchmark.py --pods 100 1000 10000 --churn-rate 0.5
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["LOOKUP_CACHE_URI"] = ""
+
+import container_insights.metric_query_generator as metric_query_generator
+import index
+from botocore.stub import Stubber
+from crhelper import CfnResource
+from synthetic_cluster import SyntheticCluster, add_shape_arguments, get_shape
+
+START_TIME = "2023-04-12T20:00:00"
+
+QUERY_ID = "11111111-2222-3333-4444-555555555555"
+
+RULE_ARN = "arn:aws:events:us-east-1:123456789012:rule/BenchmarkRule"
+
+parser = argparse.ArgumentParser(
+    prog="handler_benchmark",
+    description="Benchmark the metric query custom resources end-to-end",
+)
+parser.add_argument(
+    "-p",
+    "--pods",
+    nargs="+",
+    type=int,
+    default=[100, 1000, 10000],
+    help="Number of pods of the synthetic cluster.",
+)
+add_shape_arguments(parser)
+parser.add_argument(
+    "--hours", type=float, default=6, help="Investigation window length, in hours."
+)
+parser.add_argument(
+    "--namespace-selectors",
+    nargs="+",
+    default=["namespace-*"],
+    help="Namespace selectors of the pod and container resources.",
+)
+parser.add_argument(
+    "--shards", type=int, default=1, help="Number of shard queries per namespace."
+)
+parser.add_argument(
+    "--runs", type=int, default=3, help="Number of runs per latency measurement."
+)
+args = parser.parse_args()
+
+# Failed requests are reported by their status, rather than by the crhelper logs
+logging.disable(logging.CRITICAL)
+
+
+class Context:
+    function_name = "benchmark"
+
+    def get_remaining_time_in_millis(self):
+        return 300000
+
+
+def _get_event(content: str, end_time: str) -> Dict[str, Any]:
+    content_properties = {
+        "Node": {"iNamespace": ""},
+        "Pod": {"iNamespaces": args.namespace_selectors},
+        "Container": {"iNamespaces": args.namespace_selectors},
+    }
+    if args.shards > 1:
+        for properties in content_properties.values():
+            properties["iShardCount"] = str(args.shards)
+    properties = {
+        "iLogGroupName": "/aws/containerinsights/synthetic-cluster/performance",
+        "iStartTime": START_TIME,
+        "iEndTime": end_time,
+    }
+    if content == "Discovery":
+        # The node resource runs the discovery lookup query shared with the pod and
+        # container resources
+        properties.update(
+            {
+                "iNode": content_properties["Node"],
+                "iSharedLookup": {
+                    "iPod": content_properties["Pod"],
+                    "iContainer": content_properties["Container"],
+                },
+            }
+        )
+    else:
+        properties.update(content_properties[content])
+
+    return {
+        "RequestType": "Create",
+        "ResourceType": f"Custom::ContainerInsights-{content}MetricQuery",
+        "ResponseURL": "https://localhost/response",
+        "StackId": "arn:aws:cloudformation:us-east-1:123456789012:stack/benchmark/id",
+        "RequestId": "request",
+        "LogicalResourceId": f"{content}MetricQuery",
+        "ResourceProperties": properties,
+    }
+
+
+def _invoke(event, stubs: List[Tuple[Any, str, Dict[str, Any]]]) -> List[Dict]:
+    """Invoke the Lambda entry point, the clients answering the given stubs in order"""
+
+    responses = []
+    helper = metric_query_generator.helper
+    helper._send = lambda status=None, reason="": CfnResource._send(
+        helper,
+        status,
+        reason,
+        send_response=lambda url, body, ssl_verify: responses.append(body),
+    )
+    with ExitStack() as stack:
+        stubbers = {}
+        for client, operation, response in stubs:
+            if client not in stubbers:
+                stubbers[client] = stack.enter_context(Stubber(client))
+            stubbers[client].add_response(operation, response)
+        index.handler(event, Context())
+        for stubber in stubbers.values():
+            stubber.assert_no_pending_responses()
+
+    return responses
+
+
+def _start_query_stubs(logs_client) -> List[Tuple[Any, str, Dict[str, Any]]]:
+    return [
+        (logs_client, "describe_queries", {"queries": []}),
+        (logs_client, "describe_queries", {"queries": []}),
+        (logs_client, "start_query", {"queryId": QUERY_ID}),
+    ]
+
+
+def _run_in_invocation(event, lookup_response) -> List[Dict]:
+    """Create invocation, the lookup query completing within the invocation"""
+
+    metric_query_generator.LOOKUP_POLLING_BUDGET = 30
+    logs_client = metric_query_generator.get_logs_client()
+    return _invoke(
+        json.loads(json.dumps(event)),
+        _start_query_stubs(logs_client)
+        + [(logs_client, "get_query_results", lookup_response)],
+    )
+
+
+def _run_poll_cycle(event, lookup_response) -> List[Dict]:
+    """Create invocation starting the lookup query, then Poll invocation collecting it"""
+
+    metric_query_generator.LOOKUP_POLLING_BUDGET = 0
+    helper = metric_query_generator.helper
+    logs_client = metric_query_generator.get_logs_client()
+    create_responses = _invoke(
+        json.loads(json.dumps(event)),
+        _start_query_stubs(logs_client)
+        + [
+            (helper._events_client, "put_rule", {"RuleArn": RULE_ARN}),
+            (helper._lambda_client, "add_permission", {"Statement": "{}"}),
+            (helper._events_client, "put_targets", {"FailedEntryCount": 0}),
+        ],
+    )
+    assert not create_responses, create_responses
+
+    return _invoke(
+        json.loads(json.dumps(helper._event)),
+        [
+            (logs_client, "get_query_results", lookup_response),
+            (helper._events_client, "remove_targets", {"FailedEntryCount": 0}),
+            (helper._lambda_client, "remove_permission", {}),
+            (helper._events_client, "delete_rule", {}),
+        ],
+    )
+
+
+def _measure(run, event, lookup_response) -> Tuple[float, float, Dict[str, Any]]:
+    """Median latency (ms), peak memory (MiB) and CloudFormation response of a run"""
+
+    latencies = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        run(event, lookup_response)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    responses = run(event, lookup_response)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return statistics.median(latencies), peak_memory / 1024**2, responses[-1]
+
+
+print(
+    f"{'pods':>7} {'nodes':>6} {'resource':>10} {'path':>11} {'status':>8} {'latency (ms)':>13} {'memory (MiB)':>13} {'queries':>8} {'max query':>10} {'response (KB)':>14}"
+)
+for pod_count in args.pods:
+    shape = get_shape(args, pod_count)
+    start_time = metric_query_generator._get_timestamp(START_TIME)
+    end_time = start_time + int(args.hours * 3600)
+    cluster = SyntheticCluster(shape, start_time, end_time)
+    for content in ["Node", "Pod", "Container", "Discovery"]:
+        event = _get_event(
+            content,
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(end_time)),
+        )
+        lookup_response = cluster.lookup_response(event)
+        for path, run in [
+            ("invocation", _run_in_invocation),
+            ("poll cycle", _run_poll_cycle),
+        ]:
+            latency, memory, response = _measure(run, event, lookup_response)
+            queries = [
+                value
+                for name, value in response["Data"].items()
+                if name.startswith("o")
+            ]
+            print(
+                f"{pod_count:>7} {shape.nodes:>6} {content:>10} {path:>11} {response['Status']:>8} {latency:>13.1f} {memory:>13.2f} {len(queries):>8} {max(map(len, queries), default=0):>10} {len(json.dumps(response)) / 1024:>14.1f}"
+            )
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Series extraction time of the metric query generators out of large lookup query
+responses, scanning the fields of every row as the generators used to do, or reading
+the columns of the query results view.
+
+    python benchmarks/query_results_benchmark.py --rows 1000 10000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from container_insights.metric_query_generator.container import (
+    ContainerMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+
+parser = argparse.ArgumentParser(
+    prog="query_results_benchmark",
+    description="Benchmark the series extraction out of lookup query responses",
+)
+parser.add_argument(
+    "-r",
+    "--rows",
+    nargs="+",
+    type=int,
+    default=[1000, 10000],
+    help="Number of rows of the lookup query response.",
+)
+parser.add_argument(
+    "-n",
+    "--number",
+    type=int,
+    default=20,
+    help="Number of extractions per measurement.",
+)
+args = parser.parse_args()
+
+EVENT = {"ResourceProperties": {"iNamespace": "benchmark"}}
+
+
+def _generate_response(row_count):
+    return {
+        "results": [
+            [
+                {"field": "NodeName", "value": f"ip-10-0-{row % 256}-{row // 256}"},
+                {"field": "Namespace", "value": f"namespace-{row % 10}"},
+                {"field": "PodName", "value": f"pod-{row}"},
+                {"field": "kubernetes.container_name", "value": f"container-{row}"},
+                {"field": "count()", "value": "60"},
+            ]
+            for row in range(row_count)
+        ],
+        "statistics": {},
+        "status": "Complete",
+    }
+
+
+def _node_series_before(event, response):
+    """Former behavior: one scan of every field of every row"""
+    return [
+        field["value"]
+        for result in response["results"]
+        for field in result
+        if field["field"] == "NodeName"
+    ]
+
+
+def _pod_series_before(event, response):
+    """Former behavior: one dict built per row"""
+    series = []
+    for result in response["results"]:
+        fields = {field["field"]: field["value"] for field in result}
+        series.append(
+            (
+                fields.get("Namespace", event["ResourceProperties"].get("iNamespace")),
+                fields["PodName"],
+            )
+        )
+    return series
+
+
+def _container_series_before(event, response):
+    """Former behavior: one dict built per row"""
+    series = []
+    for result in response["results"]:
+        fields = {field["field"]: field["value"] for field in result}
+        series.append(
+            (
+                fields.get("Namespace", event["ResourceProperties"].get("iNamespace")),
+                fields["PodName"],
+                fields["kubernetes.container_name"],
+            )
+        )
+    return series
+
+
+GENERATORS = [
+    ("node", _node_series_before, NodeMetricQueryGenerator()),
+    ("pod", _pod_series_before, PodMetricQueryGenerator()),
+    ("container", _container_series_before, ContainerMetricQueryGenerator()),
+]
+
+print(
+    f"{'rows':>8} {'content':>10} {'before (ms)':>14} {'after (ms)':>14} {'speedup':>10}"
+)
+for row_count in args.rows:
+    response = _generate_response(row_count)
+    for content, get_series_before, generator in GENERATORS:
+        assert get_series_before(EVENT, response) == generator.get_series(
+            EVENT, response
+        )
+
+        before = timeit.timeit(
+            lambda: get_series_before(EVENT, response), number=args.number
+        )
+        after = timeit.timeit(
+            lambda: generator.get_series(EVENT, response), number=args.number
+        )
+        print(
+            f"{row_count:>8} {content:>10} {before / args.number * 1000:>14.3f} {after / args.number * 1000:>14.3f} {before / after:>9.1f}x"
+        )
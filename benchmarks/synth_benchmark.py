@@ -0,0 +1,176 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Synthesis time, template size and resource count of the dashboards stack for generated
+dashboard configurations of growing size: the pod and container contents spread over
+a given number of namespaces, plotting a given number of metrics each.
+
+The Lambda function is synthesized from inline code, so that the measurements leave out
+the Docker bundling of its asset. The cdk-nag checks run as they do in app.py.
+
+    python benchmarks/synth_benchmark.py --namespaces 1 10 50 --metrics 15
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Tuple
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import aws_cdk as cdk
+import aws_cdk.aws_lambda as lambda_
+from cdk_nag import AwsSolutionsChecks, NagPackSuppression, NagSuppressions
+
+from cdk.ci_log_based_dashboard_stack import ContainerInsightsLogBasedDashboardStack
+from cdk.dashboard_configuration import (
+    DEFAULT_WIDGETS_PER_PAGE,
+    get_metric_query_properties,
+)
+
+parser = argparse.ArgumentParser(
+    prog="synth_benchmark",
+    description="Measure the synthesis of the dashboards stack for growing configurations",
+)
+parser.add_argument(
+    "--namespaces",
+    type=int,
+    nargs="+",
+    default=[1, 10, 50],
+    help="Numbers of namespaces of the pod and container contents.",
+)
+parser.add_argument(
+    "--metrics",
+    type=int,
+    default=15,
+    help="Number of metrics plotted by every content.",
+)
+parser.add_argument(
+    "--runs",
+    type=int,
+    default=3,
+    help="Number of synthesis runs per configuration, the fastest one being reported.",
+)
+parser.add_argument(
+    "--widgets-per-page",
+    type=int,
+    default=DEFAULT_WIDGETS_PER_PAGE,
+    help="Widgets budget of a dashboard page.",
+)
+args = parser.parse_args()
+
+
+def get_dashboard_configuration(namespace_count: int) -> Dict[str, Any]:
+    namespaces = [f"namespace-{index}" for index in range(1, namespace_count + 1)]
+    return {
+        "name": "SynthBenchmark",
+        "clusterName": "synth-benchmark",
+        "timeToLiveInMinutes": 20,
+        "widgetsPerPage": args.widgets_per_page,
+        "investigationWindow": {
+            "from": "2023-04-12T20:10:00",
+            "to": "2023-04-12T20:20:00",
+        },
+        "contents": {
+            "node": {
+                "enabled": True,
+                "metrics": [f"node_metric_{index}" for index in range(args.metrics)],
+            },
+            "pod": {
+                "enabled": True,
+                "namespaces": namespaces,
+                "metrics": [f"pod_metric_{index}" for index in range(args.metrics)],
+            },
+            "container": {
+                "enabled": True,
+                "namespaces": namespaces,
+                "metrics": [
+                    f"container_metric_{index}" for index in range(args.metrics)
+                ],
+            },
+        },
+    }
+
+
+def create_lambda_function(**kwargs):
+    return lambda_.Function(
+        scope=kwargs["scope"],
+        id=kwargs["id"],
+        description=kwargs["description"],
+        timeout=kwargs["timeout"],
+        runtime=kwargs["runtime"],
+        code=lambda_.Code.from_inline("def handler(event, context):\n    pass\n"),
+        handler="index.handler",
+        environment=kwargs["environment"],
+        initial_policy=kwargs["initial_policy"],
+    )
+
+
+def synthesize(dashboard_configuration: Dict[str, Any]) -> Tuple[cdk.Stack, Dict]:
+    """Synthesize the dashboards stack, as app.py does"""
+
+    with mock.patch(
+        "cdk.ci_log_based_dashboard_stack.PythonFunction",
+        side_effect=create_lambda_function,
+    ):
+        app = cdk.App(context={"dashboardConfiguration": dashboard_configuration})
+        stack = ContainerInsightsLogBasedDashboardStack(
+            app,
+            "SynthBenchmarkStack",
+            ttl=cdk.Duration.minutes(20),
+        )
+        cdk.Aspects.of(app).add(AwsSolutionsChecks())
+        NagSuppressions.add_stack_suppressions(
+            stack,
+            suppressions=[
+                NagPackSuppression(
+                    id="AwsSolutions-IAM4",
+                    reason="Allow AWS Managed policies",
+                )
+            ],
+        )
+        return stack, app.synth().get_stack_by_name(stack.stack_name).template
+
+
+print(
+    f"{'namespaces':>10} {'metrics':>8} {'dashboards':>11} {'widgets':>8} {'constructs':>11} {'resources':>10} {'outputs':>8} {'template KB':>12} {'synth (s)':>10}"
+)
+for namespace_count in args.namespaces:
+    dashboard_configuration = get_dashboard_configuration(namespace_count)
+    _, contents = get_metric_query_properties(dashboard_configuration)
+    widget_count = sum(
+        len(content_configuration["metrics"])
+        * len(metric_query_properties.get("iNamespaces", [""]))
+        for content_configuration, metric_query_properties in contents.values()
+    )
+
+    synth_times = []
+    for _ in range(args.runs):
+        start_time = time.perf_counter()
+        stack, template = synthesize(dashboard_configuration)
+        synth_times.append(time.perf_counter() - start_time)
+
+    resource_types = [
+        resource["Type"] for resource in template.get("Resources", {}).values()
+    ]
+    print(
+        f"{namespace_count:>10} {args.metrics:>8} {resource_types.count('AWS::CloudWatch::Dashboard'):>11} {widget_count:>8} {len(stack.node.find_all()):>11} {len(resource_types):>10} {len(template.get('Outputs', {})):>8} {len(json.dumps(template)) / 1024:>12.1f} {min(synth_times):>10.2f}"
+    )
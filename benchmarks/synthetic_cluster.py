@@ -0,0 +1,504 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Synthetic Container Insights workload of a configurable cluster shape: the Logs Insights
+responses of the lookup queries, and the performance log events (Embedded Metric Format)
+the Container Insights agents would have written over an investigation window.
+
+Pods are owned by Deployments, named the way Kubernetes names them, and spread across
+the nodes. Churn replaces a share of the pods of every workload per hour, eg. rollouts
+or autoscaling, each replacement making a new pod name.
+
+    python benchmarks/synthetic_cluster.py --nodes 3 --pods 20 --hours 1 > logs.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from container_insights.metric_query_generator.namespace_selector import (
+    match_namespace,
+)
+
+POD_NAME_SUFFIX_CHARACTERS = "bcdfghjklmnpqrstvwxz2456789"
+
+# Metrics of the synthetic performance log events, per log event type
+METRICS = {
+    "Node": {
+        "node_cpu_utilization": "Percent",
+        "node_memory_utilization": "Percent",
+        "node_cpu_reserved_capacity": "Percent",
+        "node_memory_reserved_capacity": "Percent",
+        "node_number_of_running_pods": "Count",
+        "node_number_of_running_containers": "Count",
+    },
+    "Pod": {
+        "pod_cpu_utilization": "Percent",
+        "pod_memory_utilization": "Percent",
+        "pod_cpu_reserved_capacity": "Percent",
+        "pod_memory_reserved_capacity": "Percent",
+        "pod_network_rx_bytes": "Bytes/Second",
+        "pod_network_tx_bytes": "Bytes/Second",
+    },
+    "Container": {
+        "container_cpu_utilization": "Percent",
+        "container_memory_utilization": "Percent",
+        "number_of_container_restarts": "Count",
+    },
+}
+
+DIMENSIONS = {
+    "Node": [["NodeName", "InstanceId", "ClusterName"], ["ClusterName"]],
+    "Pod": [["PodName", "Namespace", "ClusterName"], ["Namespace", "ClusterName"]],
+    "Container": [["ClusterName"]],
+}
+
+
+@dataclass
+class ClusterShape:
+    """Shape of the synthetic cluster"""
+
+    nodes: int = 3
+    namespaces: int = 2
+    pods: int = 20
+    containers_per_pod: int = 2
+    pods_per_workload: int = 2
+    # Share of the pods of every workload replaced per hour
+    churn_rate: float = 0.0
+    cluster_name: str = "synthetic-cluster"
+
+
+@dataclass
+class Pod:
+    namespace: str
+    workload: str
+    name: str
+    node_name: str
+    containers: List[str]
+    start_time: int
+    end_time: int
+    # Per pod load, keeping the series apart from each other
+    load: float = field(default=0.5)
+
+
+class SyntheticCluster:
+    """Pods and nodes of a synthetic cluster over a given time window (epoch seconds)"""
+
+    def __init__(
+        self, shape: ClusterShape, start_time: int, end_time: int, seed: int = 0
+    ):
+        self.shape = shape
+        self.start_time = start_time
+        self.end_time = end_time
+        self._random = random.Random(seed)
+        self.node_names = [
+            f"ip-10-0-{index // 250}-{index % 250 + 1}.ec2.internal"
+            for index in range(shape.nodes)
+        ]
+        self.namespaces = [f"namespace-{index}" for index in range(shape.namespaces)]
+        self.pods: List[Pod] = []
+        for index in range(max(1, shape.pods // shape.pods_per_workload)):
+            namespace = self.namespaces[index % len(self.namespaces)]
+            workload = f"workload-{index}"
+            containers = [
+                f"{workload}-container-{container}"
+                for container in range(shape.containers_per_pod)
+            ]
+            for _ in range(shape.pods_per_workload):
+                self._schedule_pods(namespace, workload, containers)
+
+    def _schedule_pods(self, namespace: str, workload: str, containers: List[str]):
+        """Pods of a workload replica, replaced over time at the churn rate"""
+
+        pod_template_hash = self._random_suffix(10)
+        start_time = self.start_time
+        while start_time < self.end_time:
+            end_time = self.end_time
+            if self.shape.churn_rate > 0:
+                lifetime = self._random.expovariate(self.shape.churn_rate / 3600)
+                end_time = min(end_time, start_time + max(60, int(lifetime)))
+            self.pods.append(
+                Pod(
+                    namespace=namespace,
+                    workload=workload,
+                    name=f"{workload}-{pod_template_hash}-{self._random_suffix(5)}",
+                    node_name=self._random.choice(self.node_names),
+                    containers=containers,
+                    start_time=start_time,
+                    end_time=end_time,
+                    load=self._random.random(),
+                )
+            )
+            start_time = end_time
+
+    def _random_suffix(self, length: int) -> str:
+        return "".join(
+            self._random.choice(POD_NAME_SUFFIX_CHARACTERS) for _ in range(length)
+        )
+
+    def get_pods(self, properties: Dict[str, Any]) -> List[Pod]:
+        """The pods selected by the namespace properties of a lookup resource"""
+
+        if "iNamespaces" in properties:
+            return [
+                pod
+                for pod in self.pods
+                if any(
+                    match_namespace(selector, pod.namespace)
+                    for selector in properties["iNamespaces"]
+                )
+            ]
+        if namespace := properties.get("iNamespace", ""):
+            return [pod for pod in self.pods if pod.namespace == namespace]
+        return list(self.pods)
+
+    def lookup_response(self, event) -> Dict[str, Any]:
+        """
+        The Logs Insights response of the lookup query of a given metric query resource,
+        with the fields the generator of that resource expects.
+        """
+
+        content = event["ResourceType"].split("-", 1)[1].replace("MetricQuery", "")
+        # A lookup query shared with other resources covers their properties as well
+        properties = {
+            **event["ResourceProperties"],
+            **event["ResourceProperties"].get("iSharedLookup", {}),
+        }
+        if content == "Discovery":
+            results = [
+                result
+                for discovered_content in ["Node", "Pod", "Container"]
+                if f"i{discovered_content}" in properties
+                for result in self._get_results(
+                    discovered_content,
+                    {**properties, **properties[f"i{discovered_content}"]},
+                    discovery=True,
+                )
+            ]
+        else:
+            results = self._get_results(content, properties)
+
+        return {
+            "results": results,
+            "statistics": self._get_statistics(),
+            "status": "Complete",
+        }
+
+    def _get_results(
+        self, content: str, properties: Dict[str, Any], discovery: bool = False
+    ) -> List[List[Dict[str, str]]]:
+        if content == "Node":
+            rows = [{"NodeName": node_name} for node_name in self.node_names]
+        elif content == "Pod":
+            rows = [
+                {
+                    "Namespace": pod.namespace,
+                    "PodName": pod.name,
+                    "NodeName": pod.node_name,
+                    f"kubernetes.labels.{properties.get('iWorkloadLabel', 'app')}": pod.workload,
+                    "rank": pod.load,
+                }
+                for pod in self.get_pods(properties)
+            ]
+        else:
+            rows = [
+                {
+                    "Namespace": pod.namespace,
+                    "PodName": pod.name,
+                    "kubernetes.container_name": container,
+                    "NodeName": pod.node_name,
+                    "rank": pod.load,
+                }
+                for pod in self.get_pods(properties)
+                for container in pod.containers
+            ]
+
+        if discovery:
+            fields = ["Type", "NodeName", "Namespace", "PodName"]
+            if content == "Container":
+                fields.append("kubernetes.container_name")
+            rows = [{"Type": content, **row} for row in rows]
+        else:
+            fields = self._get_lookup_fields(content, properties)
+
+        # Distinct combinations of the lookup fields, as a stats by command would make
+        distinct_rows = dict()
+        for row in rows:
+            key = tuple(row.get(name, None) for name in fields)
+            if key in distinct_rows:
+                distinct_rows[key]["rank"] = max(
+                    distinct_rows[key].get("rank", 0), row.get("rank", 0)
+                )
+            else:
+                distinct_rows[key] = row
+        rows = list(distinct_rows.values())
+
+        if "iTopK" in properties and not discovery:
+            rows.sort(key=lambda row: row.get("rank", 0), reverse=True)
+            if "iNamespaces" not in properties:
+                rows = rows[: int(properties["iTopK"])]
+            aggregate = "rank"
+        else:
+            aggregate = "count()"
+
+        return [
+            [
+                {"field": name, "value": str(row[name])}
+                for name in fields
+                if row.get(name, None) is not None
+            ]
+            + [
+                {
+                    "field": aggregate,
+                    "value": str(row.get("rank", 0) if aggregate == "rank" else 60),
+                }
+            ]
+            for row in rows
+        ]
+
+    @staticmethod
+    def _get_lookup_fields(content: str, properties: Dict[str, Any]) -> List[str]:
+        if content == "Node":
+            return ["NodeName"]
+
+        fields = ["Namespace"] if "iNamespaces" in properties else []
+        if content == "Pod":
+            fields.append(
+                f"kubernetes.labels.{properties['iWorkloadLabel']}"
+                if properties.get("iGroupBy", None) == "workload"
+                and properties.get("iWorkloadLabel", None)
+                else "PodName"
+            )
+        else:
+            fields.extend(["PodName", "kubernetes.container_name"])
+        if properties.get("iTargetLogStreams", "") == "true":
+            fields.append("NodeName")
+        return fields
+
+    def _get_statistics(self, interval: int = 60) -> Dict[str, float]:
+        """Statistics of a lookup query scanning every performance log event"""
+
+        records_scanned = len(self.node_names) * len(
+            range(self.start_time, self.end_time, interval)
+        ) + sum(
+            len(range(pod.start_time, pod.end_time, interval))
+            * (1 + len(pod.containers))
+            for pod in self.pods
+        )
+        return {
+            "recordsMatched": float(records_scanned),
+            "recordsScanned": float(records_scanned),
+            # Container Insights performance log events weigh about 1 KB each
+            "bytesScanned": float(records_scanned * 1024),
+        }
+
+    def performance_logs(self, interval: int = 60) -> Iterator[Dict[str, Any]]:
+        """
+        The performance log events of the nodes, pods and containers over the window,
+        one per node, pod and container every "interval" seconds
+        """
+
+        for timestamp in range(self.start_time, self.end_time, interval):
+            running_pods = [
+                pod for pod in self.pods if pod.start_time <= timestamp < pod.end_time
+            ]
+            for index, node_name in enumerate(self.node_names):
+                node_pods = [pod for pod in running_pods if pod.node_name == node_name]
+                yield self._log_event(
+                    "Node",
+                    timestamp,
+                    {"NodeName": node_name, "InstanceId": f"i-{index:017x}"},
+                    min(
+                        1,
+                        0.5
+                        * len(node_pods)
+                        * len(self.node_names)
+                        / max(1, len(running_pods)),
+                    ),
+                    {
+                        "node_number_of_running_pods": len(node_pods),
+                        "node_number_of_running_containers": sum(
+                            len(pod.containers) for pod in node_pods
+                        ),
+                    },
+                )
+            for pod in running_pods:
+                kubernetes = {
+                    "host": pod.node_name,
+                    "labels": {"app": pod.workload},
+                    "namespace_name": pod.namespace,
+                    "pod_name": pod.name,
+                    "pod_owners": [
+                        {
+                            "owner_kind": "ReplicaSet",
+                            "owner_name": pod.name.rsplit("-", 1)[0],
+                        }
+                    ],
+                }
+                yield self._log_event(
+                    "Pod",
+                    timestamp,
+                    {
+                        "NodeName": pod.node_name,
+                        "Namespace": pod.namespace,
+                        "PodName": pod.name,
+                        "kubernetes": kubernetes,
+                    },
+                    pod.load,
+                )
+                for container in pod.containers:
+                    yield self._log_event(
+                        "Container",
+                        timestamp,
+                        {
+                            "NodeName": pod.node_name,
+                            "Namespace": pod.namespace,
+                            "PodName": pod.name,
+                            "kubernetes": {
+                                **kubernetes,
+                                "container_name": container,
+                            },
+                        },
+                        pod.load,
+                        {"number_of_container_restarts": 0},
+                    )
+
+    def _log_event(
+        self,
+        event_type: str,
+        timestamp: int,
+        fields: Dict[str, Any],
+        load: float,
+        values: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        metrics = {
+            metric: round(
+                (
+                    100 * load * self._random.uniform(0.8, 1.2)
+                    if unit == "Percent"
+                    else 1e6 * load * self._random.uniform(0.8, 1.2)
+                ),
+                3,
+            )
+            for metric, unit in METRICS[event_type].items()
+        }
+        metrics.update(values or {})
+        return {
+            "Type": event_type,
+            "ClusterName": self.shape.cluster_name,
+            "Timestamp": str(timestamp * 1000),
+            "Version": "0",
+            **fields,
+            **metrics,
+            "_aws": {
+                "Timestamp": timestamp * 1000,
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": "ContainerInsights",
+                        "Dimensions": DIMENSIONS[event_type],
+                        "Metrics": [
+                            {"Name": metric, "Unit": unit}
+                            for metric, unit in METRICS[event_type].items()
+                        ],
+                    }
+                ],
+            },
+        }
+
+
+def get_timestamp(value: str) -> int:
+    return int(
+        datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser):
+    """Command line arguments of the cluster shape, shared by the benchmarks"""
+
+    parser.add_argument(
+        "--nodes", type=int, help="Number of nodes, one per 30 pods by default."
+    )
+    parser.add_argument("--namespaces", type=int, default=ClusterShape.namespaces)
+    parser.add_argument(
+        "--containers-per-pod", type=int, default=ClusterShape.containers_per_pod
+    )
+    parser.add_argument(
+        "--pods-per-workload", type=int, default=ClusterShape.pods_per_workload
+    )
+    parser.add_argument(
+        "--churn-rate",
+        type=float,
+        default=ClusterShape.churn_rate,
+        help="Share of the pods of every workload replaced per hour.",
+    )
+
+
+def get_shape(args: argparse.Namespace, pods: int) -> ClusterShape:
+    """Cluster shape of the command line arguments, for a given number of pods"""
+
+    return ClusterShape(
+        nodes=args.nodes or max(1, pods // 30),
+        namespaces=args.namespaces,
+        pods=pods,
+        containers_per_pod=args.containers_per_pod,
+        pods_per_workload=args.pods_per_workload,
+        churn_rate=args.churn_rate,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="synthetic_cluster",
+        description="Print the performance log events of a synthetic cluster as JSON lines",
+    )
+    add_shape_arguments(parser)
+    parser.add_argument("--pods", type=int, default=ClusterShape.pods)
+    parser.add_argument("--start", default="2023-04-12T20:00:00")
+    parser.add_argument("--hours", type=float, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start_time = get_timestamp(args.start)
+    cluster = SyntheticCluster(
+        get_shape(args, args.pods),
+        start_time,
+        start_time + int(args.hours * 3600),
+        args.seed,
+    )
+    for log_event in cluster.performance_logs():
+        print(json.dumps(log_event))
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Per-render time of the metric query templates, before and after the introduction of
+the process wide query template registry.
+
+    python benchmarks/template_registry_benchmark.py --pods 10 100 1000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from container_insights.metric_query_generator.pod import (
+    PodMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.template_registry import (
+    QUERY_TEMPLATE_REGISTRY,
+    QueryTemplateRegistry,
+)
+from jinja2 import BaseLoader, Environment
+
+parser = argparse.ArgumentParser(
+    prog="template_registry_benchmark",
+    description="Benchmark the metric query template rendering",
+)
+parser.add_argument(
+    "-p",
+    "--pods",
+    nargs="+",
+    type=int,
+    default=[10, 100, 1000],
+    help="Number of pods returned by the lookup query.",
+)
+parser.add_argument(
+    "-n",
+    "--number",
+    type=int,
+    default=200,
+    help="Number of renders per measurement.",
+)
+args = parser.parse_args()
+
+
+def _render_before(pod_names):
+    """Former behavior: a new environment parses and compiles the template on every render"""
+    return (
+        Environment(loader=BaseLoader())
+        .from_string(PodMetricQueryGenerator.QUERY_TEMPLATE)
+        .render(namespaces=["benchmark"], pod_names=pod_names, period="1m")
+    )
+
+
+def _render_after(pod_names):
+    return PodMetricQueryGenerator().query_template.render(
+        namespaces=["benchmark"], pod_names=pod_names, period="1m"
+    )
+
+
+print(f"{'pods':>8} {'before (ms)':>14} {'after (ms)':>14} {'speedup':>10}")
+for pod_count in args.pods:
+    pod_names = [("benchmark", f"pod-{i}") for i in range(pod_count)]
+    assert _render_before(pod_names) == _render_after(pod_names)
+
+    before = timeit.timeit(lambda: _render_before(pod_names), number=args.number)
+    after = timeit.timeit(lambda: _render_after(pod_names), number=args.number)
+    print(
+        f"{pod_count:>8} {before / args.number * 1000:>14.3f} {after / args.number * 1000:>14.3f} {before / after:>9.1f}x"
+    )
+
+# Cold start: first template load of a fresh process, with and without precompiled modules
+with tempfile.TemporaryDirectory() as compiled_templates_path:
+    QUERY_TEMPLATE_REGISTRY.compile_templates(compiled_templates_path)
+
+    def _first_load(path):
+        registry = QueryTemplateRegistry(compiled_templates_path=path)
+        registry.register(
+            PodMetricQueryGenerator.__name__, PodMetricQueryGenerator.QUERY_TEMPLATE
+        )
+        return registry.get_template(PodMetricQueryGenerator.__name__)
+
+    parsed = timeit.timeit(
+        lambda: _first_load(os.path.join(compiled_templates_path, "missing")),
+        number=args.number,
+    )
+    precompiled = timeit.timeit(
+        lambda: _first_load(compiled_templates_path), number=args.number
+    )
+    print()
+    print(f"{'first load':>23} {'(ms)':>14}")
+    print(f"{'parsed from source':>23} {parsed / args.number * 1000:>14.3f}")
+    print(f"{'precompiled module':>23} {precompiled / args.number * 1000:>14.3f}")
@@ -14,19 +14,102 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import math
 import os
+import re
+from collections import Counter
 from datetime import datetime
-from typing import List
+from hashlib import sha1
+from typing import Any, Dict, List, Optional, Tuple
 
 import aws_cdk as cdk
 import aws_cdk.aws_lambda as lambda_
-from aws_cdk.aws_cloudwatch import Dashboard, LogQueryVisualizationType, LogQueryWidget
+import jsii
+from aws_cdk.aws_cloudwatch import (
+    Column,
+    Dashboard,
+    IWidget,
+    LogQueryVisualizationType,
+    LogQueryWidget,
+    Row,
+    TextWidget,
+)
 from aws_cdk.aws_iam import PolicyStatement
-from aws_cdk.aws_lambda_python_alpha import PythonFunction
+from aws_cdk.aws_lambda_python_alpha import (
+    BundlingOptions,
+    ICommandHooks,
+    PythonFunction,
+)
 from cdk_nag import NagPackSuppression, NagSuppressions
 from cloudcomponents.cdk_temp_stack import TempStack
 from constructs import Construct
 
+from cdk.dashboard_configuration import (
+    ROLLUP_CONTENTS,
+    get_log_group_name,
+    get_metric_query_properties,
+    get_pages,
+    get_widgets_per_page,
+)
+
+LOOKUP_CACHE_PREFIX = "container-insights-lookup-cache/"
+
+# Parameter Store path of the metric queries too large for custom resource responses
+QUERY_STORE_PATH = "/container-insights-dashboards/"
+
+# Placeholder of the metric name in the generic metric queries
+METRIC_PLACEHOLDER = "{metric}"
+# Attribute of the metric query custom resources holding the key prefix of their stored
+# metric queries, when the query references are enabled
+QUERY_KEY_PREFIX_ATTRIBUTE = "oQueryKeyPrefix"
+
+# Estimated number of custom resources and dashboards beyond which they are split into
+# nested stacks, leaving room below the 500 resources per stack limit for the Lambda
+# function and the TempStack internals
+NESTED_STACKS_RESOURCE_THRESHOLD = 400
+# Dashboards, pages included, and metric query custom resources, and widgets of a nested
+# stack, keeping it below the 500 resources per stack limit, and its template, about 500
+# bytes per widget, well below the 1 MB limit
+NESTED_STACK_RESOURCE_BUDGET = 400
+NESTED_STACK_WIDGET_BUDGET = 1000
+
+# Number of dashboards, pages included, beyond which their URLs are only listed by the
+# index dashboard, keeping the stack below the 200 outputs limit
+MAX_DASHBOARD_OUTPUTS = 100
+
+DISCOVERY_GROUP = "Discovery"
+
+# Custom resource response budget of the metric queries, below the 4 KB CloudFormation
+# limit which also covers the rest of the response
+MAX_RESPONSE_DATA_SIZE = 3072
+# Estimated size of a generic metric query of a namespace selector (or of a shard of it),
+# the actual size growing with the number of series of the namespace. The namespace
+# selectors of a content are spread across several custom resources accordingly
+METRIC_QUERY_SIZE_ESTIMATES = {"Node": 1024, "Pod": 1536, "Container": 3072}
+DEFAULT_METRIC_QUERY_SIZE_ESTIMATE = 1024
+# Namespace selectors covered by a lookup query, and whose metric queries a custom
+# resource stores given query references, keeping the lookup query, its results and the
+# queries stored per invocation within bounds whatever the size of a nested stack chunk
+MAX_LOOKUP_NAMESPACE_SELECTORS = 50
+
+
+@jsii.implements(ICommandHooks)
+class PrecompileQueryTemplatesHooks:
+    """
+    Bundling hooks shipping ahead-of-time compiled metric query templates in the Lambda
+    asset, so that cold starts skip the template parsing.
+    """
+
+    def before_bundling(self, input_dir: str, output_dir: str) -> List[str]:
+        return []
+
+    def after_bundling(self, input_dir: str, output_dir: str) -> List[str]:
+        # The region is only required to instantiate the crhelper boto3 clients at import
+        # time
+        return [
+            f"cd {output_dir} && AWS_DEFAULT_REGION=us-east-1 python -m container_insights.metric_query_generator.template_registry"
+        ]
+
 
 class ContainerInsightsLogBasedDashboardStack(TempStack):
     """
@@ -55,7 +138,17 @@ class ContainerInsightsLogBasedDashboardStack(TempStack):
         )
 
         dashboard_configuration = self.node.try_get_context("dashboardConfiguration")
-        log_group_name = f"/aws/containerinsights/{dashboard_configuration['clusterName']}/performance"
+        log_group_name = get_log_group_name(dashboard_configuration)
+
+        lookup_polling_budget = self.node.try_get_context("lookupPollingBudgetSeconds")
+        max_concurrent_lookup_queries = self.node.try_get_context(
+            "maxConcurrentLookupQueries"
+        )
+        # The lookup cache must outlive the temporary stack, hence an existing bucket
+        lookup_cache_bucket = self.node.try_get_context("lookupCacheBucket")
+        # Metric queries exceeding the custom resource response limit are stored, and
+        # resolved by dashboard custom resources
+        query_references = self.node.try_get_context("queryReferences")
 
         # ======================================
         # Custom Resource
@@ -75,6 +168,33 @@ class ContainerInsightsLogBasedDashboardStack(TempStack):
             ),
             index="index.py",
             handler="handler",
+            bundling=(
+                BundlingOptions(command_hooks=PrecompileQueryTemplatesHooks())
+                if self.node.try_get_context("precompileQueryTemplates")
+                else None
+            ),
+            environment={
+                # Lookup queries completing within this budget are answered right
+                # away, the longer ones are left to the crhelper poll cycle
+                "LOOKUP_POLLING_BUDGET_SECONDS": str(
+                    30 if lookup_polling_budget is None else lookup_polling_budget
+                ),
+                # Lookup queries exceeding this cap, which accounts for all the Logs
+                # Insights queries running in the account, are queued
+                "LOGS_INSIGHTS_MAX_CONCURRENT_QUERIES": str(
+                    max_concurrent_lookup_queries or 20
+                ),
+                "LOOKUP_CACHE_URI": (
+                    f"s3://{lookup_cache_bucket}/{LOOKUP_CACHE_PREFIX}"
+                    if lookup_cache_bucket
+                    else ""
+                ),
+                "QUERY_STORE_URI": (
+                    f"ssm://{QUERY_STORE_PATH}{self.stack_name}/"
+                    if query_references
+                    else ""
+                ),
+            },
             initial_policy=[
                 # CR helper polling
                 PolicyStatement(
@@ -96,13 +216,48 @@ class ContainerInsightsLogBasedDashboardStack(TempStack):
                     ],
                 ),
                 PolicyStatement(
-                    actions=["logs:GetQueryResults"],
+                    actions=[
+                        "logs:GetQueryResults",
+                        "logs:DescribeQueries",
+                        "logs:StopQuery",
+                    ],
                     resources=[
                         f"arn:{self.partition}:logs:{self.region}:{self.account}:*",
                     ],
                 ),
             ],
         )
+        if lookup_cache_bucket:
+            log_insights_handler_function.add_to_role_policy(
+                PolicyStatement(
+                    actions=["s3:GetObject", "s3:PutObject"],
+                    resources=[
+                        f"arn:{self.partition}:s3:::{lookup_cache_bucket}/{LOOKUP_CACHE_PREFIX}*",
+                    ],
+                )
+            )
+        if query_references:
+            log_insights_handler_function.add_to_role_policy(
+                PolicyStatement(
+                    actions=[
+                        "ssm:PutParameter",
+                        "ssm:GetParametersByPath",
+                        "ssm:DeleteParameters",
+                    ],
+                    resources=[
+                        f"arn:{self.partition}:ssm:{self.region}:{self.account}:parameter{QUERY_STORE_PATH}{self.stack_name}",
+                        f"arn:{self.partition}:ssm:{self.region}:{self.account}:parameter{QUERY_STORE_PATH}{self.stack_name}/*",
+                    ],
+                )
+            )
+            log_insights_handler_function.add_to_role_policy(
+                PolicyStatement(
+                    actions=["cloudwatch:PutDashboard", "cloudwatch:DeleteDashboards"],
+                    resources=[
+                        f"arn:{self.partition}:cloudwatch::{self.account}:dashboard/{dashboard_configuration['name']}-*",
+                    ],
+                )
+            )
         NagSuppressions.add_resource_suppressions(
             log_insights_handler_function,
             suppressions=[
@@ -117,89 +272,653 @@ class ContainerInsightsLogBasedDashboardStack(TempStack):
         # ======================================
         # Dynamic dashboard generation
         # ======================================
-        for content in dashboard_configuration["contents"]:
-            content_configuration = dashboard_configuration["contents"][content]
-            if content_configuration["enabled"]:
-                content = content.capitalize()
-                for namespace in content_configuration.get("namespaces", [""]):
-                    metric_query = cdk.CustomResource(
-                        scope=self,
-                        id=f"{content}MetricQuery{namespace}",
-                        resource_type=f"Custom::ContainerInsights-{content}MetricQuery",
-                        service_token=log_insights_handler_function.function_arn,
-                        properties={
-                            "iNamespace": namespace,
-                            "iLogGroupName": log_group_name,
-                            "iStartTime": dashboard_configuration[
-                                "investigationWindow"
-                            ]["from"],
-                            "iEndTime": dashboard_configuration["investigationWindow"][
-                                "to"
-                            ],
-                        },
-                    )
-                    dashboard = Dashboard(
+        common_metric_query_properties, contents = get_metric_query_properties(
+            dashboard_configuration
+        )
+
+        # Contents plotting all their series share a single discovery lookup query, the
+        # top K lookup queries being specific to their ranking metric, and the workload
+        # label lookup queries to their label. Rollups need no lookup query at all.
+        # Every content still answers its metric queries through its own custom resource,
+        # keeping each response within the 4 KB custom resource response limit
+        discovered_contents = [
+            content
+            for content, (_, metric_query_properties) in contents.items()
+            if content not in ROLLUP_CONTENTS
+            and "iTopK" not in metric_query_properties
+            and "iWorkloadLabel" not in metric_query_properties
+        ]
+        # A single discovered content keeps its own metric query custom resource
+        if len(discovered_contents) < 2:
+            discovered_contents = []
+
+        # Contents sharing a same lookup query
+        metric_query_groups: Dict[str, List[str]] = {}
+        for content in contents:
+            metric_query_groups.setdefault(
+                DISCOVERY_GROUP if content in discovered_contents else content, []
+            ).append(content)
+
+        dashboard_start = datetime.strptime(
+            dashboard_configuration["investigationWindow"]["from"],
+            "%Y-%m-%dT%H:%M:%S",
+        ).strftime("%Y-%m-%dT%H:%M:%SZ")
+        dashboard_end = datetime.strptime(
+            dashboard_configuration["investigationWindow"]["to"],
+            "%Y-%m-%dT%H:%M:%S",
+        ).strftime("%Y-%m-%dT%H:%M:%SZ")
+        # Every widget of a dashboard runs its query whenever the dashboard is loaded,
+        # larger dashboards are split into pages linked together and from an index
+        widgets_per_page = get_widgets_per_page(dashboard_configuration)
+        dashboard_pages: List[Tuple[str, List[str]]] = []
+
+        # Large investigations are split into nested stacks, each of them holding a chunk
+        # of the dashboards of a metric query group along with the metric query custom
+        # resources restricted to the namespace selectors of the chunk, so that the
+        # generic queries never cross a stack boundary. Nested stacks only depend on the
+        # Lambda function, hence deploy in parallel, and are deleted along with this stack
+        # when its time to live expires
+        dashboard_count = sum(
+            _count_dashboards(*contents[content], widgets_per_page)
+            for content in contents
+        )
+        metric_query_count = sum(
+            math.ceil(
+                len(metric_query_properties.get("iNamespaces", None) or [""])
+                / _get_namespaces_per_metric_query(
+                    content, metric_query_properties, query_references
+                )
+            )
+            for content, (_, metric_query_properties) in contents.items()
+        )
+        nested_stacks = self.node.try_get_context("nestedStacks")
+        if nested_stacks is None:
+            nested_stacks = (
+                metric_query_count + dashboard_count > NESTED_STACKS_RESOURCE_THRESHOLD
+            )
+        dashboard_outputs = dashboard_count <= MAX_DASHBOARD_OUTPUTS
+        # Labels are derived from all the namespace selectors of a content, whatever the
+        # chunk they end up in, so that dashboard names remain unique
+        namespace_labels = {
+            content: _get_namespace_labels(
+                metric_query_properties.get("iNamespaces", None) or [""]
+            )
+            for content, (_, metric_query_properties) in contents.items()
+        }
+
+        for group, group_contents in metric_query_groups.items():
+            chunks = _get_dashboard_chunks(
+                {content: contents[content] for content in group_contents},
+                widgets_per_page,
+                nested_stacks,
+                query_references,
+            )
+            for chunk_index, chunk in enumerate(chunks, start=1):
+                scope = self
+                if nested_stacks:
+                    scope = cdk.NestedStack(
                         scope=self,
-                        id=f"{content}Dashboard{namespace}",
-                        dashboard_name="-".join(
-                            filter(
-                                None,
-                                [
-                                    dashboard_configuration["name"],
-                                    f"{content}Metrics",
-                                    namespace,
-                                ],
-                            )
+                        id=(
+                            f"{group}Dashboards"
+                            if len(chunks) == 1
+                            else f"{group}Dashboards{chunk_index}"
                         ),
-                        start=datetime.strptime(
-                            dashboard_configuration["investigationWindow"]["from"],
-                            "%Y-%m-%dT%H:%M:%S",
-                        ).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                        end=datetime.strptime(
-                            dashboard_configuration["investigationWindow"]["to"],
-                            "%Y-%m-%dT%H:%M:%S",
-                        ).strftime("%Y-%m-%dT%H:%M:%SZ"),
                     )
-
-                    widgets: List[LogQueryWidget] = []
-                    for metric in content_configuration["metrics"]:
-                        formatted_widget_query = cdk.CustomResource(
-                            scope=self,
-                            id=f"{content}{namespace}{metric}",
-                            resource_type="Custom::ContainerInsights-MetricQueryFormatter",
+                # The namespace selectors of a content are split across several custom
+                # resources, each of them answering the metric queries of its own
+                # selectors within the response budget, or storing them within the
+                # namespace selectors cap. The first custom resource of a lookup group
+                # runs the lookup query of every content and selector of the group
+                # ("iSharedLookup"), the other ones reading its results back
+                # ("iLookupQueryId")
+                lookup_groups = _get_lookup_groups(
+                    [
+                        (content, batch)
+                        for content, namespace_indexes in chunk.items()
+                        for batch in _get_batches(
+                            namespace_indexes,
+                            _get_namespaces_per_metric_query(
+                                content, contents[content][1], query_references
+                            ),
+                        )
+                    ]
+                )
+                batch_indexes: Dict[str, int] = {}
+                for lookup_group in lookup_groups:
+                    lookup_namespace_indexes: Dict[str, List[int]] = {}
+                    for content, namespace_indexes in lookup_group:
+                        lookup_namespace_indexes.setdefault(content, []).extend(
+                            namespace_indexes
+                        )
+                    shared_lookup_metric_query: Optional[cdk.CustomResource] = None
+                    for content, namespace_indexes in lookup_group:
+                        batch_index = batch_indexes[content] = (
+                            batch_indexes.get(content, 0) + 1
+                        )
+                        batch_properties = _get_chunk_metric_query_properties(
+                            contents[content][1], namespace_indexes
+                        )
+                        if group == DISCOVERY_GROUP:
+                            resource_type = "DiscoveryMetricQuery"
+                            properties = {f"i{content}": batch_properties}
+                            lookup_properties = {
+                                f"i{lookup_content}": _get_chunk_metric_query_properties(
+                                    contents[lookup_content][1], lookup_indexes
+                                )
+                                for lookup_content, lookup_indexes in lookup_namespace_indexes.items()
+                            }
+                        else:
+                            resource_type = f"{content}MetricQuery"
+                            properties = batch_properties
+                            lookup_properties = _get_chunk_metric_query_properties(
+                                contents[content][1], lookup_namespace_indexes[content]
+                            )
+                        shared_lookup = len(lookup_group) > 1
+                        if shared_lookup and shared_lookup_metric_query is None:
+                            properties = {
+                                **properties,
+                                "iSharedLookup": {
+                                    name: value
+                                    for name, value in lookup_properties.items()
+                                    if properties.get(name, None) != value
+                                },
+                            }
+                        elif shared_lookup:
+                            properties = {
+                                **properties,
+                                "iLookupQueryId": shared_lookup_metric_query.get_att_string(
+                                    "oLookupQueryId"
+                                ),
+                                "iLookupStartTime": shared_lookup_metric_query.get_att_string(
+                                    "oLookupStartTime"
+                                ),
+                            }
+                        metric_query = cdk.CustomResource(
+                            scope=scope,
+                            id=(
+                                f"{content}MetricQuery"
+                                if batch_index == 1
+                                else f"{content}MetricQuery{batch_index}"
+                            ),
+                            resource_type=f"Custom::ContainerInsights-{resource_type}",
                             service_token=log_insights_handler_function.function_arn,
                             properties={
-                                "iQuery": metric_query.get_att_string("oQuery"),
-                                "iMetric": metric,
+                                **common_metric_query_properties,
+                                **properties,
                             },
                         )
+                        if shared_lookup_metric_query is None:
+                            shared_lookup_metric_query = metric_query
 
-                        widgets.append(
-                            LogQueryWidget(
-                                title=metric,
-                                log_group_names=[log_group_name],
-                                view=LogQueryVisualizationType.LINE,
-                                query_string=formatted_widget_query.get_att_string(
-                                    "oFormattedQuery"
+                        dashboard_pages.extend(
+                            self._add_content_dashboards(
+                                scope=scope,
+                                content=content,
+                                content_configuration=contents[content][0],
+                                metric_query_properties=batch_properties,
+                                namespace_labels=[
+                                    namespace_labels[content][index]
+                                    for index in namespace_indexes
+                                ],
+                                metric_query=metric_query,
+                                query_attribute_prefix=(
+                                    f"o{content}Query"
+                                    if group == DISCOVERY_GROUP
+                                    else "oQuery"
                                 ),
-                                # In a 24-column grid, this means 3 widgets per row
-                                width=8,
-                                height=8,
+                                log_group_name=log_group_name,
+                                dashboard_configuration=dashboard_configuration,
+                                dashboard_start=dashboard_start,
+                                dashboard_end=dashboard_end,
+                                widgets_per_page=widgets_per_page,
+                                dashboard_service_token=(
+                                    log_insights_handler_function.function_arn
+                                    if query_references
+                                    else None
+                                ),
+                                dashboard_outputs=dashboard_outputs,
                             )
                         )
 
-                    dashboard.add_widgets(*widgets)
-
-                    cdk.CfnOutput(
-                        scope=self,
-                        id=":".join(
-                            filter(
-                                None,
-                                [
-                                    f"{content}Metrics",
-                                    namespace,
-                                ],
+        if not dashboard_outputs or any(
+            len(page_names) > 1 for _, page_names in dashboard_pages
+        ):
+            index_dashboard = Dashboard(
+                scope=self,
+                id="IndexDashboard",
+                dashboard_name=_get_index_dashboard_name(
+                    dashboard_configuration["name"]
+                ),
+                start=dashboard_start,
+                end=dashboard_end,
+            )
+            index_dashboard.add_widgets(
+                TextWidget(
+                    markdown="\n".join(
+                        [f"# {dashboard_configuration['name']}"]
+                        + [
+                            "- {}: {}".format(
+                                dashboard_name,
+                                " | ".join(
+                                    f"[page {page}]({self._get_dashboard_url(page_name)})"
+                                    for page, page_name in enumerate(
+                                        page_names, start=1
+                                    )
+                                ),
                             )
+                            for dashboard_name, page_names in dashboard_pages
+                        ]
+                    ),
+                    width=24,
+                    height=max(2, len(dashboard_pages) + 1),
+                )
+            )
+            cdk.CfnOutput(
+                scope=self,
+                id="Index",
+                value=self._get_dashboard_url(index_dashboard.dashboard_name),
+            )
+
+    def _add_content_dashboards(
+        self,
+        scope: Construct,
+        content: str,
+        content_configuration: Dict[str, Any],
+        metric_query_properties: Dict[str, Any],
+        namespace_labels: List[str],
+        metric_query: cdk.CustomResource,
+        query_attribute_prefix: str,
+        log_group_name: str,
+        dashboard_configuration: Dict[str, Any],
+        dashboard_start: str,
+        dashboard_end: str,
+        widgets_per_page: int,
+        dashboard_service_token: Optional[str] = None,
+        dashboard_outputs: bool = True,
+    ) -> List[Tuple[str, List[str]]]:
+        """
+        Dashboards of a content, one per namespace selector and split into pages, the
+        outputs, if any, being added to this stack whatever the scope of the dashboards.
+        Given a service token, dashboards are custom resources resolving the query handles
+        of their widgets into the stored metric queries. Returns the dashboard names along
+        with their page names.
+        """
+
+        namespace_selectors = metric_query_properties.get("iNamespaces", None)
+        shard_count = int(metric_query_properties.get("iShardCount", 1))
+        content_dashboard_pages: List[Tuple[str, List[str]]] = []
+
+        for index, namespace in enumerate(namespace_labels, start=1):
+            query_attribute = (
+                query_attribute_prefix
+                if namespace_selectors is None
+                else f"{query_attribute_prefix}Namespace{index}"
+            )
+
+            shard_attributes = [
+                (
+                    query_attribute
+                    if shard_count == 1
+                    else f"{query_attribute}Shard{shard}"
+                )
+                for shard in range(1, shard_count + 1)
+            ]
+            if dashboard_service_token is None:
+                # Generic queries are split on their metric placeholders once, and
+                # joined back with each metric name, see _format_metric_query
+                generic_query_parts = [
+                    cdk.Fn.split(
+                        METRIC_PLACEHOLDER, metric_query.get_att_string(shard_attribute)
+                    )
+                    for shard_attribute in shard_attributes
+                ]
+
+            widgets: List[LogQueryWidget] = []
+            for metric in content_configuration["metrics"]:
+                for shard, shard_attribute in enumerate(shard_attributes, start=1):
+                    widgets.append(
+                        LogQueryWidget(
+                            title=(
+                                metric
+                                if shard_count == 1
+                                else f"{metric} ({shard}/{shard_count})"
+                            ),
+                            log_group_names=[log_group_name],
+                            view=LogQueryVisualizationType.LINE,
+                            query_string=(
+                                _format_metric_query(
+                                    generic_query_parts[shard - 1], metric
+                                )
+                                if dashboard_service_token is None
+                                else _get_query_handle(
+                                    metric_query, shard_attribute, metric
+                                )
+                            ),
+                            # In a 24-column grid, this means 3 widgets per row
+                            width=8,
+                            height=8,
+                        )
+                    )
+
+            dashboard_name = "-".join(
+                filter(
+                    None,
+                    [
+                        dashboard_configuration["name"],
+                        f"{content}Metrics",
+                        namespace,
+                    ],
+                )
+            )
+            pages = get_pages(widgets, widgets_per_page)
+            page_names = [
+                dashboard_name if page == 1 else f"{dashboard_name}-Page{page}"
+                for page in range(1, len(pages) + 1)
+            ]
+            content_dashboard_pages.append((dashboard_name, page_names))
+
+            for page, page_widgets in enumerate(pages, start=1):
+                rows: List[IWidget] = [Row(*page_widgets)]
+                if len(pages) > 1:
+                    rows.insert(
+                        0,
+                        TextWidget(
+                            markdown=self._get_page_navigation(
+                                dashboard_configuration["name"], page_names, page
+                            ),
+                            width=24,
+                            height=1,
                         ),
-                        value=f"https://{cdk.Stack.of(self).region}.console.aws.amazon.com/cloudwatch/home?region={cdk.Stack.of(self).region}#dashboards:name={dashboard.dashboard_name}",
                     )
+                dashboard_id = (
+                    f"{content}Dashboard{namespace}"
+                    if page == 1
+                    else f"{content}Dashboard{namespace}Page{page}"
+                )
+                if dashboard_service_token is None:
+                    dashboard = Dashboard(
+                        scope=scope,
+                        id=dashboard_id,
+                        dashboard_name=page_names[page - 1],
+                        start=dashboard_start,
+                        end=dashboard_end,
+                    )
+                    for row in rows:
+                        dashboard.add_widgets(row)
+                else:
+                    cdk.CustomResource(
+                        scope=scope,
+                        id=dashboard_id,
+                        resource_type="Custom::ContainerInsights-Dashboard",
+                        service_token=dashboard_service_token,
+                        properties={
+                            "iDashboardName": page_names[page - 1],
+                            "iDashboardBody": _get_dashboard_body(
+                                scope, rows, dashboard_start, dashboard_end
+                            ),
+                        },
+                    )
+
+                if not dashboard_outputs:
+                    continue
+                # The URL embeds the dashboard name itself rather than a reference to
+                # the dashboard, which would add an output to its nested stack
+                cdk.CfnOutput(
+                    scope=self,
+                    id=":".join(
+                        filter(
+                            None,
+                            [
+                                f"{content}Metrics",
+                                namespace,
+                                f"Page{page}" if page > 1 else None,
+                            ],
+                        )
+                    ),
+                    value=self._get_dashboard_url(page_names[page - 1]),
+                )
+
+        return content_dashboard_pages
+
+    def _get_dashboard_url(self, dashboard_name: str) -> str:
+        """CloudWatch console URL of a dashboard of the stack region"""
+
+        region = cdk.Stack.of(self).region
+        return f"https://{region}.console.aws.amazon.com/cloudwatch/home?region={region}#dashboards:name={dashboard_name}"
+
+    def _get_page_navigation(self, name: str, page_names: List[str], page: int) -> str:
+        """Markdown links to the previous and next pages of a dashboard, and the index"""
+
+        links = [f"Page {page}/{len(page_names)}"]
+        if page > 1:
+            links.append(f"[Previous]({self._get_dashboard_url(page_names[page - 2])})")
+        if page < len(page_names):
+            links.append(f"[Next]({self._get_dashboard_url(page_names[page])})")
+        links.append(
+            f"[Index]({self._get_dashboard_url(_get_index_dashboard_name(name))})"
+        )
+        return " | ".join(links)
+
+
+def _format_metric_query(query_parts: List[str], metric: str) -> str:
+    """
+    Format a generic metric query with a specific metric name at deployment time, the
+    query parts, as split on its metric placeholders, being joined with the metric name.
+    Unlike formatter custom resources, the intrinsic functions add no construct, and no
+    Lambda invocation, per dashboard.
+    """
+
+    return cdk.Fn.join(metric, query_parts)
+
+
+def _get_query_handle(
+    metric_query: cdk.CustomResource, query_attribute: str, metric: str
+) -> str:
+    """
+    Handle of a stored generic metric query formatted with a specific metric name,
+    "{{query:<key>:<metric>}}", the key being the key prefix the metric query custom
+    resource stored its metric queries under, followed by the query attribute name
+    """
+
+    return cdk.Fn.join(
+        "",
+        [
+            "{{query:",
+            metric_query.get_att_string(QUERY_KEY_PREFIX_ATTRIBUTE),
+            f"{query_attribute}:{metric}}}}}",
+        ],
+    )
+
+
+def _count_widgets(
+    content_configuration: Dict[str, Any], metric_query_properties: Dict[str, Any]
+) -> int:
+    """Number of widgets of the dashboard of a namespace selector of a content"""
+
+    return len(content_configuration["metrics"]) * int(
+        metric_query_properties.get("iShardCount", 1)
+    )
+
+
+def _count_dashboards(
+    content_configuration: Dict[str, Any],
+    metric_query_properties: Dict[str, Any],
+    widgets_per_page: int,
+) -> int:
+    """Number of dashboards, pages included, a content is plotted on"""
+
+    widget_count = _count_widgets(content_configuration, metric_query_properties)
+    return len(metric_query_properties.get("iNamespaces", None) or [""]) * len(
+        get_pages([None] * widget_count, widgets_per_page)
+    )
+
+
+def _get_dashboard_chunks(
+    contents: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]],
+    widgets_per_page: int,
+    chunked: bool,
+    query_references: bool = False,
+) -> List[Dict[str, List[int]]]:
+    """
+    The dashboards of a metric query group, split into chunks of the namespace selectors,
+    given by their index, of every content. When chunked, every chunk stays within
+    NESTED_STACK_RESOURCE_BUDGET dashboards and metric query custom resources, and
+    NESTED_STACK_WIDGET_BUDGET widgets, the dashboard pages of a namespace selector being
+    kept together. A single chunk holds every dashboard otherwise.
+    """
+
+    chunks: List[Dict[str, List[int]]] = [dict()]
+    dashboard_count = widget_count = 0
+    for content, (content_configuration, metric_query_properties) in contents.items():
+        namespace_widget_count = _count_widgets(
+            content_configuration, metric_query_properties
+        )
+        namespace_dashboard_count = len(
+            get_pages([None] * namespace_widget_count, widgets_per_page)
+        )
+        for index in range(
+            len(metric_query_properties.get("iNamespaces", None) or [""])
+        ):
+            if chunked and chunks[-1]:
+                chunk_namespace_counts = {
+                    chunk_content: len(namespace_indexes)
+                    for chunk_content, namespace_indexes in chunks[-1].items()
+                }
+                chunk_namespace_counts[content] = (
+                    chunk_namespace_counts.get(content, 0) + 1
+                )
+                metric_query_count = sum(
+                    math.ceil(
+                        namespace_count
+                        / _get_namespaces_per_metric_query(
+                            chunk_content, contents[chunk_content][1], query_references
+                        )
+                    )
+                    for chunk_content, namespace_count in chunk_namespace_counts.items()
+                )
+                if (
+                    dashboard_count + namespace_dashboard_count + metric_query_count
+                    > NESTED_STACK_RESOURCE_BUDGET
+                    or widget_count + namespace_widget_count
+                    > NESTED_STACK_WIDGET_BUDGET
+                ):
+                    chunks.append(dict())
+                    dashboard_count = widget_count = 0
+            chunks[-1].setdefault(content, []).append(index)
+            dashboard_count += namespace_dashboard_count
+            widget_count += namespace_widget_count
+
+    return chunks
+
+
+def _get_namespaces_per_metric_query(
+    content: str, metric_query_properties: Dict[str, Any], query_references: bool
+) -> int:
+    """
+    Number of namespace selectors of a content whose metric queries a custom resource
+    answers, given their estimated size, at least one. With query references, a custom
+    resource answers a single key prefix whatever its number of namespace selectors, up to
+    MAX_LOOKUP_NAMESPACE_SELECTORS.
+    """
+
+    namespace_count = len(metric_query_properties.get("iNamespaces", None) or [""])
+    if query_references:
+        return min(namespace_count, MAX_LOOKUP_NAMESPACE_SELECTORS)
+
+    namespace_size = METRIC_QUERY_SIZE_ESTIMATES.get(
+        content, DEFAULT_METRIC_QUERY_SIZE_ESTIMATE
+    ) * int(metric_query_properties.get("iShardCount", 1))
+    return min(namespace_count, max(1, MAX_RESPONSE_DATA_SIZE // namespace_size))
+
+
+def _get_lookup_groups(
+    metric_queries: List[Tuple[str, List[int]]],
+) -> List[List[Tuple[str, List[int]]]]:
+    """
+    The metric query custom resources of a chunk, given by their content and namespace
+    selector indexes, grouped by shared lookup query, every lookup query covering up to
+    MAX_LOOKUP_NAMESPACE_SELECTORS namespace selectors, all contents included.
+    """
+
+    lookup_groups: List[List[Tuple[str, List[int]]]] = [[]]
+    namespace_count = 0
+    for content, namespace_indexes in metric_queries:
+        if (
+            lookup_groups[-1]
+            and namespace_count + len(namespace_indexes)
+            > MAX_LOOKUP_NAMESPACE_SELECTORS
+        ):
+            lookup_groups.append([])
+            namespace_count = 0
+        lookup_groups[-1].append((content, namespace_indexes))
+        namespace_count += len(namespace_indexes)
+
+    return lookup_groups
+
+
+def _get_batches(indexes: List[int], batch_size: int) -> List[List[int]]:
+    return [
+        indexes[start : start + batch_size]
+        for start in range(0, len(indexes), batch_size)
+    ]
+
+
+def _get_chunk_metric_query_properties(
+    metric_query_properties: Dict[str, Any], namespace_indexes: List[int]
+) -> Dict[str, Any]:
+    """The lookup resource properties of a content, restricted to a chunk of its namespace selectors"""
+
+    if "iNamespaces" not in metric_query_properties:
+        return metric_query_properties
+    return {
+        **metric_query_properties,
+        "iNamespaces": [
+            metric_query_properties["iNamespaces"][index] for index in namespace_indexes
+        ],
+    }
+
+
+def _get_dashboard_body(
+    scope: Construct, rows: List[IWidget], start: str, end: str
+) -> str:
+    """Dashboard body of the given widget rows, laid out as the Dashboard construct does"""
+
+    column = Column(*rows)
+    column.position(0, 0)
+    return cdk.Stack.of(scope).to_json_string(
+        {"start": start, "end": end, "widgets": column.to_json()}
+    )
+
+
+def _get_index_dashboard_name(name: str) -> str:
+    return f"{name}-Index"
+
+
+def _get_namespace_label(namespace_selector: str) -> str:
+    """
+    Wildcard and regex namespace selectors (eg. "team-*", "/^team-(a|b)$/") are turned into
+    labels only made of the characters allowed in dashboard names and construct IDs.
+    """
+
+    return re.sub(r"[^0-9A-Za-z-]+", "_", namespace_selector).strip("_")
+
+
+def _get_namespace_labels(namespace_selectors: List[str]) -> List[str]:
+    """
+    Labels of the namespace selectors of a content, suffixed with a short digest of their
+    selector when several selectors share a same label (eg. "team-*" and "team-?"), so
+    that dashboard names and construct IDs remain unique.
+    """
+
+    labels = [_get_namespace_label(selector) for selector in namespace_selectors]
+    label_counts = Counter(labels)
+    return [
+        (
+            label
+            if label_counts[label] == 1
+            else "-".join(
+                filter(None, [label, sha1(selector.encode("utf-8")).hexdigest()[:8]])
+            )
+        )
+        for label, selector in zip(labels, namespace_selectors)
+    ]
@@ -0,0 +1,371 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Loading and validation of the "dashboard_configuration.yaml" file, and derivation of the
+lookup resource properties of every enabled content and of the dashboard pages, shared by
+the CDK app and the query planner.
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import yaml
+from cerberus import Validator
+
+DASHBOARD_CONFIGURATION_FILENAME = "dashboard_configuration.yaml"
+
+# Contents plotting the cluster level record types, along with the configuration key of
+# their series selectors if any. Their series are known upfront, without lookup query
+ROLLUP_CONTENTS = {"Cluster": None, "Namespace": "namespaces", "Service": "services"}
+
+# Every widget of a dashboard runs its query whenever the dashboard is loaded, and
+# CloudWatch caps dashboards at 500 widgets
+DEFAULT_WIDGETS_PER_PAGE = 30
+MAX_WIDGETS_PER_PAGE = 500
+
+
+def _coerce_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+
+
+DASHBOARD_CONFIGURATION_SCHEMA = {
+    "name": {"type": "string", "regex": "[A-Za-z0-9-_]+"},
+    "clusterName": {"type": "string", "regex": r"^[0-9A-Za-z][A-Za-z0-9\-_]+$"},
+    "timeToLiveInMinutes": {"min": 1, "max": 43800},
+    "widgetsPerPage": {"type": "integer", "min": 2, "max": MAX_WIDGETS_PER_PAGE},
+    "investigationWindow": {
+        "type": "dict",
+        "schema": {
+            "from": {
+                "type": "datetime",
+                "coerce": _coerce_date,
+            },
+            "to": {
+                "type": "datetime",
+                "coerce": _coerce_date,
+            },
+            "slices": {"type": "integer", "min": 1},
+        },
+    },
+    "contents": {
+        "type": "dict",
+        "schema": {
+            "node": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "shards": {"type": "integer", "min": 1},
+                    "targetLogStreams": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^node_.*",
+                        },
+                    },
+                    "topK": {
+                        "type": "dict",
+                        "schema": {
+                            "limit": {
+                                "type": "integer",
+                                "min": 1,
+                                "required": True,
+                            },
+                            "metric": {
+                                "type": "string",
+                                "regex": "^node_.*",
+                                "required": True,
+                            },
+                            "statistic": {
+                                "type": "string",
+                                "regex": "^(max|avg|p[0-9]{1,2})$",
+                            },
+                        },
+                    },
+                },
+            },
+            "pod": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "shards": {"type": "integer", "min": 1},
+                    "targetLogStreams": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "namespaces": {"type": "list"},
+                    "groupBy": {
+                        "type": "string",
+                        "allowed": ["pod", "workload"],
+                    },
+                    "workloadLabel": {
+                        "type": "string",
+                        "dependencies": {"groupBy": ["workload"]},
+                    },
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^pod_.*",
+                        },
+                    },
+                    "topK": {
+                        "type": "dict",
+                        "schema": {
+                            "limit": {
+                                "type": "integer",
+                                "min": 1,
+                                "required": True,
+                            },
+                            "metric": {
+                                "type": "string",
+                                "regex": "^pod_.*",
+                                "required": True,
+                            },
+                            "statistic": {
+                                "type": "string",
+                                "regex": "^(max|avg|p[0-9]{1,2})$",
+                            },
+                        },
+                    },
+                },
+            },
+            "container": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "shards": {"type": "integer", "min": 1},
+                    "targetLogStreams": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "namespaces": {"type": "list"},
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^(container_|number_of_container_restarts).*",
+                        },
+                    },
+                    "topK": {
+                        "type": "dict",
+                        "schema": {
+                            "limit": {
+                                "type": "integer",
+                                "min": 1,
+                                "required": True,
+                            },
+                            "metric": {
+                                "type": "string",
+                                "regex": "^(container_|number_of_container_restarts).*",
+                                "required": True,
+                            },
+                            "statistic": {
+                                "type": "string",
+                                "regex": "^(max|avg|p[0-9]{1,2})$",
+                            },
+                        },
+                    },
+                },
+            },
+            "cluster": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^cluster_.*",
+                        },
+                    },
+                },
+            },
+            "namespace": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "namespaces": {"type": "list", "required": True, "minlength": 1},
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^namespace_.*",
+                        },
+                    },
+                },
+            },
+            "service": {
+                "type": "dict",
+                "schema": {
+                    "enabled": {"type": "boolean"},
+                    "period": {"type": "string", "regex": "^[1-9][0-9]*(s|m|h|d)$"},
+                    "services": {"type": "list", "required": True, "minlength": 1},
+                    "metrics": {
+                        "type": "list",
+                        "schema": {
+                            "type": "string",
+                            "regex": "^service_.*",
+                        },
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def load_dashboard_configuration(
+    filename: str = DASHBOARD_CONFIGURATION_FILENAME,
+) -> Dict[str, Any]:
+    """
+    Validate the "dashboard_configuration.yaml" schema
+    """
+
+    with open(filename, "r", encoding="utf8") as dashboard_conf_yaml:
+        dashboard_conf = yaml.safe_load(dashboard_conf_yaml)
+        validator = Validator(DASHBOARD_CONFIGURATION_SCHEMA)
+        if not validator.validate(dashboard_conf):
+            raise Exception(
+                f'Dashboards configuration file "{filename}" is invalid: {validator.errors}'
+            )
+
+    return dashboard_conf
+
+
+def get_log_group_name(dashboard_configuration: Dict[str, Any]) -> str:
+    """Container Insights performance log group of the configured cluster"""
+    return (
+        f"/aws/containerinsights/{dashboard_configuration['clusterName']}/performance"
+    )
+
+
+def get_metric_query_properties(
+    dashboard_configuration: Dict[str, Any],
+) -> Tuple[Dict[str, Any], Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]]]:
+    """
+    The lookup resource properties common to every content, and the configuration and
+    content specific lookup resource properties of every enabled content, keyed by
+    capitalized content name (eg. "Pod"). Rollup contents ("ROLLUP_CONTENTS") get
+    their series selectors as "iSeries" instead.
+    """
+
+    common_metric_query_properties = {
+        "iLogGroupName": get_log_group_name(dashboard_configuration),
+        "iStartTime": dashboard_configuration["investigationWindow"]["from"],
+        "iEndTime": dashboard_configuration["investigationWindow"]["to"],
+    }
+    # Long investigation windows are scanned by concurrent time sliced lookup queries
+    if (
+        time_slices := dashboard_configuration["investigationWindow"].get("slices", 1)
+    ) > 1:
+        common_metric_query_properties["iTimeSlices"] = time_slices
+    contents = dict()
+    for content in dashboard_configuration["contents"]:
+        content_configuration = dashboard_configuration["contents"][content]
+        if not content_configuration["enabled"]:
+            continue
+
+        if content.capitalize() in ROLLUP_CONTENTS:
+            # Rollups need no lookup query, their series are the configured selectors
+            metric_query_properties = dict()
+            if series_key := ROLLUP_CONTENTS[content.capitalize()]:
+                metric_query_properties["iSeries"] = content_configuration[series_key]
+            if period := content_configuration.get("period", None):
+                metric_query_properties["iPeriod"] = period
+            contents[content.capitalize()] = (
+                content_configuration,
+                metric_query_properties,
+            )
+            continue
+
+        namespace_selectors = content_configuration.get("namespaces", None)
+        if namespace_selectors == []:
+            continue
+
+        # A single lookup query serves every namespace selector of a given content
+        metric_query_properties = dict()
+        if namespace_selectors is None:
+            metric_query_properties["iNamespace"] = ""
+        else:
+            metric_query_properties["iNamespaces"] = namespace_selectors
+        if top_k := content_configuration.get("topK", None):
+            # Only the K heaviest series, ranked by a given metric statistic over the
+            # investigation window, are plotted
+            metric_query_properties.update(
+                {
+                    "iTopK": top_k["limit"],
+                    "iTopKMetric": top_k["metric"],
+                    "iTopKStatistic": top_k.get("statistic", "max"),
+                }
+            )
+        if content_configuration.get("groupBy", "pod") == "workload":
+            # The pods of a same workload are aggregated into a single series
+            metric_query_properties["iGroupBy"] = "workload"
+            if workload_label := content_configuration.get("workloadLabel", None):
+                metric_query_properties["iWorkloadLabel"] = workload_label
+        if period := content_configuration.get("period", None):
+            # Overrides the bin period derived from the investigation window length
+            metric_query_properties["iPeriod"] = period
+        if content_configuration.get("targetLogStreams", False):
+            # The metric queries only scan the log streams, named after the nodes, of
+            # the series they plot
+            metric_query_properties["iTargetLogStreams"] = "true"
+        # Large series sets are split across several shard queries, each of them
+        # rendered in its own widget
+        shard_count = content_configuration.get("shards", 1)
+        if shard_count > 1:
+            metric_query_properties["iShardCount"] = shard_count
+        # Every metric query must fit the Logs Insights query length budget once
+        # formatted with the longest metric name
+        metric_query_properties["iMaxMetricNameLength"] = max(
+            (len(metric) for metric in content_configuration["metrics"]),
+            default=0,
+        )
+        contents[content.capitalize()] = (
+            content_configuration,
+            metric_query_properties,
+        )
+
+    return common_metric_query_properties, contents
+
+
+def get_widgets_per_page(dashboard_configuration: Dict[str, Any]) -> int:
+    """Widgets budget of a dashboard page"""
+    return dashboard_configuration.get("widgetsPerPage", DEFAULT_WIDGETS_PER_PAGE)
+
+
+def get_pages(widgets: List[Any], widgets_per_page: int) -> List[List[Any]]:
+    """
+    Split the widgets of a dashboard evenly into as few pages as the widgets budget
+    allows, a paged dashboard keeping room on every page for the navigation between the
+    pages.
+    """
+
+    if len(widgets) <= widgets_per_page:
+        return [widgets]
+
+    page_count = math.ceil(len(widgets) / (widgets_per_page - 1))
+    page_size, remainder = divmod(len(widgets), page_count)
+    pages = []
+    start = 0
+    for page in range(page_count):
+        end = start + page_size + (1 if page < remainder else 0)
+        pages.append(widgets[start:end])
+        start = end
+    return pages
@@ -0,0 +1,396 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Dry-run query planner: runs the lookup queries of the "dashboard_configuration.yaml"
+file, without deploying anything, and projects the Logs Insights scan volume and query
+length of every dashboard widget.
+
+Logs Insights bills the data scanned by a query, which only depends on the log group and
+time window, not on the query filters: every widget query of a dashboard scans about as
+much data as the lookup query of its content, and every dashboard view or refresh runs
+all of its widget queries again.
+
+    python planner.py --max-gb-per-refresh 50 --strict
+"""
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+
+from container_insights.metric_query_generator import (
+    DEFAULT_MAX_QUERY_LENGTH,
+    MetricQueryGenerator,
+    get_formatted_query_length,
+    get_time_slices,
+    helper,
+    merge_lookup_responses,
+)
+from container_insights.metric_query_generator.container import (
+    ContainerMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.node import NodeMetricQueryGenerator
+from container_insights.metric_query_generator.pod import PodMetricQueryGenerator
+from container_insights.metric_query_generator.rollup import (
+    ClusterMetricQueryGenerator,
+    NamespaceMetricQueryGenerator,
+    ServiceMetricQueryGenerator,
+)
+from container_insights.metric_query_generator.query_scheduler import (
+    QueryScheduler,
+    get_logs_client,
+)
+
+from cdk.dashboard_configuration import (
+    DASHBOARD_CONFIGURATION_FILENAME,
+    DEFAULT_WIDGETS_PER_PAGE,
+    ROLLUP_CONTENTS,
+    get_metric_query_properties,
+    get_pages,
+    get_widgets_per_page,
+    load_dashboard_configuration,
+)
+
+GENERATORS = {
+    "Node": NodeMetricQueryGenerator,
+    "Pod": PodMetricQueryGenerator,
+    "Container": ContainerMetricQueryGenerator,
+    "Cluster": ClusterMetricQueryGenerator,
+    "Namespace": NamespaceMetricQueryGenerator,
+    "Service": ServiceMetricQueryGenerator,
+}
+
+# Cheapest query scanning the whole investigation window, measuring the scan volume of
+# the rollup widgets when no lookup query did
+SCAN_PROBE_QUERY = "stats count()"
+
+# Logs Insights price per GB of data scanned, as of writing in us-east-1
+DEFAULT_PRICE_PER_GB = 0.005
+
+GB = 1024**3
+
+
+@dataclass
+class DashboardPlan:
+    """Projected Logs Insights usage of a dashboard"""
+
+    name: str
+    widget_count: int
+    max_query_length: int
+    lookup_bytes_scanned: float
+    lookup_records_scanned: float
+
+    @property
+    def bytes_per_widget(self) -> float:
+        """Every widget query scans the whole log group over the investigation window"""
+        return self.lookup_bytes_scanned
+
+    @property
+    def bytes_per_refresh(self) -> float:
+        return self.bytes_per_widget * self.widget_count
+
+
+def run_lookup_query(
+    logs_client,
+    generator: MetricQueryGenerator,
+    event,
+    timeout: float,
+    query_string: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run the time sliced lookup query of a content, or the given query, and merge its
+    responses
+    """
+
+    properties = event["ResourceProperties"]
+    time_slices = get_time_slices(
+        int(_parse_time(properties["iStartTime"]).timestamp()),
+        int(_parse_time(properties["iEndTime"]).timestamp()),
+        int(properties.get("iTimeSlices", 1)),
+    )
+    query_string = query_string or generator.generate_lookup_query(event)
+    query_scheduler = QueryScheduler(logs_client)
+    for time_slice, (start_time, end_time) in enumerate(time_slices):
+        query_scheduler.submit(
+            time_slice,
+            logGroupName=properties["iLogGroupName"],
+            startTime=start_time,
+            endTime=end_time,
+            queryString=query_string,
+        )
+
+    responses = query_scheduler.run(timeout)
+    if len(responses) < len(time_slices):
+        query_scheduler.stop_queries()
+        raise Exception(f"Lookup query still running after {timeout} seconds")
+    for time_slice in range(len(time_slices)):
+        if (query_status := responses[time_slice].get("status", None)) != "Complete":
+            raise Exception(
+                f'Unexpected query status "{query_status}" for query ID "{query_scheduler.query_ids[time_slice]}"'
+            )
+
+    return merge_lookup_responses(
+        event, [responses[time_slice] for time_slice in range(len(time_slices))]
+    )
+
+
+def plan_content(
+    logs_client,
+    dashboard_name: str,
+    content: str,
+    content_configuration: Dict[str, Any],
+    metric_query_properties: Dict[str, Any],
+    timeout: float,
+    scan_statistics: Optional[Dict[str, float]] = None,
+    widgets_per_page: int = DEFAULT_WIDGETS_PER_PAGE,
+) -> List[DashboardPlan]:
+    """
+    Run the lookup query of a content and project the usage of its dashboards, one plan
+    per dashboard page.
+    Rollups run no lookup query, their widget queries scan the same log group over the
+    same window as the other contents ones: the given scan statistics are reused, the
+    scan volume being probed otherwise.
+    """
+
+    # The query length budget is lifted to report the length of every shard query
+    event = {
+        "RequestType": "Create",
+        "ResourceType": f"Custom::ContainerInsights-{content}MetricQuery",
+        "ResourceProperties": {
+            **metric_query_properties,
+            "iMaxQueryLength": sys.maxsize,
+        },
+        "CrHelperData": {"PhysicalResourceId": "planner"},
+    }
+    generator = GENERATORS[content]()
+    if not generator.has_lookup_query(event):
+        response = None
+        if scan_statistics is None:
+            scan_statistics = run_lookup_query(
+                logs_client, generator, event, timeout, SCAN_PROBE_QUERY
+            ).get("statistics", {})
+    else:
+        response = run_lookup_query(logs_client, generator, event, timeout)
+        if not response.get("results", None):
+            raise Exception(
+                f"{content} lookup query didnt return any result, please double check the correctness of the provided investigation window"
+            )
+        scan_statistics = response.get("statistics", {})
+
+    helper.Data = {}
+    generator.set_metric_queries(event, response)
+    metric_queries = dict(helper.Data)
+
+    namespace_selectors = metric_query_properties.get("iNamespaces", None)
+    shard_count = int(metric_query_properties.get("iShardCount", 1))
+    metrics = content_configuration["metrics"] or []
+    plans = []
+    for index, namespace_selector in enumerate(namespace_selectors or [""], start=1):
+        query_attribute = (
+            "oQuery" if namespace_selectors is None else f"oQueryNamespace{index}"
+        )
+        queries = (
+            [metric_queries[query_attribute]]
+            if shard_count == 1
+            else [
+                metric_queries[f"{query_attribute}Shard{shard}"]
+                for shard in range(1, shard_count + 1)
+            ]
+        )
+        content_dashboard_name = "-".join(
+            filter(None, [dashboard_name, f"{content}Metrics", namespace_selector])
+        )
+        max_query_length = max(
+            (
+                get_formatted_query_length(query, len(metric))
+                for query in queries
+                for metric in metrics
+            ),
+            default=0,
+        )
+        for page, page_widgets in enumerate(
+            get_pages(list(range(len(metrics) * len(queries))), widgets_per_page),
+            start=1,
+        ):
+            plans.append(
+                DashboardPlan(
+                    name=(
+                        content_dashboard_name
+                        if page == 1
+                        else f"{content_dashboard_name}-Page{page}"
+                    ),
+                    widget_count=len(page_widgets),
+                    max_query_length=max_query_length,
+                    lookup_bytes_scanned=scan_statistics.get("bytesScanned", 0),
+                    lookup_records_scanned=scan_statistics.get("recordsScanned", 0),
+                )
+            )
+
+    return plans
+
+
+def check_budgets(
+    plans: List[DashboardPlan],
+    max_query_length: int,
+    max_gb_per_widget: float = None,
+    max_gb_per_refresh: float = None,
+) -> List[str]:
+    """The budgets exceeded by the planned dashboards"""
+
+    violations = []
+    for plan in plans:
+        if plan.max_query_length > max_query_length:
+            violations.append(
+                f"{plan.name}: widget queries up to {plan.max_query_length} characters long exceed the {max_query_length} characters budget, consider more shards or a top K"
+            )
+        if (
+            max_gb_per_widget is not None
+            and plan.bytes_per_widget / GB > max_gb_per_widget
+        ):
+            violations.append(
+                f"{plan.name}: {plan.bytes_per_widget / GB:.2f} GB scanned per widget exceed the {max_gb_per_widget} GB budget, consider a shorter investigation window"
+            )
+        if (
+            max_gb_per_refresh is not None
+            and plan.bytes_per_refresh / GB > max_gb_per_refresh
+        ):
+            violations.append(
+                f"{plan.name}: {plan.bytes_per_refresh / GB:.2f} GB scanned per refresh exceed the {max_gb_per_refresh} GB budget, consider fewer metrics or a shorter investigation window"
+            )
+
+    return violations
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="planner",
+        description="Project the Logs Insights usage of the dashboards before deploying them",
+    )
+    parser.add_argument(
+        "-c",
+        "--configuration",
+        default=DASHBOARD_CONFIGURATION_FILENAME,
+        help="Dashboards configuration file.",
+    )
+    parser.add_argument(
+        "--max-query-length",
+        type=int,
+        default=DEFAULT_MAX_QUERY_LENGTH,
+        help="Widget query length budget, in characters.",
+    )
+    parser.add_argument(
+        "--max-gb-per-widget",
+        type=float,
+        help="Data scanned budget of a single widget query, in GB.",
+    )
+    parser.add_argument(
+        "--max-gb-per-refresh",
+        type=float,
+        help="Data scanned budget of a whole dashboard refresh, in GB.",
+    )
+    parser.add_argument(
+        "--price-per-gb",
+        type=float,
+        default=DEFAULT_PRICE_PER_GB,
+        help="Logs Insights price per GB of data scanned.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="Time to wait for every lookup query, in seconds.",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Fail, rather than warn, when a budget is exceeded.",
+    )
+    args = parser.parse_args(argv)
+
+    dashboard_configuration = load_dashboard_configuration(args.configuration)
+    common_metric_query_properties, contents = get_metric_query_properties(
+        dashboard_configuration
+    )
+
+    start_time = time.monotonic()
+    plans = []
+    records_scanned = 0
+    scan_statistics = None
+    # Rollups last, reusing the scan volume measured by the lookup queries
+    for content, (content_configuration, metric_query_properties) in sorted(
+        contents.items(), key=lambda item: item[0] in ROLLUP_CONTENTS
+    ):
+        content_plans = plan_content(
+            get_logs_client(),
+            dashboard_configuration["name"],
+            content,
+            content_configuration,
+            {**common_metric_query_properties, **metric_query_properties},
+            args.timeout,
+            scan_statistics,
+            get_widgets_per_page(dashboard_configuration),
+        )
+        if scan_statistics is None or content not in ROLLUP_CONTENTS:
+            records_scanned += content_plans[0].lookup_records_scanned
+        scan_statistics = {
+            "bytesScanned": content_plans[0].lookup_bytes_scanned,
+            "recordsScanned": content_plans[0].lookup_records_scanned,
+        }
+        plans.extend(content_plans)
+
+    print(
+        f"{'dashboard':<48} {'widgets':>8} {'query length':>13} {'GB/widget':>10} {'GB/refresh':>11} {'$/refresh':>10}"
+    )
+    for plan in plans:
+        print(
+            f"{plan.name:<48} {plan.widget_count:>8} {plan.max_query_length:>13} {plan.bytes_per_widget / GB:>10.3f} {plan.bytes_per_refresh / GB:>11.3f} {plan.bytes_per_refresh / GB * args.price_per_gb:>10.4f}"
+        )
+    print(
+        f"Lookup queries completed in {time.monotonic() - start_time:.0f} seconds, "
+        f"{records_scanned:.0f} records scanned"
+    )
+
+    violations = check_budgets(
+        plans, args.max_query_length, args.max_gb_per_widget, args.max_gb_per_refresh
+    )
+    for violation in violations:
+        print(f"{'ERROR' if args.strict else 'WARNING'}: {violation}", file=sys.stderr)
+
+    return 1 if violations and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
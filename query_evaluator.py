@@ -0,0 +1,880 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""
+Local evaluator of the Logs Insights queries generated by the metric query generators
+and formatters, over Container Insights performance log events stored as JSON lines
+(eg. as printed by benchmarks/synthetic_cluster.py), to try dashboards and compare query
+variants offline.
+
+Only the subset of the query language the generated queries use is supported:
+    - fields, with plain fields and aliased expressions (eg. "(PodName = "a") as pod1")
+    - filter, with and/or/not, comparisons, in [...], like /regex/ and ispresent(...)
+    - stats, with sum, count, avg, min, max and pct aggregations, combined with
+      arithmetic, by bin(...) or by fields, pct being computed over a bounded sample of
+      the values of each group
+    - sort and limit
+The log events are read in chunks, and every command is evaluated on a whole chunk at
+once with pandas, the stats partial aggregations being merged across chunks.
+
+    python query_evaluator.py logs.jsonl --query "fields ..." --query "fields ..."
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+import warnings
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# Values kept per group for each percentile, a uniform sample of the values once a group
+# holds more of them, so that the memory used by pct does not grow with the log events.
+# Logs Insights percentiles are approximations as well
+PERCENTILE_SAMPLE_SIZE = 10000
+
+# Logs Insights caps the number of log events returned by queries without stats
+DEFAULT_LIMIT = 1000
+
+# Container Insights agents write the performance logs of a node to a log stream named
+# after the node
+LOG_STREAM_NAME_FIELD = "NodeName"
+
+TIMESTAMP_FIELD = "@timestamp"
+LOG_STREAM_FIELD = "@logStream"
+
+BIN_UNITS = {"ms": 1, "s": 1000, "m": 60000, "h": 3600000, "d": 86400000}
+
+AGGREGATIONS = ["sum", "count", "avg", "min", "max", "pct"]
+
+TOKEN_REGEX = re.compile(
+    r"""
+    (?P<space>\s+)
+    |(?P<backtick>`[^`]*`)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<number>[0-9]+(?:\.[0-9]+)?[a-z]*)
+    |(?P<name>[@A-Za-z_][A-Za-z0-9_.@]*)
+    |(?P<operator>!=|<=|>=|=|<|>|\*|/|\+|-|\(|\)|\[|\]|,|\|)
+    """,
+    re.VERBOSE,
+)
+
+
+@dataclass
+class Token:
+    kind: str
+    value: Any
+
+
+@dataclass
+class Command:
+    name: str
+    # (expression, output name) pairs, eg. fields, stats aggregations
+    items: List[Tuple[tuple, str]] = field(default_factory=list)
+    # stats grouping (expression, output name) pairs
+    groups: List[Tuple[tuple, str]] = field(default_factory=list)
+    # filter condition
+    condition: Optional[tuple] = None
+    # sort (field, descending) pairs
+    sort: List[Tuple[str, bool]] = field(default_factory=list)
+    limit: Optional[int] = None
+
+
+def tokenize(query: str) -> List[Token]:
+    """Split a query into tokens, regular expressions following the like keyword"""
+
+    tokens = []
+    position = 0
+    while position < len(query):
+        if (
+            query[position] == "/"
+            and tokens
+            and tokens[-1].kind == "name"
+            and tokens[-1].value == "like"
+        ):
+            end = position + 1
+            while end < len(query) and query[end] != "/":
+                end += 2 if query[end] == "\\" else 1
+            if end >= len(query):
+                raise Exception(f"Unterminated regular expression at {position}")
+            tokens.append(Token("regex", query[position + 1 : end]))
+            position = end + 1
+            continue
+
+        if (match := TOKEN_REGEX.match(query, position)) is None:
+            raise Exception(f"Unexpected character {query[position]!r} at {position}")
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "backtick":
+            tokens.append(Token("name", value[1:-1]))
+        elif kind == "string":
+            tokens.append(Token("string", re.sub(r"\\(.)", r"\1", value[1:-1])))
+        elif kind != "space":
+            tokens.append(Token(kind, value))
+        position = match.end()
+
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser of the supported query subset"""
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return None
+
+    def accept(self, value: str) -> bool:
+        if (token := self.peek()) is not None and token.value == value:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise Exception(f"Expected {value!r}, got {self.peek()}")
+
+    def next(self) -> Token:
+        if (token := self.peek()) is None:
+            raise Exception("Unexpected end of query")
+        self.position += 1
+        return token
+
+    def parse_commands(self) -> List[Command]:
+        commands = []
+        while self.peek() is not None:
+            commands.append(self.parse_command())
+            if self.peek() is not None:
+                self.expect("|")
+        return commands
+
+    def parse_command(self) -> Command:
+        name = self.next().value
+        command = Command(name)
+        if name == "fields":
+            command.items = self.parse_items()
+        elif name == "filter":
+            command.condition = self.parse_expression()
+        elif name == "stats":
+            command.items = self.parse_items()
+            if self.accept("by"):
+                command.groups = self.parse_items()
+        elif name == "sort":
+            while True:
+                sort_field = self.next().value
+                descending = self.accept("desc")
+                if not descending:
+                    self.accept("asc")
+                command.sort.append((sort_field, descending))
+                if not self.accept(","):
+                    break
+        elif name == "limit":
+            command.limit = int(self.next().value)
+        else:
+            raise Exception(f"Unsupported command: {name}")
+        return command
+
+    def parse_items(self) -> List[Tuple[tuple, str]]:
+        items = []
+        while True:
+            start = self.position
+            expression = self.parse_expression()
+            if self.accept("as"):
+                name = self.next().value
+            elif expression[0] == "field":
+                name = expression[1]
+            else:
+                name = _to_text(self.tokens[start : self.position])
+            items.append((expression, name))
+            if not self.accept(","):
+                return items
+
+    def parse_expression(self) -> tuple:
+        expression = self.parse_and()
+        while self.accept("or"):
+            expression = ("or", expression, self.parse_and())
+        return expression
+
+    def parse_and(self) -> tuple:
+        expression = self.parse_not()
+        while self.accept("and"):
+            expression = ("and", expression, self.parse_not())
+        return expression
+
+    def parse_not(self) -> tuple:
+        if self.accept("not"):
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> tuple:
+        expression = self.parse_additive()
+        if (token := self.peek()) is None:
+            return expression
+        if token.value in ["=", "!=", "<", "<=", ">", ">="]:
+            self.position += 1
+            return ("compare", token.value, expression, self.parse_additive())
+        if token.value == "in":
+            self.position += 1
+            self.expect("[")
+            values = []
+            while not self.accept("]"):
+                values.append(self.parse_literal())
+                self.accept(",")
+            return ("in", expression, tuple(values))
+        if token.value == "like":
+            self.position += 1
+            pattern = self.next()
+            regex = (
+                pattern.value if pattern.kind == "regex" else re.escape(pattern.value)
+            )
+            return ("like", expression, regex)
+        return expression
+
+    def parse_additive(self) -> tuple:
+        expression = self.parse_multiplicative()
+        while (token := self.peek()) is not None and token.value in ["+", "-"]:
+            self.position += 1
+            expression = (
+                "arithmetic",
+                token.value,
+                expression,
+                self.parse_multiplicative(),
+            )
+        return expression
+
+    def parse_multiplicative(self) -> tuple:
+        expression = self.parse_unary()
+        while (token := self.peek()) is not None and token.value in ["*", "/"]:
+            self.position += 1
+            expression = ("arithmetic", token.value, expression, self.parse_unary())
+        return expression
+
+    def parse_unary(self) -> tuple:
+        if self.accept("-"):
+            return ("arithmetic", "-", ("literal", 0), self.parse_unary())
+        return self.parse_primary()
+
+    def parse_primary(self) -> tuple:
+        token = self.next()
+        if token.value == "(" and token.kind == "operator":
+            expression = self.parse_expression()
+            self.expect(")")
+            return expression
+        if token.kind in ["string", "number"]:
+            self.position -= 1
+            return ("literal", self.parse_literal())
+        if token.kind == "name":
+            if self.accept("("):
+                arguments = []
+                while not self.accept(")"):
+                    if (argument := self.peek()).kind == "number" and argument.value[
+                        -1
+                    ].isalpha():
+                        # Bin period, eg. 5m
+                        self.position += 1
+                        arguments.append(("literal", argument.value))
+                    elif argument.value == "*":
+                        # count(*), counting every record as count() does
+                        self.position += 1
+                    else:
+                        arguments.append(self.parse_expression())
+                    self.accept(",")
+                return ("call", token.value, tuple(arguments))
+            return ("field", token.value)
+        raise Exception(f"Unexpected token {token}")
+
+    def parse_literal(self) -> Any:
+        token = self.next()
+        if token.kind == "string":
+            return token.value
+        if token.kind == "number":
+            return float(token.value) if "." in token.value else int(token.value)
+        raise Exception(f"Expected a literal, got {token}")
+
+
+def _to_text(tokens: List[Token]) -> str:
+    text = ""
+    for token in tokens:
+        if token.kind == "string":
+            value = f'"{token.value}"'
+        elif token.kind == "regex":
+            value = f"/{token.value}/"
+        else:
+            value = token.value
+        if text and not (value in [")", ",", "("] or text[-1] == "("):
+            text += " "
+        text += value
+    return text.replace(" ,", ",")
+
+
+def parse_query(query: str) -> List[Command]:
+    """
+    Parse a query into its commands, the double quotes of the generic metric queries
+    being escaped for their dashboard definition (ie. \\")
+    """
+    return Parser(tokenize(query.replace('\\"', '"'))).parse_commands()
+
+
+def get_bin_period(period: str) -> int:
+    """Bin period in milliseconds, eg. 5m"""
+
+    if (match := re.fullmatch(r"([0-9]+)([a-z]+)", period)) is None or match.group(
+        2
+    ) not in BIN_UNITS:
+        raise Exception(f"Unsupported bin period: {period}")
+    return int(match.group(1)) * BIN_UNITS[match.group(2)]
+
+
+def _numeric(value) -> Any:
+    if isinstance(value, pd.Series):
+        if value.dtype == bool:
+            return value.astype(float)
+        return pd.to_numeric(value, errors="coerce")
+    return value
+
+
+def _column(frame: pd.DataFrame, name: str) -> pd.Series:
+    if name in frame.columns:
+        return frame[name]
+    return pd.Series(np.nan, index=frame.index, dtype=object)
+
+
+def evaluate_expression(
+    expression: tuple,
+    frame: pd.DataFrame,
+    aggregates: Optional[Dict[tuple, pd.Series]] = None,
+) -> Any:
+    """
+    Evaluate an expression over every row of a frame, aggregations being looked up in
+    the given aggregates, computed beforehand
+    """
+
+    kind = expression[0]
+    if kind == "literal":
+        return expression[1]
+    if kind == "field":
+        return _column(frame, expression[1])
+    if kind == "call" and expression[1] in AGGREGATIONS:
+        if aggregates is None:
+            raise Exception(f"Aggregation {expression[1]} outside of stats")
+        return aggregates[expression]
+    if kind == "call" and expression[1] == "ispresent":
+        return _column(frame, expression[2][0][1]).notna()
+    if kind == "call" and expression[1] == "bin":
+        period = get_bin_period(expression[2][0][1])
+        return _column(frame, TIMESTAMP_FIELD) // period * period
+    if kind == "call":
+        raise Exception(f"Unsupported function: {expression[1]}")
+
+    if kind in ["and", "or"]:
+        left = _as_condition(evaluate_expression(expression[1], frame, aggregates))
+        right = _as_condition(evaluate_expression(expression[2], frame, aggregates))
+        return left & right if kind == "and" else left | right
+    if kind == "not":
+        return ~_as_condition(evaluate_expression(expression[1], frame, aggregates))
+    if kind == "in":
+        return evaluate_expression(expression[1], frame, aggregates).isin(expression[2])
+    if kind == "like":
+        with warnings.catch_warnings():
+            # Regular expressions with groups are matched, not extracted
+            warnings.simplefilter("ignore", UserWarning)
+            return (
+                evaluate_expression(expression[1], frame, aggregates)
+                .astype("string")
+                .str.contains(expression[2], regex=True)
+                .fillna(False)
+                .astype(bool)
+            )
+    if kind == "compare":
+        _, operator, left_expression, right_expression = expression
+        left = evaluate_expression(left_expression, frame, aggregates)
+        right = evaluate_expression(right_expression, frame, aggregates)
+        if isinstance(left, (int, float)) or isinstance(right, (int, float)):
+            left, right = _numeric(left), _numeric(right)
+        if operator == "=":
+            result = left == right
+        elif operator == "!=":
+            result = (left != right) & pd.Series(left).notna()
+        elif operator == "<":
+            result = left < right
+        elif operator == "<=":
+            result = left <= right
+        elif operator == ">":
+            result = left > right
+        else:
+            result = left >= right
+        return _as_condition(result)
+    if kind == "arithmetic":
+        _, operator, left_expression, right_expression = expression
+        left = _numeric(evaluate_expression(left_expression, frame, aggregates))
+        right = _numeric(evaluate_expression(right_expression, frame, aggregates))
+        if operator == "+":
+            return left + right
+        if operator == "-":
+            return left - right
+        if operator == "*":
+            return left * right
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = left / right
+        if isinstance(result, pd.Series):
+            return result.replace([np.inf, -np.inf], np.nan)
+        return result
+    raise Exception(f"Unsupported expression: {expression}")
+
+
+def _as_condition(value) -> pd.Series:
+    if isinstance(value, pd.Series):
+        return value.fillna(False).astype(bool)
+    return value
+
+
+def _get_operands(expression: tuple) -> List[tuple]:
+    """The sub-expressions of an expression"""
+
+    kind = expression[0]
+    if kind == "call":
+        return list(expression[2])
+    if kind in ["and", "or"]:
+        return [expression[1], expression[2]]
+    if kind in ["not", "in", "like"]:
+        return [expression[1]]
+    if kind in ["compare", "arithmetic"]:
+        return [expression[2], expression[3]]
+    return []
+
+
+def _get_aggregations(expression: tuple) -> Iterator[tuple]:
+    """The aggregations an expression of a stats command is made of"""
+
+    if expression[0] == "call" and expression[1] in AGGREGATIONS:
+        yield expression
+        return
+    for operand in _get_operands(expression):
+        yield from _get_aggregations(operand)
+
+
+class StatsAccumulator:
+    """
+    Partial aggregations of a stats command, merged chunk after chunk: sums, counts,
+    minimums and maximums, along with a sample of at most "percentile_sample_size" values
+    per group for the percentiles. The sample keeps the values with the lowest random
+    keys, which is a uniform sample of all the values added.
+    """
+
+    def __init__(
+        self, command: Command, percentile_sample_size: int = PERCENTILE_SAMPLE_SIZE
+    ):
+        self.command = command
+        self.percentile_sample_size = percentile_sample_size
+        self._random = np.random.default_rng(0)
+        self.aggregations = list(
+            dict.fromkeys(
+                aggregation
+                for expression, _ in command.items
+                for aggregation in _get_aggregations(expression)
+            )
+        )
+        self.group_names = [name for _, name in command.groups] or ["__group"]
+        self.partials: Optional[pd.DataFrame] = None
+        self.percentile_values: Dict[int, pd.DataFrame] = {}
+
+    def _state_columns(self) -> Dict[str, str]:
+        """Partial aggregation columns, with the function merging them across chunks"""
+
+        columns = {}
+        for index, (_, name, _) in enumerate(self.aggregations):
+            if name in ["sum", "avg"]:
+                columns[f"sum{index}"] = "sum"
+            if name in ["count", "avg"]:
+                columns[f"count{index}"] = "sum"
+            if name in ["min", "max"]:
+                columns[f"{name}{index}"] = name
+        return columns
+
+    def add(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+
+        state = pd.DataFrame(index=frame.index)
+        if self.command.groups:
+            for expression, name in self.command.groups:
+                state[name] = evaluate_expression(expression, frame)
+        else:
+            state["__group"] = 0
+        for index, aggregation in enumerate(self.aggregations):
+            _, name, arguments = aggregation
+            values = (
+                _numeric(evaluate_expression(arguments[0], frame))
+                if arguments
+                else pd.Series(1.0, index=frame.index)
+            )
+            if name in ["sum", "avg"]:
+                state[f"sum{index}"] = values
+            if name in ["count", "avg"]:
+                state[f"count{index}"] = values.notna().astype(float)
+            if name in ["min", "max"]:
+                state[f"{name}{index}"] = values
+            if name == "pct":
+                self._sample_percentile_values(
+                    index, state[self.group_names].assign(value=values)
+                )
+
+        columns = self._state_columns()
+        partials = (
+            state[self.group_names + list(columns)]
+            .groupby(self.group_names, dropna=False, sort=False)
+            .agg({name: function for name, function in columns.items()} or "size")
+        )
+        if not columns:
+            partials = partials.to_frame("__rows")
+        if self.partials is not None:
+            partials = (
+                pd.concat([self.partials, partials])
+                .groupby(level=self.group_names, dropna=False, sort=False)
+                .agg(columns or {"__rows": "sum"})
+            )
+        self.partials = partials
+
+    def _sample_percentile_values(self, index: int, values: pd.DataFrame):
+        values = values[values["value"].notna()]
+        values = values.assign(key=self._random.random(len(values)))
+        if index in self.percentile_values:
+            values = pd.concat([self.percentile_values[index], values])
+        ranks = values.groupby(self.group_names, dropna=False, sort=False)["key"].rank(
+            method="first"
+        )
+        self.percentile_values[index] = values[ranks <= self.percentile_sample_size]
+
+    def result(self) -> pd.DataFrame:
+        if self.partials is None:
+            return pd.DataFrame(columns=[name for _, name in self.command.groups])
+
+        aggregates = {}
+        for index, aggregation in enumerate(self.aggregations):
+            _, name, arguments = aggregation
+            if name == "sum":
+                aggregates[aggregation] = self.partials[f"sum{index}"]
+            elif name == "count":
+                aggregates[aggregation] = self.partials[f"count{index}"]
+            elif name == "avg":
+                aggregates[aggregation] = (
+                    self.partials[f"sum{index}"] / self.partials[f"count{index}"]
+                )
+            elif name in ["min", "max"]:
+                aggregates[aggregation] = self.partials[f"{name}{index}"]
+            else:
+                percentile = evaluate_expression(arguments[1], pd.DataFrame())
+                aggregates[aggregation] = (
+                    self.percentile_values[index]
+                    .groupby(self.group_names, dropna=False, sort=False)["value"]
+                    .quantile(percentile / 100)
+                    .reindex(self.partials.index)
+                )
+
+        result = pd.DataFrame(index=self.partials.index)
+        for expression, name in self.command.items:
+            result[name] = evaluate_expression(expression, result, aggregates)
+        result = result.reset_index()
+        if not self.command.groups:
+            return result.drop(columns=["__group"])
+        return result.sort_values(
+            [name for _, name in self.command.groups], kind="stable"
+        ).reset_index(drop=True)
+
+
+def read_log_events(
+    paths: List[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fields: Optional[List[str]] = None,
+) -> Iterator[Tuple[pd.DataFrame, int]]:
+    """
+    Log events of JSON lines files, as frames of "chunk_size" events along with their
+    size in bytes, nested fields being flattened with dots as Logs Insights does.
+    Only the given fields are extracted if any, which is much faster than flattening
+    every field of every log event.
+    """
+
+    records = []
+    size = 0
+    for path in paths:
+        with open(path, "r", encoding="utf8") as log_events:
+            for line in log_events:
+                if not line.strip():
+                    continue
+                records.append(json.loads(line))
+                size += len(line)
+                if len(records) >= chunk_size:
+                    yield _to_frame(records, fields), size
+                    records = []
+                    size = 0
+    if records:
+        yield _to_frame(records, fields), size
+
+
+def _to_frame(
+    records: List[Dict[str, Any]], fields: Optional[List[str]]
+) -> pd.DataFrame:
+    if fields is None:
+        return pd.json_normalize(records)
+
+    return pd.DataFrame(
+        {name: [_get_field(record, name) for record in records] for name in fields}
+    )
+
+
+def _get_field(record: Dict[str, Any], name: str) -> Any:
+    """Value of a field, nested fields being named with dots, eg. kubernetes.pod_name"""
+
+    if name in record:
+        return record[name]
+    value = record
+    for part in name.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def get_referenced_fields(commands: List[Command]) -> Optional[List[str]]:
+    """
+    The log event fields a query reads, along with the ones the system fields are
+    derived from, None when it reads every field (ie. no fields nor stats command)
+    """
+
+    if not any(command.name in ["fields", "stats"] for command in commands):
+        return None
+
+    fields = ["Timestamp", "_aws.Timestamp", LOG_STREAM_NAME_FIELD]
+    expressions = [
+        expression
+        for command in commands
+        for expression, _ in command.items + command.groups
+    ] + [command.condition for command in commands if command.condition is not None]
+    while expressions:
+        expression = expressions.pop()
+        if expression[0] == "field" and expression[1] not in [
+            TIMESTAMP_FIELD,
+            LOG_STREAM_FIELD,
+        ]:
+            fields.append(expression[1])
+        expressions.extend(_get_operands(expression))
+    return list(dict.fromkeys(fields))
+
+
+def _add_system_fields(frame: pd.DataFrame) -> pd.DataFrame:
+    """@timestamp, in epoch milliseconds, and @logStream fields of the log events"""
+
+    if TIMESTAMP_FIELD not in frame.columns:
+        timestamp = _column(frame, "Timestamp")
+        if "_aws.Timestamp" in frame.columns:
+            timestamp = timestamp.fillna(frame["_aws.Timestamp"])
+        frame[TIMESTAMP_FIELD] = pd.to_numeric(timestamp, errors="coerce")
+    if LOG_STREAM_FIELD not in frame.columns:
+        frame[LOG_STREAM_FIELD] = _column(frame, LOG_STREAM_NAME_FIELD)
+    return frame
+
+
+def _to_value(value: Any, name: str) -> Optional[str]:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if name.startswith("bin(") or name == TIMESTAMP_FIELD:
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).strftime(
+            "%Y-%m-%d %H:%M:%S.000"
+        )
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value))
+    return str(value)
+
+
+def to_results(frame: pd.DataFrame) -> List[List[Dict[str, str]]]:
+    """Logs Insights results of a frame, leaving out the fields without a value"""
+
+    results = []
+    for row in frame.itertuples(index=False, name=None):
+        result = []
+        for name, value in zip(frame.columns, row):
+            if (text := _to_value(value, name)) is not None:
+                result.append({"field": name, "value": text})
+        results.append(result)
+    return results
+
+
+def evaluate_query(
+    query: str,
+    paths: List[str],
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Evaluate a query over the log events of JSON lines files, within an optional time
+    window (epoch seconds), and answer a GetQueryResults like response
+    """
+
+    commands = parse_query(query)
+    stats_index = next(
+        (index for index, command in enumerate(commands) if command.name == "stats"),
+        None,
+    )
+    scan_commands = commands if stats_index is None else commands[:stats_index]
+    accumulator = (
+        None if stats_index is None else StatsAccumulator(commands[stats_index])
+    )
+
+    statistics = {"recordsMatched": 0.0, "recordsScanned": 0.0, "bytesScanned": 0.0}
+    matched_frames = []
+    for frame, size in read_log_events(
+        paths, chunk_size, get_referenced_fields(commands)
+    ):
+        statistics["recordsScanned"] += len(frame)
+        statistics["bytesScanned"] += size
+        frame = _add_system_fields(frame)
+        if start_time is not None:
+            frame = frame[frame[TIMESTAMP_FIELD] >= start_time * 1000]
+        if end_time is not None:
+            frame = frame[frame[TIMESTAMP_FIELD] <= end_time * 1000]
+
+        for command in scan_commands:
+            if command.name == "fields":
+                frame = frame.assign(
+                    **{
+                        name: evaluate_expression(expression, frame)
+                        for expression, name in command.items
+                        if expression[0] != "field"
+                    }
+                )
+            elif command.name == "filter":
+                frame = frame[
+                    _as_condition(evaluate_expression(command.condition, frame))
+                ]
+            elif accumulator is not None:
+                raise Exception(f"Unsupported command before stats: {command.name}")
+        statistics["recordsMatched"] += len(frame)
+
+        if accumulator is not None:
+            accumulator.add(frame)
+        else:
+            matched_frames.append(_select_fields(frame, scan_commands))
+
+    if accumulator is not None:
+        result = accumulator.result()
+        post_commands = commands[stats_index + 1 :]
+    else:
+        result = pd.concat(matched_frames) if matched_frames else pd.DataFrame()
+        result = result.sort_values(TIMESTAMP_FIELD, ascending=False, kind="stable")
+        post_commands = [
+            command for command in scan_commands if command.name in ["sort", "limit"]
+        ]
+
+    limit = None
+    for command in post_commands:
+        if command.name == "sort":
+            result = result.sort_values(
+                [name for name, _ in command.sort],
+                ascending=[not descending for _, descending in command.sort],
+                kind="stable",
+            )
+        elif command.name == "limit":
+            limit = command.limit
+        else:
+            raise Exception(f"Unsupported command after stats: {command.name}")
+    if accumulator is None:
+        limit = min(limit or DEFAULT_LIMIT, DEFAULT_LIMIT)
+    if limit is not None:
+        result = result.head(limit)
+
+    return {
+        "results": to_results(result),
+        "statistics": statistics,
+        "status": "Complete",
+    }
+
+
+def _select_fields(frame: pd.DataFrame, commands: List[Command]) -> pd.DataFrame:
+    """The fields of the last fields command, along with the timestamp"""
+
+    names = [
+        name
+        for command in commands
+        if command.name == "fields"
+        for _, name in command.items
+    ]
+    if not names:
+        return frame
+    return pd.DataFrame(
+        {
+            name: _column(frame, name)
+            for name in dict.fromkeys([TIMESTAMP_FIELD, *names])
+        }
+    )
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="query_evaluator",
+        description="Evaluate Logs Insights queries over local JSON lines log events",
+    )
+    parser.add_argument("paths", nargs="+", help="JSON lines log events files.")
+    parser.add_argument(
+        "-q",
+        "--query",
+        action="append",
+        required=True,
+        help="Query to evaluate, repeat to compare several query variants.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Number of log events evaluated at once.",
+    )
+    parser.add_argument(
+        "--results", action="store_true", help="Print the results as JSON as well."
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'query':>6} {'length':>7} {'scanned':>10} {'matched':>10} {'rows':>7} {'time (s)':>9}"
+    )
+    for index, query in enumerate(args.query, start=1):
+        start = time.perf_counter()
+        response = evaluate_query(query, args.paths, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{index:>6} {len(query):>7} {response['statistics']['recordsScanned']:>10.0f} {response['statistics']['recordsMatched']:>10.0f} {len(response['results']):>7} {elapsed:>9.2f}"
+        )
+        if args.results:
+            print(json.dumps(response["results"], indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
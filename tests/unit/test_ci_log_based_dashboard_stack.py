@@ -16,7 +16,8 @@
 
 import json
 import os
-from typing import Any, Dict
+from hashlib import sha1
+from typing import Any, Dict, List, Tuple
 
 import aws_cdk as cdk
 import aws_cdk.assertions as assertions
@@ -24,6 +25,7 @@ import pytest
 import yaml
 
 from cdk.ci_log_based_dashboard_stack import ContainerInsightsLogBasedDashboardStack
+from cdk.dashboard_configuration import load_dashboard_configuration
 
 
 def test_snapshot(mocker):
@@ -136,28 +138,68 @@ def test_configuration(mocker, node_conf, pod_conf, container_conf):
         "container"
     ]
 
+    node_enabled = node_conf["enabled"]
+    pod_enabled = pod_conf["enabled"] and bool(pod_conf["namespaces"])
+    container_enabled = container_conf["enabled"] and bool(container_conf["namespaces"])
+    # Several enabled contents share a single discovery lookup query, each of them
+    # answering its metric queries through its own custom resources, eg. one per
+    # container namespace selector given the estimated container query size
+    discovery_enabled = node_enabled + pod_enabled + container_enabled > 1
+    container_metric_queries = (
+        len(container_conf["namespaces"]) if container_enabled else 0
+    )
+
     template = assertions.Template.from_stack(stack)
+    template.resource_count_is(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        (
+            node_enabled + pod_enabled + container_metric_queries
+            if discovery_enabled
+            else 0
+        ),
+    )
+    if discovery_enabled or container_metric_queries > 1:
+        assert (
+            len(
+                template.find_resources(
+                    (
+                        "Custom::ContainerInsights-DiscoveryMetricQuery"
+                        if discovery_enabled
+                        else "Custom::ContainerInsights-ContainerMetricQuery"
+                    ),
+                    {"Properties": {"iSharedLookup": assertions.Match.any_value()}},
+                )
+            )
+            == 1
+        )
     template.resource_count_is(
         "Custom::ContainerInsights-NodeMetricQuery",
-        0 if not node_conf["enabled"] else 1,
+        1 if node_enabled and not discovery_enabled else 0,
     )
     template.resource_count_is(
         "Custom::ContainerInsights-PodMetricQuery",
-        0 if not pod_conf["enabled"] else len(pod_conf["namespaces"]),
+        1 if pod_enabled and not discovery_enabled else 0,
     )
     template.resource_count_is(
         "Custom::ContainerInsights-ContainerMetricQuery",
-        0 if not container_conf["enabled"] else len(container_conf["namespaces"]),
+        0 if discovery_enabled else container_metric_queries,
     )
-    template.resource_count_is(
-        "Custom::ContainerInsights-MetricQueryFormatter",
-        (0 if not node_conf["enabled"] else 1) * len(node_conf["metrics"])
-        + (0 if not pod_conf["enabled"] else 1)
-        * len(pod_conf["namespaces"])
-        * len(pod_conf["metrics"])
-        + (0 if not container_conf["enabled"] else 1)
-        * len(container_conf["namespaces"])
-        * len(container_conf["metrics"]),
+    # Widget queries are formatted by intrinsic functions, without formatter
+    template.resource_count_is("Custom::ContainerInsights-MetricQueryFormatter", 0)
+    assert sum(
+        len(widget_queries) for widget_queries in _get_widget_queries(template).values()
+    ) == (
+        (len(node_conf["metrics"]) if node_conf["enabled"] else 0)
+        + (
+            len(pod_conf["namespaces"]) * len(pod_conf["metrics"])
+            if pod_conf["enabled"]
+            else 0
+        )
+        + (
+            len(container_conf["namespaces"]) * len(container_conf["metrics"])
+            if container_conf["enabled"]
+            else 0
+        )
     )
     template.resource_count_is(
         "AWS::CloudWatch::Dashboard",
@@ -167,6 +209,997 @@ def test_configuration(mocker, node_conf, pod_conf, container_conf):
     )
 
 
+@pytest.mark.parametrize("query_references", [False, True])
+def test_namespace_selectors_configuration(mocker, query_references):
+    stack = _init_stack(
+        mocker,
+        {
+            "queryReferences": query_references,
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"enabled": False},
+                    "pod": {
+                        "metrics": ["pod_metric_1"],
+                        "namespaces": ["kube-system", "team-*", "/^ops-(a|b)$/"],
+                    },
+                    "container": {"enabled": False},
+                }
+            },
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    if query_references:
+        # A single key prefix is answered however many namespace selectors
+        template.resource_count_is("Custom::ContainerInsights-PodMetricQuery", 1)
+        template.has_resource_properties(
+            "Custom::ContainerInsights-PodMetricQuery",
+            {
+                "iNamespaces": ["kube-system", "team-*", "/^ops-(a|b)$/"],
+                "iNamespace": assertions.Match.absent(),
+                "iSharedLookup": assertions.Match.absent(),
+            },
+        )
+        return
+
+    # The namespace selectors are spread across custom resources by estimated response
+    # size, the first custom resource running the lookup query of every selector
+    template.resource_count_is("Custom::ContainerInsights-PodMetricQuery", 2)
+    template.has_resource_properties(
+        "Custom::ContainerInsights-PodMetricQuery",
+        {
+            "iNamespaces": ["kube-system", "team-*"],
+            "iNamespace": assertions.Match.absent(),
+            "iSharedLookup": {
+                "iNamespaces": ["kube-system", "team-*", "/^ops-(a|b)$/"]
+            },
+        },
+    )
+    template.has_resource_properties(
+        "Custom::ContainerInsights-PodMetricQuery",
+        {
+            "iNamespaces": ["/^ops-(a|b)$/"],
+            "iSharedLookup": assertions.Match.absent(),
+            "iLookupQueryId": {"Fn::GetAtt": ["PodMetricQuery", "oLookupQueryId"]},
+        },
+    )
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 3)
+    for dashboard_name, metric_query, query_attribute in [
+        (
+            "Incident_DEMO_1234-PodMetrics-kube-system",
+            "PodMetricQuery",
+            "oQueryNamespace1",
+        ),
+        ("Incident_DEMO_1234-PodMetrics-team-", "PodMetricQuery", "oQueryNamespace2"),
+        (
+            "Incident_DEMO_1234-PodMetrics-ops-_a_b",
+            "PodMetricQuery2",
+            "oQueryNamespace1",
+        ),
+    ]:
+        template.has_resource_properties(
+            "AWS::CloudWatch::Dashboard", {"DashboardName": dashboard_name}
+        )
+        assert _get_widget_queries(template)[dashboard_name] == [
+            ("pod_metric_1", metric_query, query_attribute)
+        ]
+
+
+@pytest.mark.parametrize("query_references", [False, True])
+def test_namespace_selectors_lookup_cap(mocker, query_references):
+    namespaces = [f"namespace-{index}" for index in range(120)]
+    stack = _init_stack(
+        mocker,
+        {
+            "queryReferences": query_references,
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"enabled": False},
+                    "pod": {"metrics": ["pod_metric_1"], "namespaces": namespaces},
+                    "container": {"enabled": False},
+                }
+            },
+        },
+    )
+
+    # Every lookup query covers up to 50 namespace selectors, shared by the custom
+    # resources answering their metric queries within the response budget, or answered
+    # by a single custom resource storing them given query references
+    template = assertions.Template.from_stack(stack)
+    metric_queries = template.find_resources("Custom::ContainerInsights-PodMetricQuery")
+    assert len(metric_queries) == (3 if query_references else 60)
+    lookup_namespaces = [
+        metric_query["Properties"].get("iSharedLookup", metric_query["Properties"])[
+            "iNamespaces"
+        ]
+        for metric_query in metric_queries.values()
+        if "iLookupQueryId" not in metric_query["Properties"]
+    ]
+    assert lookup_namespaces == [namespaces[:50], namespaces[50:100], namespaces[100:]]
+    assert len(
+        [
+            metric_query
+            for metric_query in metric_queries.values()
+            if "iSharedLookup" in metric_query["Properties"]
+        ]
+    ) == (0 if query_references else 3)
+
+
+def test_namespace_selectors_label_collisions(mocker):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"enabled": False},
+                    "pod": {
+                        "metrics": ["pod_metric_1"],
+                        "namespaces": ["kube-system", "team-*", "team-?"],
+                    },
+                    "container": {"enabled": False},
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 3)
+    for dashboard_name, metric_query, query_attribute in [
+        (
+            "Incident_DEMO_1234-PodMetrics-kube-system",
+            "PodMetricQuery",
+            "oQueryNamespace1",
+        ),
+        (
+            f"Incident_DEMO_1234-PodMetrics-team--{sha1(b'team-*').hexdigest()[:8]}",
+            "PodMetricQuery",
+            "oQueryNamespace2",
+        ),
+        (
+            f"Incident_DEMO_1234-PodMetrics-team--{sha1(b'team-?').hexdigest()[:8]}",
+            "PodMetricQuery2",
+            "oQueryNamespace1",
+        ),
+    ]:
+        assert _get_widget_queries(template)[dashboard_name] == [
+            ("pod_metric_1", metric_query, query_attribute)
+        ]
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 4])
+def test_shards_configuration(mocker, shard_count):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"enabled": False},
+                    "pod": {
+                        "shards": shard_count,
+                        "metrics": ["pod_metric_1", "pod_metric_12"],
+                        "namespaces": ["kube-system", "amazon-metrics"],
+                    },
+                    "container": {"enabled": False},
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "Custom::ContainerInsights-PodMetricQuery",
+        {
+            "iShardCount": (
+                shard_count if shard_count > 1 else assertions.Match.absent()
+            ),
+            "iMaxMetricNameLength": len("pod_metric_12"),
+        },
+    )
+    # Sharded namespace selectors answer more metric queries, hence fewer of them per
+    # custom resource
+    template.resource_count_is(
+        "Custom::ContainerInsights-PodMetricQuery", 1 if shard_count == 1 else 2
+    )
+    assert _get_widget_queries(template)[
+        "Incident_DEMO_1234-PodMetrics-amazon-metrics"
+    ] == [
+        (
+            metric,
+            "PodMetricQuery" if shard_count == 1 else "PodMetricQuery2",
+            (
+                "oQueryNamespace2"
+                if shard_count == 1
+                else f"oQueryNamespace1Shard{shard}"
+            ),
+        )
+        for metric in ["pod_metric_1", "pod_metric_12"]
+        for shard in range(1, shard_count + 1)
+    ]
+
+
+@pytest.mark.parametrize(
+    "top_k,expected_properties",
+    [
+        (
+            None,
+            {
+                "iTopK": assertions.Match.absent(),
+                "iTopKMetric": assertions.Match.absent(),
+                "iTopKStatistic": assertions.Match.absent(),
+            },
+        ),
+        (
+            {"limit": 10, "metric": "container_cpu_utilization"},
+            {
+                "iTopK": 10,
+                "iTopKMetric": "container_cpu_utilization",
+                "iTopKStatistic": "max",
+            },
+        ),
+        (
+            {"limit": 5, "metric": "container_cpu_utilization", "statistic": "p95"},
+            {
+                "iTopK": 5,
+                "iTopKMetric": "container_cpu_utilization",
+                "iTopKStatistic": "p95",
+            },
+        ),
+    ],
+)
+def test_top_k_configuration(mocker, top_k, expected_properties):
+    container_conf = {"metrics": ["container_cpu_utilization"]}
+    if top_k:
+        container_conf["topK"] = top_k
+    stack = _init_stack(
+        mocker,
+        {"dashboardConfiguration": {"contents": {"container": container_conf}}},
+    )
+
+    template = assertions.Template.from_stack(stack)
+    if top_k:
+        template.all_resources_properties(
+            "Custom::ContainerInsights-ContainerMetricQuery", expected_properties
+        )
+    else:
+        template.resource_count_is("Custom::ContainerInsights-ContainerMetricQuery", 0)
+        template.has_resource_properties(
+            "Custom::ContainerInsights-DiscoveryMetricQuery",
+            {"iContainer": expected_properties},
+        )
+
+
+@pytest.mark.parametrize(
+    "container_conf,valid",
+    [
+        ({"metrics": ["container_cpu_utilization"]}, True),
+        ({"metrics": ["number_of_container_restarts"]}, True),
+        ({"metrics": ["pod_cpu_utilization"]}, False),
+        (
+            {
+                "metrics": ["container_cpu_utilization"],
+                "topK": {"limit": 10, "metric": "node_cpu_utilization"},
+            },
+            False,
+        ),
+    ],
+)
+def test_container_metrics_validation(tmp_path, container_conf, valid):
+    dashboard_conf = _load_cdk_context(
+        {"dashboardConfiguration": {"contents": {"container": container_conf}}}
+    )["dashboardConfiguration"]
+    filename = str(tmp_path / "dashboard_configuration.yaml")
+    with open(filename, "w", encoding="utf8") as dashboard_conf_yaml:
+        yaml.safe_dump(dashboard_conf, dashboard_conf_yaml)
+
+    if valid:
+        assert load_dashboard_configuration(filename) == dashboard_conf
+    else:
+        with pytest.raises(Exception, match="does not match regex"):
+            load_dashboard_configuration(filename)
+
+
+def test_discovery_configuration(mocker):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"metrics": ["node_metric_1"]},
+                    "pod": {
+                        "metrics": ["pod_metric_1"],
+                        "namespaces": ["kube-system"],
+                        "topK": {"limit": 10, "metric": "pod_metric_1"},
+                    },
+                    "container": {
+                        "shards": 2,
+                        "metrics": ["container_metric_1"],
+                        "namespaces": ["kube-system", "team-*"],
+                    },
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    # The node and container contents share the lookup query of the node metric query,
+    # each of them answering its metric queries through its own custom resources, one
+    # per sharded container namespace selector
+    template.resource_count_is("Custom::ContainerInsights-DiscoveryMetricQuery", 3)
+    template.has_resource(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "Properties": {
+                "iLogGroupName": assertions.Match.any_value(),
+                "iNode": {"iNamespace": ""},
+                "iPod": assertions.Match.absent(),
+                "iContainer": assertions.Match.absent(),
+                "iSharedLookup": {
+                    "iContainer": {
+                        "iNamespaces": ["kube-system", "team-*"],
+                        "iShardCount": 2,
+                    },
+                },
+            },
+        },
+    )
+    template.has_resource_properties(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "iLogGroupName": assertions.Match.any_value(),
+            "iNode": assertions.Match.absent(),
+            "iContainer": {
+                "iNamespaces": ["team-*"],
+                "iShardCount": 2,
+            },
+            "iLookupQueryId": {"Fn::GetAtt": ["NodeMetricQuery", "oLookupQueryId"]},
+            "iLookupStartTime": {"Fn::GetAtt": ["NodeMetricQuery", "oLookupStartTime"]},
+        },
+    )
+    # Top K lookup queries are specific to their ranking metric
+    template.resource_count_is("Custom::ContainerInsights-NodeMetricQuery", 0)
+    template.resource_count_is("Custom::ContainerInsights-PodMetricQuery", 1)
+    template.resource_count_is("Custom::ContainerInsights-ContainerMetricQuery", 0)
+
+    widget_queries = _get_widget_queries(template)
+    assert widget_queries["Incident_DEMO_1234-NodeMetrics"] == [
+        ("node_metric_1", "NodeMetricQuery", "oNodeQuery")
+    ]
+    assert widget_queries["Incident_DEMO_1234-ContainerMetrics-team-"] == [
+        (
+            "container_metric_1",
+            "ContainerMetricQuery2",
+            "oContainerQueryNamespace1Shard1",
+        ),
+        (
+            "container_metric_1",
+            "ContainerMetricQuery2",
+            "oContainerQueryNamespace1Shard2",
+        ),
+    ]
+    assert widget_queries["Incident_DEMO_1234-PodMetrics-kube-system"] == [
+        ("pod_metric_1", "PodMetricQuery", "oQueryNamespace1")
+    ]
+
+
+def test_rollup_configuration(mocker):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"metrics": ["node_metric_1"]},
+                    "pod": {"enabled": False},
+                    "container": {"metrics": ["container_metric_1"]},
+                    "cluster": {
+                        "enabled": True,
+                        "metrics": ["cluster_node_count", "cluster_failed_node_count"],
+                    },
+                    "namespace": {
+                        "enabled": True,
+                        "period": "5m",
+                        "namespaces": ["kube-system", "team-*"],
+                        "metrics": ["namespace_number_of_running_pods"],
+                    },
+                    "service": {
+                        "enabled": True,
+                        "services": ["kube-dns"],
+                        "metrics": ["service_number_of_running_pods"],
+                    },
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    # Rollups are left out of the discovery lookup query
+    template.has_resource_properties(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "iNode": assertions.Match.any_value(),
+            "iSharedLookup": {"iContainer": assertions.Match.any_value()},
+            "iCluster": assertions.Match.absent(),
+            "iNamespace": assertions.Match.absent(),
+            "iService": assertions.Match.absent(),
+        },
+    )
+    template.has_resource_properties(
+        "Custom::ContainerInsights-ClusterMetricQuery",
+        {"iSeries": assertions.Match.absent(), "iNamespace": assertions.Match.absent()},
+    )
+    # A single dashboard plots every namespace selector
+    template.has_resource_properties(
+        "Custom::ContainerInsights-NamespaceMetricQuery",
+        {
+            "iSeries": ["kube-system", "team-*"],
+            "iPeriod": "5m",
+            "iNamespaces": assertions.Match.absent(),
+        },
+    )
+    template.has_resource_properties(
+        "Custom::ContainerInsights-ServiceMetricQuery", {"iSeries": ["kube-dns"]}
+    )
+    for content in ["Cluster", "Namespace", "Service"]:
+        template.has_resource_properties(
+            "AWS::CloudWatch::Dashboard",
+            {
+                "DashboardName": assertions.Match.string_like_regexp(
+                    f"-{content}Metrics$"
+                )
+            },
+        )
+    assert _get_widget_queries(template)["Incident_DEMO_1234-ClusterMetrics"] == [
+        ("cluster_node_count", "ClusterMetricQuery", "oQuery"),
+        ("cluster_failed_node_count", "ClusterMetricQuery", "oQuery"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "widgets_per_page,expected_pages", [(None, 1), (5, 1), (4, 2), (2, 5)]
+)
+def test_widgets_per_page_configuration(mocker, widgets_per_page, expected_pages):
+    dashboard_configuration = {
+        "contents": {
+            "node": {
+                "shards": 1,
+                "metrics": [f"node_metric_{index}" for index in range(5)],
+            },
+            "pod": {"enabled": False},
+            "container": {"enabled": False},
+        }
+    }
+    if widgets_per_page is not None:
+        dashboard_configuration["widgetsPerPage"] = widgets_per_page
+    stack = _init_stack(mocker, {"dashboardConfiguration": dashboard_configuration})
+
+    template = assertions.Template.from_stack(stack)
+    dashboards = template.find_resources("AWS::CloudWatch::Dashboard")
+    log_widget_counts = [
+        "".join(
+            part
+            for part in dashboard["Properties"]["DashboardBody"]["Fn::Join"][1]
+            if isinstance(part, str)
+        ).count('"type":"log"')
+        for dashboard in dashboards.values()
+    ]
+    assert sum(log_widget_counts) == 5
+    if expected_pages == 1:
+        assert len(dashboards) == 1
+        assert template.find_outputs("NodeMetricsPage2") == {}
+        return
+
+    # The pages, along with the index dashboard
+    assert len(dashboards) == expected_pages + 1
+    template.has_resource_properties(
+        "AWS::CloudWatch::Dashboard",
+        {"DashboardName": assertions.Match.string_like_regexp("-Index$")},
+    )
+    for page in range(2, expected_pages + 1):
+        template.has_resource_properties(
+            "AWS::CloudWatch::Dashboard",
+            {
+                "DashboardName": assertions.Match.string_like_regexp(
+                    f"-NodeMetrics-Page{page}$"
+                )
+            },
+        )
+        template.has_output(f"NodeMetricsPage{page}", {})
+    # Every page keeps room for the navigation between the pages
+    assert max(log_widget_counts) <= widgets_per_page - 1
+
+
+@pytest.mark.parametrize(
+    "nested_stacks,namespace_count,expected_nested",
+    [(None, 2, False), (None, 400, True), (False, 200, False), (True, 2, True)],
+)
+def test_nested_stacks_configuration(
+    mocker, nested_stacks, namespace_count, expected_nested
+):
+    stack = _init_stack(
+        mocker,
+        {
+            "nestedStacks": nested_stacks,
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"metrics": ["node_metric_1"]},
+                    "pod": {
+                        "metrics": ["pod_metric_1"],
+                        "topK": {"limit": 10, "metric": "pod_metric_1"},
+                    },
+                    "container": {
+                        "metrics": ["container_metric_1"],
+                        "namespaces": [
+                            f"namespace-{index}" for index in range(namespace_count)
+                        ],
+                    },
+                }
+            },
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    nested_templates = {
+        child.node.id: assertions.Template.from_stack(child)
+        for child in stack.node.children
+        if isinstance(child, cdk.NestedStack)
+    }
+    # Every template stays within the CloudFormation outputs and resources limits
+    for stack_template in [template, *nested_templates.values()]:
+        stack_json = stack_template.to_json()
+        assert len(stack_json.get("Outputs", {})) <= 200
+        assert len(stack_json["Resources"]) <= 500
+
+    # Node, pod and container dashboards, their URLs being listed by the index
+    # dashboard only past a given number of them
+    dashboard_count = 1 + 2 + namespace_count
+    if namespace_count == 2:
+        assert len(template.find_outputs("*")) == dashboard_count
+        template.resource_count_is(
+            "AWS::CloudWatch::Dashboard", 0 if expected_nested else dashboard_count
+        )
+    else:
+        assert list(template.find_outputs("*")) == ["Index"]
+        template.resource_count_is(
+            "AWS::CloudWatch::Dashboard", 1 if expected_nested else dashboard_count + 1
+        )
+    if not expected_nested:
+        template.resource_count_is("AWS::CloudFormation::Stack", 0)
+        return
+
+    # Metric query custom resources are deployed along with the dashboards they feed,
+    # the Lambda function being shared
+    template.resource_count_is("AWS::Lambda::Function", 2)  # Including TempStack's
+    discovery_stacks = [
+        nested_stack
+        for nested_stack in nested_templates
+        if nested_stack.startswith("DiscoveryDashboards")
+    ]
+    if namespace_count == 2:
+        assert discovery_stacks == ["DiscoveryDashboards"]
+    else:
+        assert discovery_stacks == [
+            f"DiscoveryDashboards{chunk}"
+            for chunk in range(1, len(discovery_stacks) + 1)
+        ]
+    assert list(nested_templates) == discovery_stacks + ["PodDashboards"]
+    template.resource_count_is("AWS::CloudFormation::Stack", len(nested_templates))
+
+    # Discovery dashboards are chunked by namespace selectors, each chunk looking up
+    # its own namespace selectors only, and answering the metric queries of every
+    # container namespace selector through its own custom resource
+    namespaces = []
+    for discovery_stack in discovery_stacks:
+        discovery_metric_queries = nested_templates[discovery_stack].find_resources(
+            "Custom::ContainerInsights-DiscoveryMetricQuery"
+        )
+        chunk_namespaces = [
+            namespace
+            for discovery_metric_query in discovery_metric_queries.values()
+            if "iContainer" in discovery_metric_query["Properties"]
+            for namespace in discovery_metric_query["Properties"]["iContainer"][
+                "iNamespaces"
+            ]
+        ]
+        assert len(discovery_metric_queries) == len(chunk_namespaces) + (
+            discovery_stack == discovery_stacks[0]
+        )
+        nested_templates[discovery_stack].resource_count_is(
+            "AWS::CloudWatch::Dashboard",
+            len(chunk_namespaces) + (discovery_stack == discovery_stacks[0]),
+        )
+        namespaces.extend(chunk_namespaces)
+    assert namespaces == [f"namespace-{index}" for index in range(namespace_count)]
+
+    nested_templates["PodDashboards"].resource_count_is(
+        "Custom::ContainerInsights-PodMetricQuery", 1
+    )
+    nested_templates["PodDashboards"].resource_count_is("AWS::CloudWatch::Dashboard", 2)
+    assert _get_widget_queries(nested_templates[discovery_stacks[0]])[
+        "Incident_DEMO_1234-NodeMetrics"
+    ] == [("node_metric_1", "NodeMetricQuery", "oNodeQuery")]
+
+
+@pytest.mark.parametrize(
+    "group_by_conf,expected_properties,discovered",
+    [
+        (
+            {},
+            {
+                "iGroupBy": assertions.Match.absent(),
+                "iWorkloadLabel": assertions.Match.absent(),
+            },
+            True,
+        ),
+        (
+            {"groupBy": "pod"},
+            {"iGroupBy": assertions.Match.absent()},
+            True,
+        ),
+        (
+            {"groupBy": "workload"},
+            {"iGroupBy": "workload", "iWorkloadLabel": assertions.Match.absent()},
+            True,
+        ),
+        (
+            {"groupBy": "workload", "workloadLabel": "app.kubernetes.io/name"},
+            {"iGroupBy": "workload", "iWorkloadLabel": "app.kubernetes.io/name"},
+            False,
+        ),
+    ],
+)
+def test_group_by_configuration(mocker, group_by_conf, expected_properties, discovered):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {"pod": {"metrics": ["pod_metric_1"], **group_by_conf}}
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    if discovered:
+        template.resource_count_is("Custom::ContainerInsights-PodMetricQuery", 0)
+        template.has_resource_properties(
+            "Custom::ContainerInsights-DiscoveryMetricQuery",
+            {"iPod": expected_properties},
+        )
+    else:
+        # The discovery lookup query only collects pod names
+        template.has_resource_properties(
+            "Custom::ContainerInsights-DiscoveryMetricQuery",
+            {"iPod": assertions.Match.absent()},
+        )
+        template.has_resource_properties(
+            "Custom::ContainerInsights-PodMetricQuery", expected_properties
+        )
+
+
+@pytest.mark.parametrize(
+    "target_log_streams_conf,expected_target_log_streams",
+    [
+        ({}, assertions.Match.absent()),
+        ({"targetLogStreams": False}, assertions.Match.absent()),
+        ({"targetLogStreams": True}, "true"),
+    ],
+)
+def test_target_log_streams_configuration(
+    mocker, target_log_streams_conf, expected_target_log_streams
+):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "node": {"metrics": ["node_metric_1"], **target_log_streams_conf},
+                    "container": {"metrics": ["container_metric_1"]},
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "iNode": {"iTargetLogStreams": expected_target_log_streams},
+            "iSharedLookup": {
+                "iContainer": {"iTargetLogStreams": assertions.Match.absent()}
+            },
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "period_conf,expected_period",
+    [({}, assertions.Match.absent()), ({"period": "5m"}, "5m")],
+)
+def test_period_configuration(mocker, period_conf, expected_period):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "contents": {
+                    "pod": {"metrics": ["pod_metric_1"], **period_conf},
+                    "container": {"metrics": ["container_metric_1"]},
+                }
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "iPod": {"iPeriod": expected_period},
+        },
+    )
+    template.has_resource_properties(
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        {
+            "iContainer": {"iPeriod": assertions.Match.absent()},
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "lookup_polling_budget,expected_lookup_polling_budget",
+    [(None, "30"), (0, "0"), (45, "45")],
+)
+def test_lookup_polling_budget_configuration(
+    mocker, lookup_polling_budget, expected_lookup_polling_budget
+):
+    stack = _init_stack(
+        mocker,
+        (
+            {}
+            if lookup_polling_budget is None
+            else {"lookupPollingBudgetSeconds": lookup_polling_budget}
+        ),
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": {
+                    "LOOKUP_POLLING_BUDGET_SECONDS": expected_lookup_polling_budget
+                }
+            }
+        },
+    )
+
+
+@pytest.mark.parametrize(
+    "max_concurrent_lookup_queries,expected_max_concurrent_queries",
+    [(None, "20"), (5, "5")],
+)
+def test_max_concurrent_lookup_queries_configuration(
+    mocker, max_concurrent_lookup_queries, expected_max_concurrent_queries
+):
+    stack = _init_stack(
+        mocker,
+        (
+            {}
+            if max_concurrent_lookup_queries is None
+            else {"maxConcurrentLookupQueries": max_concurrent_lookup_queries}
+        ),
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": {
+                    "LOGS_INSIGHTS_MAX_CONCURRENT_QUERIES": expected_max_concurrent_queries
+                }
+            }
+        },
+    )
+
+
+@pytest.mark.parametrize("lookup_cache_bucket", [None, "lookup-cache-bucket"])
+def test_lookup_cache_configuration(mocker, lookup_cache_bucket):
+    stack = _init_stack(mocker, {"lookupCacheBucket": lookup_cache_bucket})
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": {
+                    "LOOKUP_CACHE_URI": (
+                        f"s3://{lookup_cache_bucket}/container-insights-lookup-cache/"
+                        if lookup_cache_bucket
+                        else ""
+                    )
+                }
+            }
+        },
+    )
+    cache_statement = {
+        "Action": ["s3:GetObject", "s3:PutObject"],
+        "Effect": "Allow",
+        "Resource": {
+            "Fn::Join": [
+                "",
+                [
+                    "arn:",
+                    {"Ref": "AWS::Partition"},
+                    f":s3:::{lookup_cache_bucket}/container-insights-lookup-cache/*",
+                ],
+            ]
+        },
+    }
+    template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": (
+                    assertions.Match.array_with([cache_statement])
+                    if lookup_cache_bucket
+                    else assertions.Match.not_(
+                        assertions.Match.array_with([cache_statement])
+                    )
+                )
+            }
+        },
+    )
+
+
+@pytest.mark.parametrize("query_references", [False, True])
+def test_query_references_configuration(mocker, query_references):
+    dashboard_configuration = {"widgetsPerPage": 20}
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": dashboard_configuration,
+            "queryReferences": query_references,
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": {
+                    "QUERY_STORE_URI": (
+                        "ssm:///container-insights-dashboards/ContainerInsightsLogBasedDashboardStack/"
+                        if query_references
+                        else ""
+                    )
+                }
+            }
+        },
+    )
+    dashboard_statement = {
+        "Action": ["cloudwatch:PutDashboard", "cloudwatch:DeleteDashboards"],
+        "Effect": "Allow",
+        "Resource": assertions.Match.any_value(),
+    }
+    template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": (
+                    assertions.Match.array_with([dashboard_statement])
+                    if query_references
+                    else assertions.Match.not_(
+                        assertions.Match.array_with([dashboard_statement])
+                    )
+                )
+            }
+        },
+    )
+
+    # Dashboards plotting metric queries are custom resources resolving their query
+    # handles, the index dashboard remains a plain dashboard
+    plain_dashboards = template.find_resources("AWS::CloudWatch::Dashboard")
+    custom_dashboards = template.find_resources("Custom::ContainerInsights-Dashboard")
+    reference_template = assertions.Template.from_stack(
+        _init_stack(mocker, {"dashboardConfiguration": dashboard_configuration})
+    )
+    expected_widget_queries = _get_widget_queries(reference_template)
+    if not query_references:
+        assert custom_dashboards == {}
+        assert len(plain_dashboards) == len(expected_widget_queries)
+        return
+
+    assert [
+        dashboard["Properties"]["DashboardName"]
+        for dashboard in plain_dashboards.values()
+    ] == ["Incident_DEMO_1234-Index"]
+    assert len(custom_dashboards) == len(expected_widget_queries) - 1
+    # A single key prefix being answered, the namespace selectors of a content are not
+    # spread across several metric query custom resources
+    template.resource_count_is("Custom::ContainerInsights-DiscoveryMetricQuery", 3)
+    # Widgets refer to the stored metric queries through the single key prefix
+    # attribute of their metric query custom resource, instead of their query attribute
+    widget_queries = {}
+    for dashboard in custom_dashboards.values():
+        body = dashboard["Properties"]["iDashboardBody"]
+        assert "Fn::Split" not in json.dumps(body)
+        widget_queries[dashboard["Properties"]["iDashboardName"]] = [
+            (
+                parts[index + 1].split("}}")[0].split(":")[1],
+                part["Fn::GetAtt"][0],
+                parts[index + 1].split(":")[0],
+            )
+            for parts in [body["Fn::Join"][1]]
+            for index, part in enumerate(parts)
+            if isinstance(part, dict)
+            and part.get("Fn::GetAtt", [None, None])[1] == "oQueryKeyPrefix"
+            and parts[index - 1].endswith("{{query:")
+        ]
+    assert {
+        dashboard_name: [metric for metric, _, _ in queries]
+        for dashboard_name, queries in widget_queries.items()
+    } == {
+        dashboard_name: [metric for metric, _, _ in queries]
+        for dashboard_name, queries in expected_widget_queries.items()
+        if dashboard_name in widget_queries
+    }
+    assert {
+        (metric_query, query_attribute)
+        for metric_query, query_attribute in [
+            query[1:]
+            for query in widget_queries[
+                "Incident_DEMO_1234-ContainerMetrics-amazon-metrics"
+            ]
+        ]
+    } == {("ContainerMetricQuery", "oContainerQueryNamespace2")}
+    template.has_output(
+        "NodeMetrics",
+        {
+            "Value": {
+                "Fn::Join": [
+                    "",
+                    assertions.Match.array_with(
+                        [
+                            assertions.Match.string_like_regexp(
+                                "dashboards:name=Incident_DEMO_1234-NodeMetrics$"
+                            )
+                        ]
+                    ),
+                ]
+            }
+        },
+    )
+
+
+@pytest.mark.parametrize("time_slices", [1, 4])
+def test_time_slices_configuration(mocker, time_slices):
+    stack = _init_stack(
+        mocker,
+        {
+            "dashboardConfiguration": {
+                "investigationWindow": {"slices": time_slices},
+                "contents": {
+                    "container": {
+                        "topK": {"limit": 10, "metric": "container_cpu_utilization"}
+                    }
+                },
+            }
+        },
+    )
+
+    template = assertions.Template.from_stack(stack)
+    for resource_type in [
+        "Custom::ContainerInsights-DiscoveryMetricQuery",
+        "Custom::ContainerInsights-ContainerMetricQuery",
+    ]:
+        template.all_resources_properties(
+            resource_type,
+            (
+                {"iTimeSlices": time_slices}
+                if time_slices > 1
+                else {"iTimeSlices": assertions.Match.absent()}
+            ),
+        )
+
+
 # ======================================
 # Test tools
 # ======================================
@@ -184,6 +1217,7 @@ def _init_stack(mocker, cdk_context_override: Dict[Any, str] = {}) -> cdk.Stack:
             runtime=kwargs["runtime"],
             code=cdk.aws_lambda.Code.from_asset(kwargs["entry"]),
             handler=kwargs["handler"],
+            environment=kwargs["environment"],
             initial_policy=kwargs["initial_policy"],
         )
 
@@ -229,6 +1263,29 @@ def _deep_merge(a: Dict, b: Dict, path: str = None):
     return a
 
 
+def _get_widget_queries(
+    template: assertions.Template,
+) -> Dict[str, List[Tuple[str, str, str]]]:
+    """
+    The metric, lookup resource and generic query attribute of every widget query,
+    keyed by dashboard name
+    """
+
+    widget_queries = dict()
+    for dashboard in template.find_resources("AWS::CloudWatch::Dashboard").values():
+        # Dashboards without widget have a plain string body
+        body = dashboard["Properties"]["DashboardBody"]
+        widget_queries[dashboard["Properties"]["DashboardName"]] = [
+            (
+                part["Fn::Join"][0],
+                *part["Fn::Join"][1]["Fn::Split"][1]["Fn::GetAtt"],
+            )
+            for part in (body["Fn::Join"][1] if isinstance(body, dict) else [])
+            if isinstance(part, dict) and "Fn::Join" in part
+        ]
+    return widget_queries
+
+
 def _load_json_snapshot(snapshot_name: str) -> Dict[str, Any]:
     with open(
         os.path.join(
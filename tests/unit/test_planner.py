@@ -0,0 +1,267 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os
+
+import pytest
+import yaml
+from botocore.stub import ANY, Stubber
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import planner  # noqa: E402
+
+
+def test_main(tmp_path, capsys):
+    configuration_filename = _write_configuration(
+        tmp_path,
+        {
+            "node": {"enabled": True, "metrics": ["node_cpu_utilization"]},
+            "pod": {"enabled": False},
+            "container": {"enabled": False},
+        },
+    )
+
+    with Stubber(planner.get_logs_client()) as stubber:
+        _add_lookup_query_responses(
+            stubber,
+            [
+                [{"field": "NodeName", "value": "node-1"}],
+                [{"field": "NodeName", "value": "node-2"}],
+            ],
+            bytes_scanned=2 * planner.GB,
+        )
+
+        assert (
+            planner.main(
+                [
+                    "--configuration",
+                    configuration_filename,
+                    "--max-gb-per-refresh",
+                    "1",
+                ]
+            )
+            == 0
+        )
+
+        stubber.assert_no_pending_responses()
+
+    out, err = capsys.readouterr()
+    assert "ContainerInsights_OnDemand-NodeMetrics" in out
+    assert "WARNING: ContainerInsights_OnDemand-NodeMetrics: 2.00 GB scanned" in err
+
+
+def test_main_strict(tmp_path, mocker):
+    configuration_filename = _write_configuration(
+        tmp_path,
+        {
+            "node": {"enabled": True, "metrics": ["node_cpu_utilization"]},
+            "pod": {"enabled": False},
+            "container": {"enabled": False},
+        },
+    )
+    mocker.patch(
+        "planner.plan_content",
+        return_value=[planner.DashboardPlan("dashboard", 1, 20000, 0, 0)],
+    )
+
+    assert planner.main(["--configuration", configuration_filename]) == 0
+    assert planner.main(["--configuration", configuration_filename, "--strict"]) == 1
+
+
+@pytest.mark.parametrize("node_enabled", [True, False])
+def test_main_rollups(tmp_path, capsys, node_enabled):
+    configuration_filename = _write_configuration(
+        tmp_path,
+        {
+            "cluster": {"enabled": True, "metrics": ["cluster_node_count"]},
+            "node": {"enabled": node_enabled, "metrics": ["node_cpu_utilization"]},
+            "pod": {"enabled": False},
+            "container": {"enabled": False},
+        },
+    )
+
+    with Stubber(planner.get_logs_client()) as stubber:
+        # A single query, the node lookup query or the scan probe of the rollup
+        _add_lookup_query_responses(
+            stubber,
+            [[{"field": "NodeName", "value": "node-1"}]],
+            bytes_scanned=2 * planner.GB,
+            query_string=(
+                'fields NodeName | filter Type = "Node" | stats count() by NodeName'
+                if node_enabled
+                else planner.SCAN_PROBE_QUERY
+            ),
+        )
+
+        assert planner.main(["--configuration", configuration_filename]) == 0
+
+        stubber.assert_no_pending_responses()
+
+    out, _ = capsys.readouterr()
+    # The rollup widgets scan as much data as the lookup query, counted once
+    cluster_plan = next(
+        line for line in out.splitlines() if "ClusterMetrics" in line
+    ).split()
+    assert cluster_plan[1] == "1"
+    assert cluster_plan[3] == "2.000"
+    assert "100 records scanned" in out
+
+
+def test_plan_content_namespaces_and_shards(mocker):
+    mocker.patch(
+        "planner.run_lookup_query",
+        return_value={
+            "results": [
+                [
+                    {"field": "Namespace", "value": namespace},
+                    {"field": "PodName", "value": pod_name},
+                ]
+                for namespace, pod_name in [
+                    ("kube-system", "coredns"),
+                    ("kube-system", "kube-proxy"),
+                    ("team-a", "app"),
+                ]
+            ],
+            "statistics": {"bytesScanned": 1024.0, "recordsScanned": 10.0},
+            "status": "Complete",
+        },
+    )
+
+    plans = planner.plan_content(
+        None,
+        "dashboard",
+        "Pod",
+        {"metrics": ["pod_cpu_utilization", "pod_memory_utilization"]},
+        {
+            "iLogGroupName": "/aws/containerinsights/cluster/performance",
+            "iStartTime": "2023-04-12T20:10:00",
+            "iEndTime": "2023-04-12T20:20:00",
+            "iNamespaces": ["kube-system", "team-*"],
+            "iShardCount": 2,
+        },
+        60,
+    )
+
+    assert [plan.name for plan in plans] == [
+        "dashboard-PodMetrics-kube-system",
+        "dashboard-PodMetrics-team-*",
+    ]
+    assert [plan.widget_count for plan in plans] == [4, 4]
+    assert all(plan.bytes_per_refresh == 4 * 1024 for plan in plans)
+    assert all(plan.max_query_length > 0 for plan in plans)
+
+
+def test_plan_content_pages(mocker):
+    mocker.patch(
+        "planner.run_lookup_query",
+        return_value={
+            "results": [[{"field": "NodeName", "value": "node-1"}]],
+            "statistics": {"bytesScanned": 1024.0, "recordsScanned": 10.0},
+            "status": "Complete",
+        },
+    )
+
+    plans = planner.plan_content(
+        None,
+        "dashboard",
+        "Node",
+        {"metrics": [f"node_metric_{index}" for index in range(5)]},
+        {
+            "iLogGroupName": "/aws/containerinsights/cluster/performance",
+            "iStartTime": "2023-04-12T20:10:00",
+            "iEndTime": "2023-04-12T20:20:00",
+            "iNamespace": "",
+        },
+        60,
+        widgets_per_page=3,
+    )
+
+    assert [(plan.name, plan.widget_count) for plan in plans] == [
+        ("dashboard-NodeMetrics", 2),
+        ("dashboard-NodeMetrics-Page2", 2),
+        ("dashboard-NodeMetrics-Page3", 1),
+    ]
+    assert all(plan.bytes_per_widget == 1024 for plan in plans)
+
+
+@pytest.mark.parametrize(
+    "plan,violation_count",
+    [
+        (planner.DashboardPlan("dashboard", 10, 100, planner.GB / 10, 0), 0),
+        (planner.DashboardPlan("dashboard", 10, 20000, planner.GB / 10, 0), 1),
+        (planner.DashboardPlan("dashboard", 10, 100, 2 * planner.GB, 0), 2),
+    ],
+)
+def test_check_budgets(plan, violation_count):
+    assert (
+        len(
+            planner.check_budgets(
+                [plan],
+                max_query_length=10000,
+                max_gb_per_widget=1,
+                max_gb_per_refresh=5,
+            )
+        )
+        == violation_count
+    )
+
+
+def _write_configuration(tmp_path, contents) -> str:
+    filename = tmp_path / "dashboard_configuration.yaml"
+    filename.write_text(
+        yaml.safe_dump(
+            {
+                "name": "ContainerInsights_OnDemand",
+                "clusterName": "cluster",
+                "timeToLiveInMinutes": 20,
+                "investigationWindow": {
+                    "from": "2023-04-12T20:10:00",
+                    "to": "2023-04-12T20:20:00",
+                },
+                "contents": contents,
+            }
+        )
+    )
+    return str(filename)
+
+
+def _add_lookup_query_responses(stubber, results, bytes_scanned, query_string=ANY):
+    for status in ["Scheduled", "Running"]:
+        stubber.add_response("describe_queries", {"queries": []}, {"status": status})
+    stubber.add_response(
+        "start_query",
+        {"queryId": "lookup"},
+        {
+            "logGroupName": ANY,
+            "startTime": ANY,
+            "endTime": ANY,
+            "queryString": query_string,
+        },
+    )
+    stubber.add_response(
+        "get_query_results",
+        {
+            "results": results,
+            "statistics": {
+                "bytesScanned": bytes_scanned,
+                "recordsScanned": 100.0,
+            },
+            "status": "Complete",
+        },
+        {"queryId": "lookup"},
+    )
@@ -0,0 +1,242 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this
+# software and associated documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "assets",
+        "serverless",
+        "code",
+        "logs_insights_handler",
+    ),
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from container_insights.metric_query_formatter import (  # noqa: E402
+    format_tokenized_query,
+    tokenize_query,
+)
+from container_insights.metric_query_generator.pod import (  # noqa: E402
+    PodMetricQueryGenerator,
+)
+
+import query_evaluator  # noqa: E402
+
+# 2023-04-12T20:00:00Z
+START_TIME = 1681329600
+
+EVENT = {
+    "ResourceProperties": {
+        "iNamespace": "kube-system",
+        "iStartTime": "2023-04-12T20:00:00",
+        "iEndTime": "2023-04-12T21:00:00",
+        "iTargetLogStreams": "true",
+    }
+}
+
+
+def log_event(minute: int, node_name: str, pod_name: str, cpu: float):
+    return {
+        "Type": "Pod",
+        "Timestamp": str((START_TIME + minute * 60) * 1000),
+        "NodeName": node_name,
+        "Namespace": "kube-system",
+        "PodName": pod_name,
+        "kubernetes": {"namespace_name": "kube-system", "pod_name": pod_name},
+        "pod_cpu_utilization": cpu,
+    }
+
+
+LOG_EVENTS = [
+    log_event(0, "node-1", "coredns", 10),
+    log_event(0, "node-1", "coredns", 30),
+    log_event(0, "node-2", "kube-proxy", 5),
+    log_event(1, "node-1", "coredns", 40),
+    log_event(1, "node-2", "kube-proxy", 7),
+    # Not a pod log event
+    {**log_event(1, "node-2", "", 0), "Type": "Node", "node_cpu_utilization": 50},
+    log_event(2, "node-3", "metrics-server", 90),
+]
+
+
+@pytest.fixture
+def log_events_path(tmp_path):
+    path = tmp_path / "performance.jsonl"
+    path.write_text("\n".join(json.dumps(log_event) for log_event in LOG_EVENTS))
+    return str(path)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_evaluate_lookup_query(log_events_path, chunk_size):
+    generator = PodMetricQueryGenerator()
+
+    response = query_evaluator.evaluate_query(
+        generator.generate_lookup_query(EVENT), [log_events_path], chunk_size=chunk_size
+    )
+
+    assert response["results"] == [
+        [
+            {"field": "PodName", "value": "coredns"},
+            {"field": "NodeName", "value": "node-1"},
+            {"field": "count()", "value": "3"},
+        ],
+        [
+            {"field": "PodName", "value": "kube-proxy"},
+            {"field": "NodeName", "value": "node-2"},
+            {"field": "count()", "value": "2"},
+        ],
+        [
+            {"field": "PodName", "value": "metrics-server"},
+            {"field": "NodeName", "value": "node-3"},
+            {"field": "count()", "value": "1"},
+        ],
+    ]
+    assert response["statistics"]["recordsScanned"] == len(LOG_EVENTS)
+    assert response["statistics"]["recordsMatched"] == 6
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_evaluate_metric_query(log_events_path, chunk_size):
+    generator = PodMetricQueryGenerator()
+    metric_query = format_tokenized_query(
+        tokenize_query(
+            generator.render_metric_query(
+                EVENT,
+                [("kube-system", "coredns"), ("kube-system", "kube-proxy")],
+                ["node-1", "node-2"],
+            )
+        ),
+        "pod_cpu_utilization",
+    )
+
+    response = query_evaluator.evaluate_query(
+        metric_query, [log_events_path], chunk_size=chunk_size
+    )
+
+    assert response["results"] == [
+        [
+            {"field": "bin(1m)", "value": "2023-04-12 20:00:00.000"},
+            {"field": "coredns", "value": "20"},
+            {"field": "kube-proxy", "value": "5"},
+        ],
+        [
+            {"field": "bin(1m)", "value": "2023-04-12 20:01:00.000"},
+            {"field": "coredns", "value": "40"},
+            {"field": "kube-proxy", "value": "7"},
+        ],
+    ]
+    # The log events of node-3 are left out by the log stream filter
+    assert response["statistics"]["recordsMatched"] == 5
+
+
+def test_evaluate_top_k_query(log_events_path):
+    response = query_evaluator.evaluate_query(
+        'fields PodName | filter Type = "Pod" and PodName like /^(coredns|metrics)/ '
+        "| stats pct(pod_cpu_utilization, 50) as rank by PodName "
+        "| sort rank desc | limit 1",
+        [log_events_path],
+        start_time=START_TIME,
+        end_time=START_TIME + 60,
+    )
+
+    assert response["results"] == [
+        [
+            {"field": "PodName", "value": "coredns"},
+            {"field": "rank", "value": "30"},
+        ]
+    ]
+
+
+def test_evaluate_query_without_stats(log_events_path):
+    response = query_evaluator.evaluate_query(
+        'fields PodName, pod_cpu_utilization | filter not (Type = "Pod") or pod_cpu_utilization > 35',
+        [log_events_path],
+    )
+
+    assert [
+        {field["field"]: field["value"] for field in result}
+        for result in response["results"]
+    ] == [
+        {
+            "@timestamp": "2023-04-12 20:02:00.000",
+            "PodName": "metrics-server",
+            "pod_cpu_utilization": "90",
+        },
+        {
+            "@timestamp": "2023-04-12 20:01:00.000",
+            "PodName": "coredns",
+            "pod_cpu_utilization": "40",
+        },
+        {
+            "@timestamp": "2023-04-12 20:01:00.000",
+            "PodName": "",
+            "pod_cpu_utilization": "0",
+        },
+    ]
+
+
+def test_evaluate_count_all_query(log_events_path):
+    response = query_evaluator.evaluate_query(
+        'filter Type = "Node" | stats count(*) as records', [log_events_path]
+    )
+
+    assert response["results"] == [[{"field": "records", "value": "1"}]]
+
+
+def test_stats_accumulator_percentile_sample():
+    (command,) = query_evaluator.parse_query(
+        "stats pct(value, 50) as median, count(*) as records by group"
+    )
+    accumulator = query_evaluator.StatsAccumulator(command, percentile_sample_size=100)
+    for chunk in range(10):
+        accumulator.add(
+            pd.DataFrame(
+                {
+                    "group": ["a"] * 1000 + ["b"] * 10,
+                    "value": list(range(chunk * 1000, (chunk + 1) * 1000))
+                    + [chunk] * 10,
+                }
+            )
+        )
+
+    # The values kept for the percentiles are bounded per group, the other aggregations
+    # still covering every value
+    (values,) = accumulator.percentile_values.values()
+    assert values.groupby("group").size().to_dict() == {"a": 100, "b": 100}
+    result = accumulator.result().set_index("group")
+    assert result["records"].to_dict() == {"a": 10000, "b": 100}
+    assert result.loc["b", "median"] == 4.5
+    assert 4000 < result.loc["a", "median"] < 6000
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["fields a | dedup a", "fields a | filter a = ", "stats count() by bin(1y)"],
+)
+def test_evaluate_unsupported_query(log_events_path, query):
+    with pytest.raises(Exception):
+        query_evaluator.evaluate_query(query, [log_events_path])